@@ -0,0 +1,275 @@
+"""Managed provider-side context caching for the static prompt prefixes.
+
+Every pipeline prompt carries ``CACHE_BOUNDARY_MARKER``: a large, byte-stable
+static part (rules, schema, vocabularies) followed by the question. Anthropic
+gets an explicit breakpoint at that boundary (``_build_anthropic_user_content``);
+this module does the equivalent for the other providers:
+
+- **Gemini: explicit cached content.** The system instruction and the static
+  prefix are stored once with ``client.caches.create`` and each call then sends
+  only the dynamic suffix with ``cached_content=<name>``. A handle is identified
+  by a deterministic display name (``t2s[-<namespace>]:<step>:<digest of model,
+  system prompt and prefix>``), so pre-forked workers and replicas find and share
+  the handle another worker created instead of creating their own.
+  ``CONTEXT_CACHE_NAMESPACE`` keeps deployments sharing one provider project
+  (staging, production) apart. Handles live
+  ``GEMINI_CONTEXT_CACHE_TTL`` seconds and are extended when fewer than
+  ``GEMINI_CONTEXT_CACHE_REFRESH_MARGIN`` remain. A prefix that cannot be cached
+  (below the model's minimum size, unsupported model) is retried only after
+  ``GEMINI_CONTEXT_CACHE_RETRY_AFTER`` seconds and sent whole meanwhile.
+- **OpenAI: prompt cache keys.** Each call carries a ``prompt_cache_key``
+  derived from the step and the digest of its static prefix, which routes
+  requests sharing the prefix to the same cache, whichever worker sends them.
+- **Invalidation.** When ``data_watcher`` reloads a prompt with new content, its
+  owner calls :func:`invalidate`: the step's handles this process was using
+  are forgotten and deleted from the provider in the background. Handles of
+  other prefixes, including those other workers or deployments still use, are
+  left alone. The new prefix gets a new handle on its next call.
+- **Hit rates.** The provider usage loggers in ``text2sql`` report every call's
+  prompt and cached token counts to :func:`observe`; ``stats()`` exports the
+  per-step call hit rate and token hit ratio, and the live Gemini handles.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1").strip().lower() in {"1", "true", "yes", "on"}
+GEMINI_CONTEXT_CACHE_TTL = max(60, int(float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))))
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = float(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+GEMINI_CONTEXT_CACHE_RETRY_AFTER = float(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_AFTER", "600"))
+# Explicit caching has a per-model minimum (1,024 tokens on 2.5 Flash, more on Pro);
+# smaller prefixes are not worth a create call. Estimated as characters / 4.
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+OPENAI_PROMPT_CACHE_KEY = os.getenv("OPENAI_PROMPT_CACHE_KEY", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+# Deployment namespace in handle names and prompt cache keys; letters, digits, "_", "." and "-".
+CONTEXT_CACHE_NAMESPACE = re.sub(r"[^A-Za-z0-9_.-]", "", os.getenv("CONTEXT_CACHE_NAMESPACE", "").strip())
+
+_DISPLAY_PREFIX = f"t2s-{CONTEXT_CACHE_NAMESPACE}" if CONTEXT_CACHE_NAMESPACE else "t2s"
+
+_lock = threading.Lock()
+# digest -> {"name", "label", "model", "expires_at"}
+_handles: dict[str, dict] = {}
+# digest -> monotonic time before which creation is not retried
+_unavailable: dict[str, float] = {}
+_key_locks: dict[str, threading.Lock] = {}
+# Clients that created or found handles, for the background deletion on invalidate().
+_clients: dict[int, object] = {}
+_usage: dict[str, dict] = {}
+_counters = {"handles_created": 0, "handles_shared": 0, "handles_refreshed": 0, "create_failures": 0, "stale_handles": 0}
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _display_name(label: str, digest: str) -> str:
+    return f"{_DISPLAY_PREFIX}:{label}:{digest[:24]}"
+
+
+def _expires_at(cached_content) -> float:
+    """Wall-clock expiry of a CachedContent, or a TTL from now when the SDK omits it."""
+    expire_time = getattr(cached_content, "expire_time", None)
+    if isinstance(expire_time, datetime):
+        if expire_time.tzinfo is None:
+            expire_time = expire_time.replace(tzinfo=timezone.utc)
+        return expire_time.timestamp()
+    return time.time() + GEMINI_CONTEXT_CACHE_TTL
+
+
+def _model_matches(cached_model: Optional[str], model: str) -> bool:
+    return bool(cached_model) and cached_model.rsplit("/", 1)[-1] == model
+
+
+def openai_prompt_cache_key(label: str, system_prompt: str, static_prefix: str) -> Optional[str]:
+    """``prompt_cache_key`` for an OpenAI call, identical in every worker for the same prefix."""
+    if not OPENAI_PROMPT_CACHE_KEY:
+        return None
+    return f"{_DISPLAY_PREFIX}-{label}-{_digest(system_prompt, static_prefix)[:16]}"
+
+
+def gemini_cached_content(client, *, model: str, system_prompt: str, static_prefix: str, label: str) -> Optional[str]:
+    """Name of a live cached-content handle for this prefix, creating or extending it as needed.
+
+    Returns None when explicit caching is off, the prefix is too small, or the
+    provider refused it; the caller then sends the full prompt. Blocking (one API
+    call on the first use of a prefix, on a refresh, or after a failure).
+    """
+    if not GEMINI_CONTEXT_CACHE or len(system_prompt + static_prefix) // 4 < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    digest = _digest(model, system_prompt, static_prefix)
+    with _lock:
+        handle = _handles.get(digest)
+        if handle is not None and handle["expires_at"] - time.time() > GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+            return handle["name"]
+        if _unavailable.get(digest, 0.0) > time.monotonic():
+            return None
+        key_lock = _key_locks.setdefault(digest, threading.Lock())
+    with key_lock:
+        with _lock:
+            handle = _handles.get(digest)
+        if handle is not None and handle["expires_at"] - time.time() > GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+            return handle["name"]
+        try:
+            if handle is not None and handle["expires_at"] > time.time():
+                handle = _refresh(client, handle)
+            else:
+                handle = _find_shared(client, model, label, digest) or _create(client, model, system_prompt, static_prefix, label, digest)
+        except Exception as exc:
+            with _lock:
+                _handles.pop(digest, None)
+                _unavailable[digest] = time.monotonic() + GEMINI_CONTEXT_CACHE_RETRY_AFTER
+                _counters["create_failures"] += 1
+            print(f"[context-cache] Gemini cached content unavailable for {label} on {model}: {exc}", flush=True)
+            return None
+        with _lock:
+            _handles[digest] = handle
+            _clients[id(client)] = client
+        return handle["name"]
+
+
+def _find_shared(client, model: str, label: str, digest: str) -> Optional[dict]:
+    """A live handle another worker already created for this prefix, if any."""
+    display_name = _display_name(label, digest)
+    for cached_content in client.caches.list():
+        if getattr(cached_content, "display_name", None) != display_name or not _model_matches(getattr(cached_content, "model", None), model):
+            continue
+        expires_at = _expires_at(cached_content)
+        if expires_at - time.time() <= GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+            continue
+        with _lock:
+            _counters["handles_shared"] += 1
+        print(f"[context-cache] Reusing Gemini cached content {cached_content.name} for {label} on {model}.", flush=True)
+        return {"name": cached_content.name, "label": label, "model": model, "expires_at": expires_at}
+    return None
+
+
+def _create(client, model: str, system_prompt: str, static_prefix: str, label: str, digest: str) -> dict:
+    from google.genai import types as genai_types
+
+    cached_content = client.caches.create(
+        model=model,
+        config=genai_types.CreateCachedContentConfig(
+            display_name=_display_name(label, digest),
+            system_instruction=system_prompt,
+            contents=[static_prefix],
+            ttl=f"{GEMINI_CONTEXT_CACHE_TTL}s",
+        ),
+    )
+    with _lock:
+        _counters["handles_created"] += 1
+    print(f"[context-cache] Created Gemini cached content {cached_content.name} for {label} on {model}.", flush=True)
+    return {"name": cached_content.name, "label": label, "model": model, "expires_at": _expires_at(cached_content)}
+
+
+def _refresh(client, handle: dict) -> dict:
+    from google.genai import types as genai_types
+
+    cached_content = client.caches.update(
+        name=handle["name"],
+        config=genai_types.UpdateCachedContentConfig(ttl=f"{GEMINI_CONTEXT_CACHE_TTL}s"),
+    )
+    with _lock:
+        _counters["handles_refreshed"] += 1
+    return {**handle, "expires_at": _expires_at(cached_content)}
+
+
+def is_stale_handle_error(exc: Exception) -> bool:
+    """True when a call failed because its cached-content handle is gone (expired or deleted)."""
+    message = str(exc).lower()
+    return "cachedcontent" in message or "cached content" in message or "cached_content" in message
+
+
+def discard(name: str) -> None:
+    """Forget a handle the provider no longer knows; the next call creates or finds a new one."""
+    with _lock:
+        for digest in [d for d, handle in _handles.items() if handle["name"] == name]:
+            del _handles[digest]
+        _counters["stale_handles"] += 1
+
+
+def invalidate(labels) -> None:
+    """Drop this process's handles of ``labels`` after a prompt reload, and delete them provider-side in the background.
+
+    Only the handles this process held are deleted: they cache the prefix that was
+    just replaced. Other workers' handles for the new prefix, and other
+    deployments' handles, are never touched.
+    """
+    labels = set(labels)
+    with _lock:
+        stale = [(digest, handle) for digest, handle in _handles.items() if handle["label"] in labels]
+        for digest, _ in stale:
+            del _handles[digest]
+        clients = list(_clients.values())
+    names = sorted({handle["name"] for _, handle in stale})
+    if not clients or not names:
+        return
+
+    def _delete_remote():
+        deleted = 0
+        for name in names:
+            last_exc = None
+            for client in clients:
+                try:
+                    client.caches.delete(name=name)
+                    deleted += 1
+                    break
+                except Exception as exc:
+                    last_exc = exc
+            else:
+                print(f"[context-cache] Deleting Gemini cached content {name} failed: {last_exc}", flush=True)
+        if deleted:
+            print(f"[context-cache] Deleted {deleted} Gemini cached content(s) for {', '.join(sorted(labels))}.", flush=True)
+
+    threading.Thread(target=_delete_remote, name="context-cache-invalidate", daemon=True).start()
+
+
+def observe(label: str, provider: str, prompt_tokens: int, cached_tokens: int) -> None:
+    """Count one call's prompt-cache outcome for the per-step hit rates."""
+    with _lock:
+        bucket = _usage.setdefault(label, {"calls": 0, "hits": 0, "prompt_tokens": 0, "cached_tokens": 0, "providers": {}})
+        bucket["calls"] += 1
+        bucket["hits"] += 1 if cached_tokens else 0
+        bucket["prompt_tokens"] += prompt_tokens or 0
+        bucket["cached_tokens"] += cached_tokens or 0
+        bucket["providers"][provider] = bucket["providers"].get(provider, 0) + 1
+
+
+def stats() -> dict:
+    """Settings, live Gemini handles and per-step prompt-cache hit rates since process start."""
+    now = time.time()
+    with _lock:
+        steps = {}
+        for label, bucket in _usage.items():
+            steps[label] = {
+                **{k: v for k, v in bucket.items() if k != "providers"},
+                "providers": dict(bucket["providers"]),
+                "hit_rate": round(bucket["hits"] / bucket["calls"], 4) if bucket["calls"] else 0.0,
+                "token_hit_ratio": round(bucket["cached_tokens"] / bucket["prompt_tokens"], 4) if bucket["prompt_tokens"] else 0.0,
+            }
+        handles = [
+            {"label": h["label"], "model": h["model"], "name": h["name"], "expires_in": round(h["expires_at"] - now, 1)}
+            for h in _handles.values()
+        ]
+        counters = dict(_counters)
+    return {
+        "gemini_explicit_cache": GEMINI_CONTEXT_CACHE,
+        "namespace": CONTEXT_CACHE_NAMESPACE,
+        "gemini_ttl": GEMINI_CONTEXT_CACHE_TTL,
+        "openai_prompt_cache_key": OPENAI_PROMPT_CACHE_KEY,
+        "gemini_handles": handles,
+        **counters,
+        "steps": steps,
+    }
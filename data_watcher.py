@@ -108,6 +108,18 @@ def _loop() -> None:
             print(f"[data-watcher] Scan error: {e}", flush=True)
 
 
+def restart_after_fork() -> None:
+    """Restart the watcher in a forked child (threads do not survive ``fork``).
+
+    The lock is recreated too: the parent's watcher may have held it at the moment
+    of the fork, and the child would then wait on it forever.
+    """
+    global _thread, _lock
+    _lock = threading.Lock()
+    _thread = None
+    _ensure_thread_started()
+
+
 def _ensure_thread_started() -> None:
     global _thread
     with _lock:
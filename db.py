@@ -0,0 +1,746 @@
+"""Pooled MariaDB connections.
+
+Every request used to open a brand-new PyMySQL connection (TCP handshake, auth,
+``USE <db>``) and close it again a few hundred milliseconds later, and the
+detail endpoints did the same once per call. Under load that is a connection
+storm against MariaDB and a measurable slice of every request's latency.
+
+This module keeps a bounded pool of warm connections instead:
+
+- ``DB_POOL_MIN`` connections are opened at startup (pre-warming), so the first
+  requests after a deploy do not pay the handshake either.
+- At most ``DB_POOL_SIZE`` connections exist at once. A caller that finds the
+  pool exhausted waits up to ``DB_POOL_TIMEOUT`` seconds, then gets an error
+  instead of piling more connections onto the server.
+- A connection idle for longer than ``DB_POOL_PING_INTERVAL`` seconds is pinged
+  on checkout; a dead one is discarded and replaced transparently.
+- Every connection is rolled back when it is returned, so no transaction (and,
+  under REPEATABLE READ, no stale read snapshot) leaks into the next checkout.
+- Connections older than ``DB_POOL_MAX_LIFETIME`` seconds are recycled on return,
+  which keeps the pool clear of MariaDB's ``wait_timeout`` and of server-side
+  memory that grows over a long session.
+
+``get_connection()`` returns a ``PooledConnection``: it behaves like the PyMySQL
+connection it wraps (``cursor()``, ``commit()``, ...), and its ``close()`` hands
+the connection back to the pool instead of closing the socket. Existing
+``conn = get_db_connection() ... finally: conn.close()`` call sites therefore keep
+working unchanged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import inspect
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import pymysql
+import pymysql.cursors
+
+
+DB_POOL_SIZE = max(1, int(os.getenv("DB_POOL_SIZE", "10")))
+DB_POOL_MIN = min(DB_POOL_SIZE, max(0, int(os.getenv("DB_POOL_MIN", "2"))))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))
+# Threads reserved for blocking DB work on the request path (see run_db below).
+# Defaults to the pool size: more threads than connections would only queue on the pool.
+DB_EXECUTOR_THREADS = max(1, int(os.getenv("DB_EXECUTOR_THREADS", str(DB_POOL_SIZE))))
+
+# Read replicas (see "Read-replica routing" below). Comma-separated host[:port] list;
+# credentials and database name default to the primary's.
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+DB_REPLICA_POOL_SIZE = max(1, int(os.getenv("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE))))
+# A busy replica is skipped for the next one (or the primary) after this many seconds.
+DB_REPLICA_POOL_TIMEOUT = float(os.getenv("DB_REPLICA_POOL_TIMEOUT", "0.5"))
+
+
+# Connections checked out on behalf of one request (see track_connections). The list is
+# shared by reference with every context copied from the request's, so checkouts made
+# in run_db / to_thread workers land in it too.
+_tracked_connections: "contextvars.ContextVar[Optional[list]]" = contextvars.ContextVar("db_tracked_connections", default=None)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection became available within the checkout timeout."""
+
+
+def _connection_kwargs_from_env() -> dict:
+    """Return the ``pymysql.connect`` keyword arguments described by the environment.
+
+    Reads DB_HOST, DB_PORT, DB_USER, DB_PASSWORD (or the legacy DB_PASS used by
+    the RapidFuzz CLI) and DB_NAME. Host, port and user default to the RapidFuzz
+    CLI's 127.0.0.1, 3306 and root.
+    """
+    return {
+        "host": os.getenv("DB_HOST") or "127.0.0.1",
+        "port": int(os.getenv("DB_PORT", 3306)),
+        "user": os.getenv("DB_USER") or "root",
+        "password": os.getenv("DB_PASSWORD") or os.getenv("DB_PASS", ""),
+        "database": os.getenv("DB_NAME"),
+        "cursorclass": pymysql.cursors.DictCursor,
+    }
+
+
+class _PoolEntry:
+    """A raw PyMySQL connection plus the bookkeeping the pool needs about it."""
+
+    __slots__ = ("raw", "created_at", "last_used_at")
+
+    def __init__(self, raw) -> None:
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used_at = now
+
+
+class PooledConnection:
+    """Checked-out connection. Delegates to PyMySQL; ``close()`` returns it to the pool.
+
+    ``close()`` is idempotent, so a connection closed twice (or closed by a
+    cleanup path after the happy path already did) is only released once.
+    """
+
+    def __init__(self, pool: "ConnectionPool", entry: _PoolEntry) -> None:
+        self._pool = pool
+        self._entry = entry
+
+    @property
+    def raw(self):
+        """The underlying PyMySQL connection (raises once the connection was released)."""
+        if self._entry is None:
+            raise pymysql.err.InterfaceError(0, "Pooled connection already returned to the pool")
+        return self._entry.raw
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return self.raw.cursor(*args, **kwargs)
+
+    def close(self) -> None:
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry)
+
+    def discard(self) -> None:
+        """Close the underlying socket for good instead of returning it to the pool."""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool._release(entry, broken=True)
+
+    def abort(self) -> None:
+        """Tear the connection down from another thread, interrupting a query in flight.
+
+        Shutting the socket down wakes a worker thread blocked reading the result
+        (closing the descriptor alone would not), then the slot is freed as broken.
+        """
+        entry = self._entry
+        if entry is None:
+            return
+        sock = getattr(entry.raw, "_sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.discard()
+
+    @property
+    def pool_name(self) -> str:
+        """Name of the pool this connection came from ("primary" or a replica label)."""
+        return self._pool.name
+
+    @property
+    def open(self) -> bool:
+        return self._entry is not None and bool(getattr(self._entry.raw, "open", False))
+
+    def __del__(self) -> None:
+        # Safety net for paths that unwind on an exception without closing: without
+        # it the slot would stay "in use" forever and the pool would slowly starve.
+        entry = self.__dict__.get("_entry")
+        if entry is not None:
+            self._entry = None
+            self._pool._release(entry, broken=True, leaked=True)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded, health-checked pool of PyMySQL connections.
+
+    Args:
+        name: Label used in log lines and in ``stats()``.
+        connect_kwargs: Keyword arguments passed to ``pymysql.connect``.
+        size: Maximum number of connections (idle + checked out).
+        min_size: Connections opened by ``warm()`` and kept idle.
+        timeout: Seconds a checkout waits for a free slot before failing.
+        max_lifetime: Seconds after which a connection is recycled on return.
+        ping_interval: Idle seconds after which a checkout pings the connection first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect_kwargs: dict,
+        *,
+        size: int = DB_POOL_SIZE,
+        min_size: int = DB_POOL_MIN,
+        timeout: float = DB_POOL_TIMEOUT,
+        max_lifetime: float = DB_POOL_MAX_LIFETIME,
+        ping_interval: float = DB_POOL_PING_INTERVAL,
+    ) -> None:
+        self.name = name
+        self._connect_kwargs = dict(connect_kwargs)
+        self.size = max(1, int(size))
+        self.min_size = min(self.size, max(0, int(min_size)))
+        self.timeout = float(timeout)
+        self.max_lifetime = float(max_lifetime)
+        self.ping_interval = float(ping_interval)
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle: deque[_PoolEntry] = deque()
+        self._total = 0          # idle + checked out + being opened
+        self._in_use = 0
+        self._waiters = 0
+
+        # Metrics (monotonic counters since process start).
+        self._checkouts = 0
+        self._waited_checkouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._broken = 0
+        self._leaked = 0
+
+    # -- connection lifecycle ------------------------------------------------
+
+    def _open(self) -> _PoolEntry:
+        raw = pymysql.connect(**self._connect_kwargs)
+        with self._cond:
+            self._created += 1
+        return _PoolEntry(raw)
+
+    @staticmethod
+    def _close_quietly(entry: _PoolEntry) -> None:
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+    def _expired(self, entry: _PoolEntry, now: float) -> bool:
+        return self.max_lifetime > 0 and now - entry.created_at >= self.max_lifetime
+
+    def _healthy(self, entry: _PoolEntry, now: float) -> bool:
+        """Ping a connection that sat idle long enough for the server to have dropped it."""
+        if now - entry.last_used_at < self.ping_interval:
+            return True
+        try:
+            entry.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def warm(self) -> int:
+        """Open connections until ``min_size`` are available. Returns how many were opened."""
+        opened = 0
+        while True:
+            with self._cond:
+                if self._total >= self.min_size:
+                    return opened
+                self._total += 1
+            try:
+                entry = self._open()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+            opened += 1
+
+    def get_connection(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Check out a connection, waiting up to ``timeout`` seconds for a free slot.
+
+        Raises:
+            PoolTimeoutError: when the pool stayed exhausted for the whole timeout.
+            pymysql.Error: when a new connection had to be opened and that failed.
+        """
+        wait_limit = self.timeout if timeout is None else float(timeout)
+        t0 = time.monotonic()
+        waited = False
+        while True:
+            entry = None
+            open_new = False
+            with self._cond:
+                while not self._idle and self._total >= self.size:
+                    remaining = wait_limit - (time.monotonic() - t0)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"DB pool '{self.name}' exhausted: {self._in_use}/{self.size} connections "
+                            f"in use, waited {wait_limit:.1f}s"
+                        )
+                    waited = True
+                    self._waiters += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+                if self._idle:
+                    # LIFO: the most recently used connection is the least likely to be stale.
+                    entry = self._idle.pop()
+                else:
+                    self._total += 1
+                    open_new = True
+                self._in_use += 1
+
+            if open_new:
+                try:
+                    entry = self._open()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                if self._expired(entry, now) or not self._healthy(entry, now):
+                    # Drop it and loop: the freed slot lets us open a fresh one.
+                    self._close_quietly(entry)
+                    with self._cond:
+                        self._total -= 1
+                        self._in_use -= 1
+                        self._broken += 1
+                        self._cond.notify()
+                    continue
+
+            wait_time = time.monotonic() - t0
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waited_checkouts += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+            conn = PooledConnection(self, entry)
+            tracked = _tracked_connections.get()
+            if tracked is not None:
+                tracked.append(conn)
+            return conn
+
+    def _release(self, entry: _PoolEntry, broken: bool = False, leaked: bool = False) -> None:
+        """Return a checked-out connection, resetting or recycling it as needed."""
+        now = time.monotonic()
+        keep = not broken
+        if keep:
+            try:
+                # Reset per checkout: end whatever transaction the caller left open.
+                entry.raw.rollback()
+            except Exception:
+                keep = False
+        recycled = keep and self._expired(entry, now)
+        if not keep or recycled:
+            self._close_quietly(entry)
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                if recycled:
+                    self._recycled += 1
+                elif leaked:
+                    self._leaked += 1
+                else:
+                    self._broken += 1
+                self._cond.notify()
+            return
+        entry.last_used_at = now
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def close_all(self) -> None:
+        """Close every idle connection. Checked-out connections close when released."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_quietly(entry)
+
+    def stats(self) -> dict:
+        """Snapshot of the pool state and its cumulative metrics."""
+        with self._cond:
+            return {
+                "name": self.name,
+                "size": self.size,
+                "open": self._total,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "checkouts": self._checkouts,
+                "waited_checkouts": self._waited_checkouts,
+                "wait_time_total": round(self._wait_time_total, 4),
+                "wait_time_avg": round(self._wait_time_total / self._checkouts, 6) if self._checkouts else 0.0,
+                "wait_time_max": round(self._wait_time_max, 4),
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "recycled": self._recycled,
+                "broken": self._broken,
+                "leaked": self._leaked,
+            }
+
+
+_primary_pool: Optional[ConnectionPool] = None
+_primary_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool for the primary database, creating it on first use."""
+    global _primary_pool
+    pool = _primary_pool
+    if pool is not None:
+        return pool
+    with _primary_pool_lock:
+        if _primary_pool is None:
+            _primary_pool = ConnectionPool("primary", _connection_kwargs_from_env())
+        return _primary_pool
+
+
+def get_connection(timeout: Optional[float] = None) -> PooledConnection:
+    """Check out a connection to the primary database from the process-wide pool."""
+    return get_pool().get_connection(timeout=timeout)
+
+
+# ---------------------------------------------------------------------------
+# Read-replica routing
+# ---------------------------------------------------------------------------
+# The LLM-generated SELECTs and the detail endpoints are pure reads, and the heavy
+# ones (multi-join aggregates, full detail pages) are exactly what competes with the
+# SQL-cache writes on the primary. ``get_read_connection()`` routes them to a replica
+# when one is configured and healthy, and to the primary otherwise. Everything that
+# writes, and every read that must see a write this process just made (the SQL-cache
+# lookups right after a store, entity resolution), keeps using ``get_connection()``.
+#
+# Health is the replication lag: a monitor thread reads Seconds_Behind_Master on each
+# replica every DB_REPLICA_CHECK_INTERVAL seconds. A replica is eligible only while its
+# lag is known and at most DB_REPLICA_MAX_LAG; a stopped or broken replication thread
+# (NULL lag), a server that is not replicating at all, or a failed check takes it out of
+# rotation until a later check brings it back.
+
+
+class _Replica:
+    """One replica: its pool plus the last health-check verdict."""
+
+    def __init__(self, label: str, pool: ConnectionPool) -> None:
+        self.label = label
+        self.pool = pool
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.routed = 0
+        self.busy = 0
+
+
+_replicas: Optional[list[_Replica]] = None
+_replicas_lock = threading.Lock()
+_replica_rr = 0
+_replica_fallbacks = 0
+_monitor_thread: Optional[threading.Thread] = None
+
+
+def _parse_host_port(value: str) -> tuple[str, int]:
+    host, _, port = value.partition(":")
+    return host, int(port) if port else int(os.getenv("DB_PORT", 3306))
+
+
+def _get_replicas() -> list[_Replica]:
+    """Build the replica pools from DB_REPLICA_HOSTS on first use."""
+    global _replicas
+    replicas = _replicas
+    if replicas is not None:
+        return replicas
+    with _replicas_lock:
+        if _replicas is None:
+            built = []
+            base = _connection_kwargs_from_env()
+            base["user"] = os.getenv("DB_REPLICA_USER") or base["user"]
+            base["password"] = os.getenv("DB_REPLICA_PASSWORD") or base["password"]
+            for entry in DB_REPLICA_HOSTS:
+                host, port = _parse_host_port(entry)
+                kwargs = dict(base, host=host, port=port)
+                label = f"replica:{host}:{port}"
+                built.append(_Replica(label, ConnectionPool(label, kwargs, size=DB_REPLICA_POOL_SIZE, min_size=0, timeout=DB_REPLICA_POOL_TIMEOUT)))
+            _replicas = built
+        return _replicas
+
+
+def _read_replica_lag(pool: ConnectionPool) -> Optional[float]:
+    """Seconds_Behind_Master for one replica, or None when it is not replicating."""
+    # The full primary timeout: a busy replica is not an unhealthy one.
+    conn = pool.get_connection(timeout=DB_POOL_TIMEOUT)
+    try:
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except pymysql.err.ProgrammingError:
+                # MariaDB < 10.5 and MySQL < 8.0.22 only know the legacy spelling.
+                cursor.execute("SHOW SLAVE STATUS")
+            row = cursor.fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    lag = row.get("Seconds_Behind_Master", row.get("Seconds_Behind_Source"))
+    return None if lag is None else float(lag)
+
+
+def check_replicas() -> None:
+    """Refresh the health verdict of every replica (one pass; the monitor loops on it)."""
+    for replica in _get_replicas():
+        try:
+            lag = _read_replica_lag(replica.pool)
+            replica.lag = lag
+            replica.error = None if lag is not None else "not replicating (no status or NULL lag)"
+            replica.healthy = lag is not None and lag <= DB_REPLICA_MAX_LAG
+        except Exception as exc:
+            replica.lag = None
+            replica.error = f"{type(exc).__name__}: {exc}"
+            replica.healthy = False
+        replica.checked_at = time.time()
+
+
+def _monitor_loop() -> None:
+    while True:
+        try:
+            check_replicas()
+        except Exception as exc:
+            print(f"[db] Replica health check failed: {exc}", flush=True)
+        time.sleep(DB_REPLICA_CHECK_INTERVAL)
+
+
+def start_replica_monitor() -> None:
+    """Run one synchronous health check, then keep checking in a daemon thread.
+
+    No-op when DB_REPLICA_HOSTS is empty. The first check is synchronous so that
+    replicas can take traffic from the very first request.
+    """
+    global _monitor_thread
+    if not DB_REPLICA_HOSTS:
+        return
+    with _replicas_lock:
+        if _monitor_thread is not None and _monitor_thread.is_alive():
+            return
+    check_replicas()
+    with _replicas_lock:
+        if _monitor_thread is not None and _monitor_thread.is_alive():
+            return
+        _monitor_thread = threading.Thread(target=_monitor_loop, name="db-replica-monitor", daemon=True)
+        _monitor_thread.start()
+    for replica in _get_replicas():
+        state = f"lag {replica.lag:.0f}s" if replica.lag is not None else replica.error
+        print(f"[db] {replica.label}: {'healthy' if replica.healthy else 'out of rotation'} ({state}).", flush=True)
+
+
+def get_read_connection(timeout: Optional[float] = None) -> PooledConnection:
+    """Check out a connection for a read that may run on a replica.
+
+    Round-robins over the healthy replicas. A replica whose pool stays exhausted for
+    DB_REPLICA_POOL_TIMEOUT seconds is busy, not broken: the next replica is tried,
+    then the primary. A replica that cannot open or ping a connection is taken out
+    of rotation until the next health check. Falls back to the primary when no
+    replica is configured or none can hand out a connection; ``timeout`` applies
+    to the primary's checkout (and caps the replicas' wait).
+    """
+    global _replica_rr, _replica_fallbacks
+    healthy = [r for r in _get_replicas() if r.healthy]
+    if healthy:
+        with _replicas_lock:
+            _replica_rr += 1
+            start = _replica_rr
+        replica_timeout = DB_REPLICA_POOL_TIMEOUT if timeout is None else min(float(timeout), DB_REPLICA_POOL_TIMEOUT)
+        for i in range(len(healthy)):
+            replica = healthy[(start + i) % len(healthy)]
+            try:
+                conn = replica.pool.get_connection(timeout=replica_timeout)
+            except PoolTimeoutError:
+                replica.busy += 1
+                continue
+            except Exception as exc:
+                replica.healthy = False
+                replica.error = f"{type(exc).__name__}: {exc}"
+                continue
+            replica.routed += 1
+            return conn
+    if DB_REPLICA_HOSTS:
+        with _replicas_lock:
+            _replica_fallbacks += 1
+    return get_connection(timeout=timeout)
+
+
+def replica_stats() -> dict:
+    """Health and routing counters per replica (empty when no replica is configured)."""
+    if not DB_REPLICA_HOSTS:
+        return {}
+    return {
+        "max_lag": DB_REPLICA_MAX_LAG,
+        "fallbacks_to_primary": _replica_fallbacks,
+        "replicas": [
+            {
+                "name": r.label,
+                "healthy": r.healthy,
+                "lag": r.lag,
+                "checked_at": r.checked_at,
+                "error": r.error,
+                "routed": r.routed,
+                "busy": r.busy,
+            }
+            for r in _get_replicas()
+        ],
+    }
+
+
+def close_all_pools() -> None:
+    """Close every idle pooled connection (e.g. in a pre-fork parent before forking)."""
+    if _primary_pool is not None:
+        _primary_pool.close_all()
+    for replica in _replicas or []:
+        replica.pool.close_all()
+
+
+def reset_after_fork() -> None:
+    """Forget the pools and the executor inherited from a parent process.
+
+    A forked child must never talk over its parent's sockets, and the executor's
+    worker threads did not survive the fork. Both are recreated lazily on first use.
+    """
+    global _primary_pool, _primary_pool_lock, _executor, _executor_lock
+    global _replicas, _replicas_lock, _monitor_thread
+    _primary_pool = None
+    _primary_pool_lock = threading.Lock()
+    _replicas = None
+    _replicas_lock = threading.Lock()
+    _monitor_thread = None
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+def pool_stats() -> dict:
+    """Metrics for every pool this process has created (empty before first use)."""
+    stats = {}
+    if _primary_pool is not None:
+        stats["primary"] = _primary_pool.stats()
+    for replica in _replicas or []:
+        stats[replica.label] = replica.pool.stats()
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Async-safe execution
+# ---------------------------------------------------------------------------
+# PyMySQL is blocking. Called straight from an ``async def`` endpoint it stalls the
+# event loop, and with it every other in-flight request, for the duration of the
+# query. ``run_db`` moves that work onto a dedicated executor instead of the event
+# loop's default one, so DB work has its own thread budget: a burst of slow queries
+# queues here and cannot starve the LLM calls (``asyncio.to_thread``) of threads,
+# and vice versa.
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    executor = _executor
+    if executor is not None:
+        return executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_THREADS, thread_name_prefix="db")
+        return _executor
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking DB callable on the dedicated DB executor and await its result.
+
+    Context variables are copied into the worker thread, the same way
+    ``asyncio.to_thread`` does, so per-request state stays visible to the callee.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), lambda: ctx.run(fn, *args, **kwargs))
+
+
+def offload(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Turn a blocking endpoint function into an async one that runs on the DB executor.
+
+    FastAPI reads the parameters from ``__signature__``, so the wrapped function keeps
+    its query parameters and dependencies. ``__wrapped__`` is deliberately not set:
+    FastAPI must see a coroutine function, not unwrap back to the blocking one.
+    """
+    async def endpoint(*args, **kwargs):
+        return await run_db(fn, *args, **kwargs)
+
+    endpoint.__name__ = fn.__name__
+    endpoint.__qualname__ = fn.__qualname__
+    endpoint.__doc__ = fn.__doc__
+    endpoint.__module__ = fn.__module__
+    endpoint.__signature__ = inspect.signature(fn)
+    return endpoint
+
+
+def track_connections() -> list:
+    """Record every connection checked out from now on in the current context.
+
+    Returns the list the checkouts are appended to; pass it to ``abort_connections``
+    when the request is cancelled.
+    """
+    tracked: list = []
+    _tracked_connections.set(tracked)
+    return tracked
+
+
+def abort_connections(tracked: list) -> int:
+    """Abort every tracked connection that is still checked out; return how many were.
+
+    For a cancelled request: its worker threads may still be blocked on these
+    connections, and the code that would have closed them will never run.
+    """
+    aborted = 0
+    for conn in tracked:
+        if conn._entry is not None:
+            conn.abort()
+            aborted += 1
+    tracked.clear()
+    return aborted
+
+
+def executor_stats() -> dict:
+    """Queue depth and thread budget of the DB executor."""
+    executor = _executor
+    if executor is None:
+        return {"threads": DB_EXECUTOR_THREADS, "started": 0, "queued": 0}
+    return {
+        "threads": DB_EXECUTOR_THREADS,
+        "started": len(executor._threads),
+        "queued": executor._work_queue.qsize(),
+    }
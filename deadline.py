@@ -0,0 +1,154 @@
+"""Request-scoped deadline budget for the text2sql pipeline.
+
+``search_text2sql`` chains several slow stages: entity extraction (LLM),
+text-to-SQL (LLM), answer-entity classification (LLM), entity resolution (DB),
+SQL execution (DB) and, on failure, the complex-question retry (LLM, then the
+whole pipeline again). Before this module none of them knew how long the caller
+was prepared to wait. A client that had long gone away (or an MCP call that had
+timed out at 60 s) still paid for every LLM call and cache write.
+
+The endpoint now starts a deadline per request (``start``). It is the client's
+``deadline_seconds`` capped by ``TEXT2SQL_DEADLINE_MAX``, or
+``TEXT2SQL_DEADLINE_DEFAULT`` when the client sends none. The deadline lives in a
+context variable, so it follows the request into ``asyncio.to_thread`` and
+``db.run_db`` workers, and every stage reads it:
+
+- ``stage(name)`` opens a time slice for one stage: ``STAGE_SHARES[name]`` of
+  the budget still left when the stage starts. ``call_timeout()`` returns the
+  seconds left in the current slice, and the LLM SDK calls use it as their
+  request timeout, so a stalled provider call fails inside its slice instead of
+  eating the whole budget.
+- ``allow_optional(name)`` is False once less than
+  ``TEXT2SQL_DEADLINE_OPTIONAL_MIN`` seconds remain. The pipeline then skips
+  stages it can do without (answer-entity classification, guard regeneration,
+  the complex-question retries) and says so in ``messages``.
+- ``statement_time(default)`` bounds MariaDB's ``max_statement_time`` for the
+  generated SQL by the execution slice.
+
+The endpoint itself enforces the overall deadline and aborts the pipeline when
+the client disconnects (see ``_guarded_pipeline`` in main.py).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import os
+import time
+from typing import Iterator, Optional
+
+
+# Budget applied when the client sends no deadline_seconds (0 disables the default).
+TEXT2SQL_DEADLINE_DEFAULT = float(os.getenv("TEXT2SQL_DEADLINE_DEFAULT", "120"))
+# Upper bound on any budget, client-supplied or default.
+TEXT2SQL_DEADLINE_MAX = float(os.getenv("TEXT2SQL_DEADLINE_MAX", "300"))
+# Optional stages are skipped once fewer seconds than this remain.
+TEXT2SQL_DEADLINE_OPTIONAL_MIN = float(os.getenv("TEXT2SQL_DEADLINE_OPTIONAL_MIN", "10"))
+
+# Share of the *remaining* budget each stage may use when it starts. Later stages
+# get a share of whatever the earlier ones left, so a fast extraction leaves more
+# for text-to-SQL; a share of 1.0 means "everything that is left".
+STAGE_SHARES = {
+    "entity_extraction": 0.3,
+    "text2sql": 0.5,
+    "result_entity": 0.2,
+    "guard_regeneration": 0.4,
+    "resolution": 0.3,
+    "execution": 0.5,
+    "complex_retry": 1.0,
+}
+
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("text2sql_deadline", default=None)
+_stage_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("text2sql_stage_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline budget ran out before (or during) a stage."""
+
+
+def resolve_budget(requested: Optional[float]) -> Optional[float]:
+    """Budget in seconds for a request: the client's value or the default, capped; None for no deadline."""
+    budget = requested if requested is not None and requested > 0 else TEXT2SQL_DEADLINE_DEFAULT
+    if budget is None or budget <= 0:
+        return None
+    if TEXT2SQL_DEADLINE_MAX > 0:
+        budget = min(budget, TEXT2SQL_DEADLINE_MAX)
+    return budget
+
+
+def start(budget: Optional[float]) -> None:
+    """Start the deadline for the current request context (None clears it)."""
+    _deadline.set(time.monotonic() + budget if budget is not None else None)
+    _stage_deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the request budget (may be negative), or None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check(stage_name: str) -> None:
+    """Raise DeadlineExceeded when the budget is already spent before ``stage_name``."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"deadline exceeded before stage '{stage_name}'")
+
+
+def allow_optional(stage_name: str) -> bool:
+    """True when there is enough budget left to run the optional stage ``stage_name``."""
+    left = remaining()
+    return left is None or left >= TEXT2SQL_DEADLINE_OPTIONAL_MIN
+
+
+@contextlib.contextmanager
+def stage(stage_name: str) -> Iterator[Optional[float]]:
+    """Open the time slice for ``stage_name``; yields its length in seconds (None without a deadline).
+
+    Raises DeadlineExceeded when the budget is already spent.
+    """
+    check(stage_name)
+    deadline = _deadline.get()
+    if deadline is None:
+        yield None
+        return
+    now = time.monotonic()
+    slice_seconds = (deadline - now) * STAGE_SHARES.get(stage_name, 1.0)
+    token = _stage_deadline.set(min(deadline, now + slice_seconds))
+    try:
+        yield slice_seconds
+    finally:
+        _stage_deadline.reset(token)
+
+
+def call_timeout() -> Optional[float]:
+    """Timeout for one blocking call (an LLM request) in the current stage slice.
+
+    Returns None without a deadline. Raises DeadlineExceeded when nothing is left.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    stage_deadline = _stage_deadline.get()
+    end = deadline if stage_deadline is None else min(deadline, stage_deadline)
+    left = end - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("deadline exceeded before an LLM call")
+    return left
+
+
+def statement_time(default: float) -> float:
+    """MariaDB max_statement_time for the current slice: ``default`` bounded by the time left.
+
+    The result is never 0 when a deadline is set (0 disables the server-side timeout).
+    """
+    try:
+        left = call_timeout()
+    except DeadlineExceeded:
+        left = 0.0
+    if left is None:
+        return default
+    left = max(left, 0.5)
+    return min(default, left) if default > 0 else left
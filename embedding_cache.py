@@ -0,0 +1,303 @@
+"""Persistent, content-addressed cache for OpenAI embeddings, shared by all workers.
+
+``OpenAIEmbeddingFunction`` called the embeddings endpoint for every text, every
+time, while the same titles and names ("Star Wars", "Alain Delon") are embedded
+over and over: by the entity vector searches, by the anonymized-queries
+collection, by every worker. This cache sits in front of the endpoint:
+
+- **Key.** A 16-byte digest of (model, dimensions, text). Each model and
+  dimension pair has its own files, so a vector is always read at the width it
+  was written with.
+- **Storage.** Two append-only files per generation in ``EMBEDDING_CACHE_DIR``:
+  ``<model>-<dims>.<generation>.f32``, the vectors as raw float32 rows, and
+  ``.idx``, fixed-size ``(digest, byte offset)`` records. The vector file is
+  memory-mapped read-only: a hit is a NumPy view into the page cache, shared by
+  every worker that maps the file, never a copy.
+- **Lock-free appends.** A miss is written with ``O_APPEND``, the row first and
+  its index record second, so a reader never sees a record pointing at missing
+  bytes. Workers never wait on each other; each one tails the index files to
+  learn what the others stored.
+- **Size-based eviction.** When the current vector file passes half of
+  ``EMBEDDING_CACHE_MAX_BYTES``, the worker that notices creates the next
+  generation (``O_EXCL``, so exactly one does). Others switch when they see
+  that file. The previous generation stays readable, and its hits are copied
+  forward, so hot vectors survive. The generation before it is deleted. A
+  worker that still maps a deleted file keeps reading it until it switches.
+
+Per-process hit, miss, store and rotation counters are in ``stats()``. Any disk
+error disables the cache for the process; embeddings are then fetched as before.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "embeddings"),
+).strip()
+EMBEDDING_CACHE_MAX_BYTES = int(float(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))))
+
+# Native widths of the OpenAI embedding models; other models need ``dimensions``.
+MODEL_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+_INDEX_RECORD = struct.Struct("<16sQ")
+
+_lock = threading.Lock()
+_stores: dict[tuple[str, int], "_Store"] = {}
+_stores_pid: Optional[int] = None
+_failed = False
+_counters = {"hits": 0, "misses": 0, "stores": 0, "promotions": 0, "rotations": 0, "width_mismatches": 0}
+
+
+def _digest(model: str, dims: int, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\x00{dims}\x00{text}".encode("utf-8")).digest()[:16]
+
+
+class _Generation:
+    """One generation's vector and index files, as seen by this process."""
+
+    def __init__(self, prefix: str, number: int, row_bytes: int):
+        self.number = number
+        self.vec_path = f"{prefix}.{number}.f32"
+        self.idx_path = f"{prefix}.{number}.idx"
+        self.row_bytes = row_bytes
+        self.offsets: dict[bytes, int] = {}
+        self.idx_read = 0
+        self.map: Optional[mmap.mmap] = None
+        self.vec_fd: Optional[int] = None
+        self.idx_fd: Optional[int] = None
+
+    def refresh(self) -> None:
+        """Read the index records appended since the last call (by any worker)."""
+        try:
+            with open(self.idx_path, "rb") as f:
+                f.seek(self.idx_read)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        whole = len(data) - len(data) % _INDEX_RECORD.size
+        for digest, offset in _INDEX_RECORD.iter_unpack(data[:whole]):
+            self.offsets[digest] = offset
+        self.idx_read += whole
+
+    def vector(self, digest: bytes) -> Optional[np.ndarray]:
+        offset = self.offsets.get(digest)
+        if offset is None:
+            return None
+        end = offset + self.row_bytes
+        if self.map is None or len(self.map) < end:
+            try:
+                with open(self.vec_path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size < end:
+                        return None
+                    # The previous map is not closed: vectors handed out may still view it.
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+        return np.frombuffer(self.map, dtype=np.float32, count=self.row_bytes // 4, offset=offset)
+
+    def append(self, digest: bytes, row: bytes) -> int:
+        """Append one row and its index record; returns the vector file size after the write."""
+        if self.vec_fd is None:
+            self.vec_fd = os.open(self.vec_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self.idx_fd = os.open(self.idx_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self.vec_fd, row)
+        # With O_APPEND the file offset ends right after this row, whoever else appended.
+        end = os.lseek(self.vec_fd, 0, os.SEEK_CUR)
+        os.write(self.idx_fd, _INDEX_RECORD.pack(digest, end - len(row)))
+        self.offsets[digest] = end - len(row)
+        return end
+
+    def close(self) -> None:
+        for fd in (self.vec_fd, self.idx_fd):
+            if fd is not None:
+                os.close(fd)
+        self.vec_fd = self.idx_fd = None
+
+
+class _Store:
+    """The current and previous generations of one (model, dimensions) pair.
+
+    ``lock`` serializes this process's threads only (the file offsets and the
+    index dicts are per process); other workers are never waited for.
+    """
+
+    def __init__(self, model: str, dims: int):
+        self.lock = threading.RLock()
+        self.dims = dims
+        self.row_bytes = dims * 4
+        self.prefix = os.path.join(EMBEDDING_CACHE_DIR, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}-{dims}")
+        pattern = re.compile(re.escape(os.path.basename(self.prefix)) + r"\.(\d+)\.f32$")
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(EMBEDDING_CACHE_DIR)) if m]
+        current = max(numbers, default=0)
+        self.current = _Generation(self.prefix, current, self.row_bytes)
+        self.previous = _Generation(self.prefix, current - 1, self.row_bytes) if current > 0 else None
+        if not numbers:
+            self._create(current)
+        if self._misaligned(self.current):
+            # A crash mid-write left a partial index record: start a clean generation.
+            self._rotate()
+
+    def _misaligned(self, generation: _Generation) -> bool:
+        try:
+            return os.path.getsize(generation.idx_path) % _INDEX_RECORD.size != 0
+        except FileNotFoundError:
+            return False
+
+    def _create(self, number: int) -> bool:
+        """Create generation ``number``; False when another worker already did."""
+        try:
+            os.close(os.open(f"{self.prefix}.{number}.f32", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except FileExistsError:
+            return False
+        os.close(os.open(f"{self.prefix}.{number}.idx", os.O_WRONLY | os.O_CREAT, 0o644))
+        return True
+
+    def _switch(self) -> None:
+        """Follow rotations made by any worker since the last call."""
+        while os.path.exists(f"{self.prefix}.{self.current.number + 1}.f32"):
+            if self.previous is not None:
+                self.previous.close()
+            self.previous = self.current
+            self.current = _Generation(self.prefix, self.current.number + 1, self.row_bytes)
+
+    def _rotate(self) -> None:
+        if self._create(self.current.number + 1):
+            with _lock:
+                _counters["rotations"] += 1
+            for suffix in ("f32", "idx"):
+                try:
+                    os.remove(f"{self.prefix}.{self.current.number - 1}.{suffix}")
+                except FileNotFoundError:
+                    pass
+            print(f"[embedding-cache] {os.path.basename(self.prefix)}: started generation {self.current.number + 1}.", flush=True)
+        self._switch()
+
+    def lookup(self, digests: list) -> list:
+        self._switch()
+        self.current.refresh()
+        if self.previous is not None:
+            self.previous.refresh()
+        found = []
+        for digest in digests:
+            vector = self.current.vector(digest)
+            if vector is None and self.previous is not None:
+                vector = self.previous.vector(digest)
+                if vector is not None:
+                    self.store(digest, vector)
+                    with _lock:
+                        _counters["promotions"] += 1
+            found.append(vector)
+        return found
+
+    def store(self, digest: bytes, vector: np.ndarray) -> None:
+        end = self.current.append(digest, np.asarray(vector, dtype=np.float32).tobytes())
+        if end >= EMBEDDING_CACHE_MAX_BYTES // 2:
+            self._rotate()
+
+
+def _store(model: str, dims: int) -> Optional[_Store]:
+    global _stores_pid, _failed
+    if _failed:
+        return None
+    pid = os.getpid()
+    with _lock:
+        if _stores_pid != pid:
+            # Forked worker: file descriptors and their offsets must not be shared.
+            _stores.clear()
+            _stores_pid = pid
+        store = _stores.get((model, dims))
+    if store is not None:
+        return store
+    try:
+        os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+        store = _Store(model, dims)
+    except OSError as exc:
+        _failed = True
+        print(f"[embedding-cache] Disabled, cannot open {EMBEDDING_CACHE_DIR}: {exc}", flush=True)
+        return None
+    with _lock:
+        return _stores.setdefault((model, dims), store)
+
+
+def embed(model: str, texts: list, compute: Callable[[list], list], dimensions: Optional[int] = None) -> list:
+    """Vectors for ``texts``, from the cache where possible and from ``compute`` for the rest.
+
+    ``compute`` receives the distinct missing texts, in order, and returns one
+    vector per text. The vectors are float32; cached ones are read-only views.
+    Blocking (file reads, and the ``compute`` call on a miss).
+    """
+    dims = dimensions or MODEL_DIMENSIONS.get(model)
+    store = _store(model, dims) if EMBEDDING_CACHE_ENABLED and dims else None
+    if store is None:
+        return [np.asarray(vector, dtype=np.float32) for vector in compute(list(texts))]
+    global _failed
+    digests = [_digest(model, dims, text) for text in texts]
+    try:
+        with store.lock:
+            found = store.lookup(digests)
+    except OSError as exc:
+        _failed = True
+        print(f"[embedding-cache] Disabled after a read error: {exc}", flush=True)
+        return [np.asarray(vector, dtype=np.float32) for vector in compute(list(texts))]
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, found) if vector is None))
+    with _lock:
+        _counters["hits"] += len(texts) - sum(vector is None for vector in found)
+        _counters["misses"] += len(missing)
+    if not missing:
+        return found
+    computed = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(missing, compute(missing))}
+    for text, vector in computed.items():
+        if vector.shape != (dims,):
+            with _lock:
+                _counters["width_mismatches"] += 1
+            continue
+        try:
+            with store.lock:
+                store.store(_digest(model, dims, text), vector)
+        except OSError as exc:
+            _failed = True
+            print(f"[embedding-cache] Disabled after a write error: {exc}", flush=True)
+            break
+        with _lock:
+            _counters["stores"] += 1
+    return [vector if vector is not None else computed[text] for text, vector in zip(texts, found)]
+
+
+def stats() -> dict:
+    """Settings, per-model generation sizes and counters of this worker since process start."""
+    with _lock:
+        counters = dict(_counters)
+        stores = dict(_stores) if _stores_pid == os.getpid() else {}
+    models = []
+    for (model, dims), store in stores.items():
+        try:
+            size = os.path.getsize(store.current.vec_path)
+        except OSError:
+            size = 0
+        entries = len(store.current.offsets) + (len(store.previous.offsets) if store.previous is not None else 0)
+        models.append({"model": model, "dimensions": dims, "generation": store.current.number, "generation_bytes": size, "entries": entries})
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": EMBEDDING_CACHE_ENABLED and not _failed,
+        "dir": EMBEDDING_CACHE_DIR,
+        "max_bytes": EMBEDDING_CACHE_MAX_BYTES,
+        **counters,
+        "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        "models": models,
+    }
@@ -1,3 +1,4 @@
+import asyncio
 import concurrent.futures
 import contextvars
 import json
@@ -13,7 +14,14 @@ import rapidfuzz_query
 import text2sql as t2s
 import data_watcher
 import json_guardrails
+import llm_cache
 import closed_vocab
+import context_cache
+import db
+import deadline
+import incremental_json
+import local_index
+import resolution_cache
 
 
 def _extract_year_context(entity_extraction):
@@ -78,6 +86,16 @@ strentityextractionmodeldefault = "gpt-4o"
 # eval/bench-entity-extraction-split.py before flipping this on.
 ENTITY_EXTRACTION_SPLIT = os.getenv("ENTITY_EXTRACTION_SPLIT", "0").strip().lower() in {"1", "true", "yes", "on"}
 
+# Streamed extraction: the API path reads the extraction reply as it is generated
+# and hands each completed placeholder to the caller (main.py starts resolving it)
+# before the model has finished the rest of the JSON object.
+ENTITY_EXTRACTION_STREAMING = os.getenv("ENTITY_EXTRACTION_STREAMING", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+# Concurrent entity resolution: the API path plans each placeholder as its own task,
+# each on its own DB connection, at most this many at once per request (1 = one
+# placeholder after the other, as plan_entity_resolutions does).
+ENTITY_RESOLUTION_CONCURRENCY = max(1, int(os.getenv("ENTITY_RESOLUTION_CONCURRENCY", "4")))
+
 # Populated synchronously by data_watcher.register() below and refreshed
 # automatically whenever the underlying files change on disk.
 entity_extraction_prompt_template: str = ""
@@ -122,6 +140,9 @@ def get_or_build_bktree(cache_key, build_fn):
         if idx is None:
             idx = build_fn()
             _BKTREE_CACHE[cache_key] = idx
+            # Resolutions planned before the tree existed took the slower, possibly
+            # different, fallback path.
+            resolution_cache.clear(f"BK-tree built for {cache_key[0]}.{cache_key[2]}")
         return idx
 
 
@@ -236,16 +257,25 @@ def _validate_entity_resolution_config(config: Any) -> list[dict]:
 
 def _on_entity_extraction_prompt_change(content: str) -> None:
     global entity_extraction_prompt_template
+    if entity_extraction_prompt_template and content != entity_extraction_prompt_template:
+        llm_cache.invalidate(["entity_extraction"])
+        context_cache.invalidate(["entity_extraction"])
     entity_extraction_prompt_template = content
 
 
 def _on_entity_extraction_open_prompt_change(content: str) -> None:
     global entity_extraction_open_prompt_template
+    if entity_extraction_open_prompt_template and content != entity_extraction_open_prompt_template:
+        llm_cache.invalidate(["entity_extraction_open"])
+        context_cache.invalidate(["entity_extraction_open"])
     entity_extraction_open_prompt_template = content
 
 
 def _on_entity_extraction_closed_prompt_change(content: str) -> None:
     global entity_extraction_closed_prompt_template
+    if entity_extraction_closed_prompt_template and content != entity_extraction_closed_prompt_template:
+        llm_cache.invalidate(["entity_extraction_closed"])
+        context_cache.invalidate(["entity_extraction_closed"])
     entity_extraction_closed_prompt_template = content
 
 
@@ -254,6 +284,8 @@ def _on_entity_resolution_config_change(content: str) -> None:
     try:
         parsed = json.loads(content)
         ENTITY_RESOLUTION_CONFIG = _validate_entity_resolution_config(parsed)
+        resolution_cache.clear("entity_resolution.json reloaded")
+        local_index.retain(local_index_collections())
     except Exception as e:
         # Keep the previous valid config rather than crashing the running app.
         print(f"[entity] Failed to reload entity_resolution.json, keeping previous config: {e}")
@@ -282,64 +314,132 @@ def _run_extraction_prompt(prompt_template: str, user_question: str, model_to_us
         ``{"error": ...}`` dict, which every caller already knows how to handle.
     """
     try:
-        try:
-            formatted_prompt = prompt_template.replace("{user_question}", user_question)
-        except Exception as format_error:
-            print(f"Error formatting prompt template: {str(format_error)}")
-            print(f"User question: '{user_question}'")
-            return {"error": f"Prompt formatting failed: {str(format_error)}"}
+        formatted_prompt = _format_extraction_prompt(prompt_template, user_question)
+        if isinstance(formatted_prompt, dict):
+            return formatted_prompt
 
         try:
-            json_content = t2s._call_chat_llm(
-                model=model_to_use,
-                system_prompt="You are a powerful entity extraction tool. Respond only with the JSON content, no explanations.",
-                user_prompt=formatted_prompt,
-                temperature=0,
-                cache_label=cache_label,
-            ).strip()
+            return t2s._hedged_chat_llm(_extraction_call(formatted_prompt, model_to_use, cache_label), _parse_extraction_reply)
         except Exception as api_error:
             print(f"LLM API call failed: {str(api_error)}")
             print(f"API error type: {type(api_error)}")
             return {"error": f"LLM API call failed: {str(api_error)}"}
+    except Exception as e:
+        print(f"Error in entity extraction: {str(e)}")
+        return {"error": str(e)}
 
-        if json_content.startswith("```json"):
-            json_content = json_content[7:].strip()
-        if json_content.endswith("```"):
-            json_content = json_content[:-3].strip()
-
-        print(f"Raw API response: '{json_content}'")
-        print(f"Response length: {len(json_content)}")
-        print(f"Response type: {type(json_content)}")
 
-        cleaned_content = json_content.strip().strip("\n").strip("\r").strip("\n")
-        if not cleaned_content.startswith("{") or not cleaned_content.endswith("}"):
-            print("WARNING: Response doesn't look like complete JSON")
-            if cleaned_content.startswith('"question"'):
-                cleaned_content = "{" + cleaned_content + "}"
-                print(f"Attempting to fix malformed JSON: {cleaned_content}")
-            else:
-                return {"error": "Incomplete JSON response from API", "raw_content": json_content}
+async def _arun_extraction_prompt(prompt_template: str, user_question: str, model_to_use: str, cache_label: str):
+    """Async twin of _run_extraction_prompt (same arguments and return contract)."""
+    try:
+        formatted_prompt = _format_extraction_prompt(prompt_template, user_question)
+        if isinstance(formatted_prompt, dict):
+            return formatted_prompt
 
         try:
-            entity_extraction = json.loads(cleaned_content)
-            print(f"Successfully parsed JSON: {entity_extraction}")
-            # JSON guardrail (FASTAPI-TEXT2SQL-038): validate the output shape.
-            ok, guard_error = json_guardrails.validate_llm_json(entity_extraction, "entity_extraction")
-            if not ok:
-                print(f"JSON guardrail failed in entity extraction: {guard_error}")
-                return {"error": f"JSON guardrail: {guard_error}", "raw_content": json_content}
-            return entity_extraction
-        except json.JSONDecodeError as json_error:
-            print(f"JSON parsing error in entity extraction: {str(json_error)}")
-            print(f"Raw response content: '{json_content}'")
-            print(f"Cleaned content: '{cleaned_content}'")
-            return {"error": f"JSON parsing failed: {str(json_error)}", "raw_content": json_content}
-
+            return await t2s._ahedged_chat_llm(_extraction_call(formatted_prompt, model_to_use, cache_label), _parse_extraction_reply)
+        except Exception as api_error:
+            print(f"LLM API call failed: {str(api_error)}")
+            print(f"API error type: {type(api_error)}")
+            return {"error": f"LLM API call failed: {str(api_error)}"}
     except Exception as e:
         print(f"Error in entity extraction: {str(e)}")
         return {"error": str(e)}
 
 
+async def _astream_extraction_prompt(prompt_template: str, user_question: str, model_to_use: str, cache_label: str, on_pair):
+    """Streamed form of _arun_extraction_prompt (same return contract).
+
+    ``on_pair(key, value)`` is called for each top-level pair of the reply as soon
+    as it is complete. The full reply is then parsed and validated as usual. When
+    the stream fails, or the reply does not validate, the step is run again through
+    _arun_extraction_prompt, whose hedging policy handles the failover; pairs
+    already handed out may then be stale, so callers check them against the final
+    payload.
+    """
+    formatted_prompt = _format_extraction_prompt(prompt_template, user_question)
+    if isinstance(formatted_prompt, dict):
+        return formatted_prompt
+
+    parser = incremental_json.ObjectPairParser()
+    # Validates the complete reply before the response cache stores it, so the
+    # retry below never gets a rejected reply back from the cache.
+    checked = t2s._CheckedReply(_parse_extraction_reply)
+    try:
+        async for delta in t2s._astream_chat_llm(**_extraction_call(formatted_prompt, model_to_use, cache_label), validate=checked):
+            for key, value in parser.feed(delta):
+                on_pair(key, value)
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as stream_error:
+        print(f"Streamed entity extraction failed ({cache_label}), retrying without streaming: {str(stream_error)}")
+        return await _arun_extraction_prompt(prompt_template, user_question, model_to_use, cache_label)
+
+    if not t2s._is_valid_payload(checked.result):
+        return await _arun_extraction_prompt(prompt_template, user_question, model_to_use, cache_label)
+    return checked.result
+
+
+def _format_extraction_prompt(prompt_template: str, user_question: str):
+    """The prompt with the question filled in, or an ``{"error": ...}`` dict."""
+    try:
+        return prompt_template.replace("{user_question}", user_question)
+    except Exception as format_error:
+        print(f"Error formatting prompt template: {str(format_error)}")
+        print(f"User question: '{user_question}'")
+        return {"error": f"Prompt formatting failed: {str(format_error)}"}
+
+
+def _extraction_call(formatted_prompt: str, model_to_use: str, cache_label: str) -> dict:
+    return {
+        "model": model_to_use,
+        "system_prompt": "You are a powerful entity extraction tool. Respond only with the JSON content, no explanations.",
+        "user_prompt": formatted_prompt,
+        "temperature": 0,
+        "cache_label": cache_label,
+    }
+
+
+def _parse_extraction_reply(raw: str):
+    return _parse_extraction_response(raw.strip())
+
+
+def _parse_extraction_response(json_content: str):
+    """Parse and validate one extraction reply; returns the payload or an error dict."""
+    if json_content.startswith("```json"):
+        json_content = json_content[7:].strip()
+    if json_content.endswith("```"):
+        json_content = json_content[:-3].strip()
+
+    print(f"Raw API response: '{json_content}'")
+    print(f"Response length: {len(json_content)}")
+    print(f"Response type: {type(json_content)}")
+
+    cleaned_content = json_content.strip().strip("\n").strip("\r").strip("\n")
+    if not cleaned_content.startswith("{") or not cleaned_content.endswith("}"):
+        print("WARNING: Response doesn't look like complete JSON")
+        if cleaned_content.startswith('"question"'):
+            cleaned_content = "{" + cleaned_content + "}"
+            print(f"Attempting to fix malformed JSON: {cleaned_content}")
+        else:
+            return {"error": "Incomplete JSON response from API", "raw_content": json_content}
+
+    try:
+        entity_extraction = json.loads(cleaned_content)
+        print(f"Successfully parsed JSON: {entity_extraction}")
+        # JSON guardrail (FASTAPI-TEXT2SQL-038): validate the output shape.
+        ok, guard_error = json_guardrails.validate_llm_json(entity_extraction, "entity_extraction")
+        if not ok:
+            print(f"JSON guardrail failed in entity extraction: {guard_error}")
+            return {"error": f"JSON guardrail: {guard_error}", "raw_content": json_content}
+        return entity_extraction
+    except json.JSONDecodeError as json_error:
+        print(f"JSON parsing error in entity extraction: {str(json_error)}")
+        print(f"Raw response content: '{json_content}'")
+        print(f"Cleaned content: '{cleaned_content}'")
+        return {"error": f"JSON parsing failed: {str(json_error)}", "raw_content": json_content}
+
+
 def f_entity_extraction(user_question: str, strentityextractionmodel: str = "default"):
     """Extract placeholders and an anonymized question from the raw user question."""
     print("Entity extraction")
@@ -349,6 +449,23 @@ def f_entity_extraction(user_question: str, strentityextractionmodel: str = "def
     return _run_extraction_prompt(entity_extraction_prompt_template, user_question, model_to_use, "entity_extraction")
 
 
+async def af_entity_extraction(user_question: str, strentityextractionmodel: str = "default", on_pair=None):
+    """Async twin of f_entity_extraction, used by the API request path.
+
+    Args:
+        on_pair: Optional ``on_pair(key, value)`` callback; when given (and
+            ENTITY_EXTRACTION_STREAMING is on) the reply is streamed and each
+            completed pair, ``question`` included, is handed out as it arrives.
+    """
+    print("Entity extraction")
+    print("User question:", user_question)
+    model_to_use = t2s._normalize_llm_model(strentityextractionmodel, strentityextractionmodeldefault)
+    print("Entity extraction LLM model:", model_to_use)
+    if on_pair is not None and ENTITY_EXTRACTION_STREAMING:
+        return await _astream_extraction_prompt(entity_extraction_prompt_template, user_question, model_to_use, "entity_extraction", on_pair)
+    return await _arun_extraction_prompt(entity_extraction_prompt_template, user_question, model_to_use, "entity_extraction")
+
+
 # --- Split extraction (FASTAPI-TEXT2SQL-200) --------------------------------
 # Two independent passes read the same raw question and each anonymize their own
 # spans of it. Pass A owns the open types (world knowledge: titles, people,
@@ -577,6 +694,49 @@ def f_entity_extraction_split(user_question: str, strentityextractionmodel: str
     return merged
 
 
+async def af_entity_extraction_split(user_question: str, strentityextractionmodel: str = "default", notes: list | None = None, on_pair=None):
+    """Async twin of f_entity_extraction_split: both passes run as concurrent coroutines.
+
+    No worker threads: ``asyncio.gather`` wraps each pass in a task with its own copy
+    of the request context, and the copies share the prompt-cache buffer by reference.
+
+    Args:
+        on_pair: As for :func:`af_entity_extraction`, but only placeholder pairs are
+            handed out: each pass's ``question`` is a partial anonymization that
+            the merge rewrites. The merge can also drop a placeholder.
+    """
+    print("Entity extraction (split: open types + closed vocabularies)")
+    print("User question:", user_question)
+    model_to_use = t2s._normalize_llm_model(strentityextractionmodel, strentityextractionmodeldefault)
+    print("Entity extraction LLM model:", model_to_use)
+
+    def _run_pass(prompt_template: str, cache_label: str):
+        if on_pair is not None and ENTITY_EXTRACTION_STREAMING:
+            def _placeholder_pair(key, value):
+                if key != "question":
+                    on_pair(key, value)
+            return _astream_extraction_prompt(prompt_template, user_question, model_to_use, cache_label, _placeholder_pair)
+        return _arun_extraction_prompt(prompt_template, user_question, model_to_use, cache_label)
+
+    open_payload, closed_payload = await asyncio.gather(
+        _run_pass(entity_extraction_open_prompt_template, "entity_extraction_open"),
+        _run_pass(entity_extraction_closed_prompt_template, "entity_extraction_closed"),
+        return_exceptions=True,
+    )
+    if isinstance(open_payload, BaseException):
+        if isinstance(open_payload, asyncio.CancelledError):
+            raise open_payload
+        open_payload = {"error": f"Open-type extraction raised: {str(open_payload)}"}
+    if isinstance(closed_payload, BaseException):
+        if isinstance(closed_payload, asyncio.CancelledError):
+            raise closed_payload
+        closed_payload = {"error": f"Closed-vocabulary extraction raised: {str(closed_payload)}"}
+
+    merged = merge_entity_extractions(user_question, open_payload, closed_payload, notes=notes)
+    print(f"Merged entity extraction: {merged}")
+    return merged
+
+
 def _find_entity_config(placeholder_key: str):
     """Return the first resolution config whose placeholder prefix matches the key."""
     for cfg in ENTITY_RESOLUTION_CONFIG:
@@ -677,6 +837,25 @@ class _PlannedEntity:
         self.final_message = final_message
         self.require_present = require_present
 
+    def rekeyed(self, key: str, note: str | None = None) -> "_PlannedEntity":
+        """A copy of this plan for another key of the same type (``resolution_cache`` hits).
+
+        The substitution is rebuilt for the new placeholder and the final message
+        renamed. The original diagnostics are replaced by ``note``: they describe
+        searches this request did not run.
+        """
+        placeholder = "{{" + str(key) + "}}"
+        copy = _PlannedEntity(str(key), placeholder)
+        if note is not None:
+            copy.note(note)
+        if self.substitution is not None:
+            copy.resolve_with(
+                self.substitution.for_placeholder(placeholder),
+                final_message=self.final_message.replace(self.placeholder, placeholder) if self.final_message else self.final_message,
+                require_present=self.require_present,
+            )
+        return copy
+
 
 def _substitute_literal(placeholder: str, sql_value: str, text_value: str):
     """Build a substitution replacing ``placeholder`` by a bare SQL literal.
@@ -690,6 +869,7 @@ def _substitute_literal(placeholder: str, sql_value: str, text_value: str):
         sql_query = re.sub(rf"{re.escape(placeholder)}", sql_value, sql_query, flags=re.IGNORECASE)
         return sql_query, justification.replace(placeholder, text_value), answer.replace(placeholder, text_value)
 
+    _apply.for_placeholder = lambda other: _substitute_literal(other, sql_value, text_value)
     return _apply
 
 
@@ -703,6 +883,7 @@ def _substitute_plain(placeholder: str, sql_value: str, text_value: str):
             answer.replace(placeholder, text_value),
         )
 
+    _apply.for_placeholder = lambda other: _substitute_plain(other, sql_value, text_value)
     return _apply
 
 
@@ -774,6 +955,7 @@ def _substitute_entity_row(placeholder: str, target_col: str, strfieldnamenew: s
             answer.replace(placeholder, str(record_value)),
         )
 
+    _apply.for_placeholder = lambda other: _substitute_entity_row(other, target_col, strfieldnamenew, multi_cols, record_value)
     return _apply
 
 
@@ -804,6 +986,7 @@ def _substitute_canonical(placeholder: str, target_col: str, canonical_value, ju
             pass
         return sql_query, justification, answer
 
+    _apply.for_placeholder = lambda other: _substitute_canonical(other, target_col, canonical_value, justification_value)
     return _apply
 
 
@@ -857,11 +1040,522 @@ def _plan_entity_row_substitution(*, cursor, planned: _PlannedEntity, cfg: dict,
     return True
 
 
+def local_index_collections() -> dict:
+    """``{collection: settings}`` of the embeddings strategies with ``local_index`` enabled."""
+    specs = {}
+    for cfg in ENTITY_RESOLUTION_CONFIG:
+        for search_cfg in _iter_entity_searches(cfg):
+            spec = local_index.settings(search_cfg.get("local_index"))
+            if spec is not None and (search_cfg.get("search_mode") or "").strip().lower() == "embeddings" and search_cfg.get("collection"):
+                specs.setdefault(search_cfg["collection"], spec)
+    return specs
+
+
+def _query_collection(search_cfg: dict, collection, query_input: dict, **query_kwargs) -> tuple[dict, bool]:
+    """Query an embeddings collection, locally when its strategy has ``local_index``.
+
+    Returns ``(results, served_locally)``. The ChromaDB server answers when the
+    local index is off, not loaded yet or too large (see :mod:`local_index`).
+    """
+    spec = local_index.settings(search_cfg.get("local_index"))
+    if spec is not None:
+        results = local_index.query(search_cfg.get("collection"), collection, spec, query_input=query_input, **query_kwargs)
+        if results is not None:
+            return results, True
+    return collection.query(**query_input, **query_kwargs), False
+
+
+def _plan_entity(cursor, key, value, entity_extraction, chromadb_collections_by_name: dict, query_embeddings: dict | None = None) -> _PlannedEntity:
+    """Plan the resolution of one extracted ``key``/``value`` pair on ``cursor``.
+
+    ``entity_extraction`` is only read for the year context of embeddings
+    strategies with ``year_metadata_filter`` (see :func:`needs_full_extraction`).
+    ``query_embeddings`` maps values to the vectors embedded for this request
+    (see :func:`embed_entity_values`); a value without one is embedded by ChromaDB.
+    """
+    placeholder = "{{" + str(key) + "}}"
+    planned = _PlannedEntity(str(key), placeholder)
+
+    regex_rule = _match_regex_placeholder_rule(key)
+    if regex_rule is not None:
+        prefix, pattern, is_numeric = regex_rule
+        raw_value = "" if value is None else str(value).strip()
+        if raw_value == "" or not re.fullmatch(pattern, raw_value):
+            planned.note(
+                f"Entity resolution: {placeholder} -> rejected '{raw_value}' "
+                f"(does not match expected pattern {pattern} for {prefix}); leaving placeholder unresolved"
+            )
+            return planned
+
+        if is_numeric:
+            sub_sql = raw_value
+            kind = "numeric"
+        else:
+            sub_sql = f"'{_sql_escape_literal(raw_value)}'"
+            kind = "regex string"
+
+        planned.resolve_with(
+            _substitute_literal(placeholder, sub_sql, raw_value),
+            final_message=f"Entity resolution: {placeholder} -> {raw_value} ({kind})",
+        )
+        return planned
+
+    if isinstance(key, str) and (key.startswith("Movie_genre") or key.startswith("Serie_genre")):
+        raw_value = "" if value is None else str(value).strip()
+        if raw_value == "":
+            return planned
+
+        if key.startswith("Movie_genre"):
+            genre_id = closed_vocab.resolve_movie_genre(raw_value)
+            side = "movie genre"
+        else:
+            genre_id = closed_vocab.resolve_serie_genre(raw_value)
+            side = "serie genre"
+        if genre_id is None:
+            planned.note(f"Entity resolution: {placeholder} -> unknown {side} '{raw_value}'; leaving placeholder unresolved")
+            return planned
+
+        genre_id_str = str(genre_id)
+        planned.resolve_with(
+            _substitute_literal(placeholder, genre_id_str, raw_value),
+            final_message=f"Entity resolution: {placeholder} -> {genre_id_str} ({raw_value}) ({side})",
+        )
+        return planned
+
+    if isinstance(key, str) and key.startswith("Technical_format"):
+        raw_value = "" if value is None else str(value).strip()
+        if raw_value == "":
+            return planned
+
+        technical_id = closed_vocab.resolve_technical(raw_value)
+        if technical_id is None:
+            planned.note(f"Entity resolution: {placeholder} -> unknown technical format '{raw_value}'; leaving placeholder unresolved")
+            return planned
+
+        technical_id_str = str(technical_id)
+        planned.resolve_with(
+            _substitute_literal(placeholder, technical_id_str, raw_value),
+            final_message=f"Entity resolution: {placeholder} -> {technical_id_str} ({raw_value}) (technical_format)",
+        )
+        return planned
+
+    if isinstance(key, str) and (
+        key.startswith("Status_name")
+        or key.startswith("Serie_type")
+        or key.startswith("Department_name")
+    ):
+        raw_value = "" if value is None else str(value).strip()
+        if raw_value == "":
+            return planned
+
+        if key.startswith("Status_name"):
+            entity_name = "Status_name"
+        elif key.startswith("Serie_type"):
+            entity_name = "Serie_type"
+        else:
+            entity_name = "Department_name"
+        canonical = closed_vocab.resolve(entity_name, raw_value)
+        if canonical is None:
+            planned.note(
+                f"Entity resolution: {placeholder} -> unknown {entity_name} value '{raw_value}'; "
+                "leaving placeholder unresolved"
+            )
+            return planned
+
+        canonical_sql = _sql_escape_literal(str(canonical))
+        planned.resolve_with(
+            _substitute_literal(placeholder, f"'{canonical_sql}'", str(canonical)),
+            final_message=f"Entity resolution: {placeholder} -> {canonical} ({raw_value}) ({entity_name})",
+        )
+        return planned
+
+    cfg = _find_entity_config(key)
+    if cfg is None:
+        raw_value = "" if value is None else str(value)
+        if raw_value.strip() == "":
+            return planned
+        raw_value_sql = _sql_escape_literal(raw_value)
+        planned.resolve_with(
+            _substitute_plain(placeholder, raw_value_sql, raw_value),
+            final_message=f"Entity resolution: {placeholder} -> {raw_value} (generic)",
+            require_present=True,
+        )
+        return planned
+
+    raw_value = "" if value is None else str(value)
+    if raw_value.strip() == "":
+        return planned
+
+    raw_value_sql = _sql_escape_literal(raw_value)
+    searches = _iter_entity_searches(cfg)
+    resolved = False
+    language_family = None
+    if isinstance(key, str) and key.startswith("Person_name"):
+        try:
+            language_family = guess_language_family(raw_value)
+        except Exception:
+            language_family = None
+        planned.note(f"Entity resolution: {placeholder} guessed language family = {language_family or 'unknown'}")
+
+    cache_key = resolution_cache.make_key(
+        prefix=cfg.get("placeholder_prefix", ""),
+        value=raw_value,
+        language_family=language_family,
+        year=_extract_year_context(entity_extraction) if any(s.get("year_metadata_filter") for s in searches) else None,
+        cfg=cfg,
+    )
+    cached = resolution_cache.lookup(cache_key)
+    if cached is not None:
+        cached_plan, age = cached
+        return cached_plan.rekeyed(
+            key,
+            note=f"Entity resolution: {placeholder} -> resolution cache hit for '{raw_value}' (planned {age:.0f}s ago)",
+        )
+
+    for search_cfg in searches:
+        apply_when_language_family_in = search_cfg.get("apply_when_language_family_in")
+        if isinstance(apply_when_language_family_in, list):
+            if language_family is None or language_family not in apply_when_language_family_in:
+                continue
+
+        apply_when_language_family_not_in = search_cfg.get("apply_when_language_family_not_in")
+        if isinstance(apply_when_language_family_not_in, list):
+            if language_family is not None and language_family in apply_when_language_family_not_in:
+                continue
+
+        search_mode = (search_cfg.get("search_mode") or "").strip().lower()
+
+        if search_mode == "rapidfuzz":
+            strtablename = search_cfg.get("strtablename")
+            strtableid = search_cfg.get("strtableid")
+            if not strtablename or not strtableid:
+                continue
+
+            strcolumndesc = search_cfg.get("default_field")
+            strcolumndescnorm = search_cfg.get("rapidfuzz_col_norm") or (f"{strcolumndesc}_NORM" if strcolumndesc else None)
+            strcolumndesckey = search_cfg.get("rapidfuzz_col_key") or (f"{strcolumndesc}_KEY" if strcolumndesc else None)
+            strcolumnpopularity = search_cfg.get("rapidfuzz_col_popularity") or search_cfg.get("order_by") or "POPULARITY"
+            if not strcolumndesc or not strcolumndescnorm or not strcolumndesckey:
+                continue
+
+            if isinstance(key, str) and key.startswith("Person_name"):
+                planned.note(f"Entity resolution: {placeholder} searching with RapidFuzz in table {strtablename} (language family: {language_family or 'unknown'})")
+
+            try:
+                has_fulltext = rapidfuzz_query.db_has_fulltext(cursor, strtablename, strcolumndescnorm)
+                bktree_idx = None
+                if BKTREE_ENABLED:
+                    cache_key = (strtablename, strtableid, strcolumndescnorm)
+                    was_cached = cache_key in _BKTREE_CACHE
+                    try:
+                        bktree_idx = get_or_build_bktree(
+                            cache_key,
+                            lambda: rapidfuzz_query.build_bktree_for_config(
+                                cursor,
+                                {
+                                    "table": strtablename,
+                                    "id": strtableid,
+                                    "norm": strcolumndescnorm,
+                                },
+                            ),
+                        )
+                        if not was_cached and bktree_idx is not None:
+                            print(f"[entity] BK-tree loaded on-demand for RapidFuzz search on {strtablename}.{strcolumndescnorm}: {bktree_idx.size} entries")
+                    except Exception:
+                        bktree_idx = None
+                rapidfuzz_result = rapidfuzz_query.search_first_match(
+                    cursor,
+                    strtablename,
+                    strtableid,
+                    strcolumndesc,
+                    strcolumndescnorm,
+                    strcolumndesckey,
+                    strcolumnpopularity,
+                    raw=raw_value,
+                    has_fulltext=has_fulltext,
+                    timings_enabled=False,
+                    bktree=bktree_idx,
+                    # Neutralize generic franchise words (collections): "Star Wars
+                    # universe" ~ "Star Wars Collection". Applied to the query and,
+                    # in-memory, to each candidate NORM, so no stored-column backfill
+                    # is required. Opt-in per strategy in entity_resolution.json.
+                    strip_stopwords=bool(search_cfg.get("strip_franchise_stopwords")),
+                )
+            except Exception:
+                continue
+
+            best = (rapidfuzz_result or {}).get("best")
+            if not isinstance(best, dict):
+                continue
+
+            # Confidence gate (FASTAPI-TEXT2SQL-062): when `require_confident`
+            # is set, only accept an exact / high-confidence auto-correct
+            # (rapidfuzz `auto` True) so a low-confidence lexical guess falls
+            # through to the next strategy (e.g. embeddings) instead of
+            # substituting a wrong entity. Off by default so existing
+            # Person_name strategies keep their always-resolve behaviour.
+            if search_cfg.get("require_confident") and not (rapidfuzz_result or {}).get("auto"):
+                planned.note(
+                    f"Entity resolution: {placeholder} -> RapidFuzz best match not confident "
+                    f"({(rapidfuzz_result or {}).get('reason')}); falling through to next strategy"
+                )
+                continue
+
+            docid = best.get(strtableid)
+            if docid is None:
+                continue
+
+            resolve_to_canonical = search_cfg.get("resolve_to_canonical")
+            if isinstance(resolve_to_canonical, dict):
+                aka_value = best.get(strcolumndesc) if strcolumndesc else None
+                if aka_value is None:
+                    aka_value = raw_value
+
+                canonical_value = None
+                try:
+                    from_col = resolve_to_canonical.get("from_column")
+                    canonical_table = resolve_to_canonical.get("table")
+                    canonical_id_col = resolve_to_canonical.get("id_column")
+                    canonical_value_col = resolve_to_canonical.get("value_column")
+                    canonical_id_val = best.get(from_col) if from_col else None
+                    if canonical_id_val is not None and canonical_table and canonical_id_col and canonical_value_col:
+                        cursor.execute(
+                            f"SELECT `{canonical_value_col}` FROM `{canonical_table}` WHERE `{canonical_id_col}` = %s LIMIT 1",
+                            (canonical_id_val,),
+                        )
+                        row = cursor.fetchone()
+                        if isinstance(row, dict):
+                            canonical_value = row.get(canonical_value_col)
+                except Exception:
+                    canonical_value = None
+
+                if canonical_value is None or str(canonical_value).strip() == "":
+                    planned.note(f"Entity resolution: {placeholder} -> {aka_value} (rapidfuzz; canonical lookup failed, using AKA value)")
+                    canonical_value = aka_value
+
+                target_col = search_cfg.get("default_field") or strcolumndesc
+                if target_col:
+                    justification_value = str(aka_value)
+                    if str(canonical_value) != str(aka_value):
+                        justification_value = f"{aka_value} ({canonical_value})"
+                        final_message = f"Entity resolution: {placeholder} -> {canonical_value} (SQL canonical), {aka_value} ({canonical_value}) (justification AKA + canonical) (rapidfuzz, source table: {strtablename})"
+                    else:
+                        final_message = f"Entity resolution: {placeholder} -> {canonical_value} (SQL canonical and justification) (rapidfuzz, source table: {strtablename})"
+                    planned.resolve_with(
+                        _substitute_canonical(placeholder, target_col, canonical_value, justification_value),
+                        final_message=final_message,
+                    )
+                    resolved = True
+                    break
+                continue
+
+            if _plan_entity_row_substitution(
+                cursor=cursor,
+                planned=planned,
+                cfg=search_cfg,
+                docid=docid,
+                doclang="*",
+                message=f"Entity resolution: {{placeholder}} -> {{resolved}} (rapidfuzz, source table: {strtablename})",
+            ):
+                resolved = True
+                break
+            continue
+
+        if search_mode != "embeddings":
+            continue
+
+        collection_name = search_cfg.get("collection")
+        current_collection = chromadb_collections_by_name.get(collection_name)
+        if current_collection is None:
+            continue
+
+        # Hybrid (voie B): when this entity carries year metadata and a
+        # sibling Release_year is present, tighten the shortlist with a
+        # ChromaDB metadata filter. Falls back to an unfiltered search if
+        # the filter yields nothing (e.g. before the year backfill has run,
+        # or for movies whose RELEASE_YEAR is NULL) so behaviour never regresses.
+        results = None
+        _query_vector = (query_embeddings or {}).get(raw_value)
+        _query_input = {"query_embeddings": [_query_vector]} if _query_vector is not None else {"query_texts": [raw_value]}
+        if search_cfg.get("year_metadata_filter"):
+            _year_ctx = _extract_year_context(entity_extraction)
+            if _year_ctx is not None:
+                try:
+                    _filtered, _served_locally = _query_collection(
+                        search_cfg,
+                        current_collection,
+                        _query_input,
+                        n_results=10,
+                        where={"year": {"$gte": _year_ctx - 1, "$lte": _year_ctx + 1}},
+                    )
+                    if (_filtered.get("documents", [[]]) or [[]])[0] or []:
+                        results = _filtered
+                except Exception:
+                    results = None
+        if results is None:
+            results, _served_locally = _query_collection(search_cfg, current_collection, _query_input, n_results=10)
+        if _served_locally:
+            planned.note(f"Entity resolution: {placeholder} searched collection '{collection_name}' in the local vector index")
+        documents = (results.get("documents", [[]]) or [[]])[0] or []
+        ids = (results.get("ids", [[]]) or [[]])[0] or []
+        distances = (results.get("distances", [[]]) or [[]])[0] or []
+        if not documents or not ids:
+            continue
+
+        matched_result_position = 0
+        found_match = False
+        try:
+            target_value_norm = raw_value.strip().lower()
+        except Exception:
+            target_value_norm = ""
+
+        for i, document in enumerate(documents):
+            if isinstance(document, str) and document.strip().lower() == target_value_norm:
+                matched_result_position = i
+                found_match = True
+                break
+        if not found_match and target_value_norm:
+            # Typo-tolerant rerank of the shortlist (voie B): pick the
+            # candidate whose title is lexically closest to the typed value
+            # (e.g. "le bonnheur" -> "Le Bonheur"). Falls back to the
+            # embedding top-1 if nothing scores.
+            best_score = -1.0
+            for i, document in enumerate(documents):
+                if not isinstance(document, str):
+                    continue
+                score = fuzz.WRatio(target_value_norm, document.strip().lower())
+                if score > best_score:
+                    best_score = score
+                    matched_result_position = i
+
+        # Confidence gate (FASTAPI-TEXT2SQL-062): when the chosen
+        # candidate is not an exact normalized match, optionally reject
+        # it so a degraded / near-miss shortlist yields "unresolved"
+        # (safe) rather than a confidently wrong entity. Opt-in per
+        # strategy via `max_distance` and/or `min_fuzz_ratio`; an exact
+        # match always passes. `fuzz.ratio` (edit distance) is used, not
+        # WRatio, because titles sharing a common suffix (e.g.
+        # "... Collection") inflate WRatio's token_set component and let
+        # unrelated entries through (observed: "Mad Max collection" ->
+        # "Max und die Wilde 7 Collection", WRatio=85 but ratio=62).
+        max_distance = search_cfg.get("max_distance")
+        min_fuzz_ratio = search_cfg.get("min_fuzz_ratio")
+        if not found_match and (max_distance is not None or min_fuzz_ratio is not None):
+            chosen_doc = documents[matched_result_position] if matched_result_position < len(documents) else ""
+            chosen_doc_norm = chosen_doc.strip().lower() if isinstance(chosen_doc, str) else ""
+            chosen_distance = None
+            if matched_result_position < len(distances):
+                try:
+                    chosen_distance = float(distances[matched_result_position])
+                except (TypeError, ValueError):
+                    chosen_distance = None
+            chosen_ratio = fuzz.ratio(target_value_norm, chosen_doc_norm) if chosen_doc_norm else 0.0
+
+            distance_ok = (max_distance is None) or (chosen_distance is None) or (chosen_distance <= max_distance)
+            ratio_ok = (min_fuzz_ratio is None) or (chosen_ratio >= min_fuzz_ratio)
+            if not (distance_ok and ratio_ok):
+                shortlist_parts = []
+                for j in range(min(len(ids), 5)):
+                    dtxt = ""
+                    if j < len(distances):
+                        try:
+                            dtxt = f" d={float(distances[j]):.3f}"
+                        except (TypeError, ValueError):
+                            dtxt = ""
+                    shortlist_parts.append(f"{ids[j]}{dtxt}")
+                planned.note(
+                    f"Entity resolution: {placeholder} -> rejected best embeddings candidate "
+                    f"'{chosen_doc}' (distance={chosen_distance}, fuzz_ratio={chosen_ratio:.0f}) "
+                    f"below confidence threshold (max_distance={max_distance}, min_fuzz_ratio={min_fuzz_ratio}); "
+                    f"shortlist: {', '.join(shortlist_parts)}"
+                )
+                continue
+
+        first_record_id = ids[matched_result_position]
+        parts = str(first_record_id).split("_")
+        docid = parts[1] if len(parts) > 1 else None
+        doclang = parts[2] if len(parts) > 2 else "*"
+        if docid is None:
+            continue
+
+        if _plan_entity_row_substitution(
+            cursor=cursor,
+            planned=planned,
+            cfg=search_cfg,
+            docid=docid,
+            doclang=doclang,
+            message=f"Entity resolution: {{placeholder}} -> {{resolved}} (lang={doclang})",
+        ):
+            resolved = True
+            break
+
+    if resolved:
+        resolution_cache.store(cache_key, planned)
+        return planned
+
+    planned.resolve_with(
+        _substitute_plain(placeholder, raw_value_sql, raw_value),
+        final_message=f"Entity resolution: {placeholder} -> {raw_value} (raw fallback)",
+        require_present=True,
+    )
+    return planned
+
+
+def _embedding_values(entity_extraction, preplanned: dict | None = None) -> list:
+    """Distinct values that an embeddings-mode search may query, in extraction order.
+
+    Every placeholder whose ``search_list`` has an embeddings strategy counts, even
+    if an earlier RapidFuzz strategy may resolve it first: an extra text costs a few
+    tokens in the batch, a missing one a round trip of its own. Values with a
+    reusable streamed plan are left out.
+    """
+    values = []
+    if not isinstance(entity_extraction, dict):
+        return values
+    for key, value in entity_extraction.items():
+        if key == "question" or not isinstance(key, str) or value is None or str(value).strip() == "":
+            continue
+        if _match_regex_placeholder_rule(key) is not None or _reusable_plan(preplanned, key, value) is not None:
+            continue
+        cfg = _find_entity_config(key)
+        if cfg is None:
+            continue
+        if any((search_cfg.get("search_mode") or "").strip().lower() == "embeddings" for search_cfg in _iter_entity_searches(cfg)):
+            if str(value) not in values:
+                values.append(str(value))
+    return values
+
+
+def embed_entity_values(embed, entity_extraction, preplanned: dict | None = None) -> dict:
+    """Embed every embeddings-mode value of a request in one call: ``{value: vector}``.
+
+    ``embed`` is the collections' embedding function (a list of texts in, one
+    vector per text out). The vectors are then passed to every ChromaDB query as
+    ``query_embeddings``, the unfiltered fallback of a year-filtered search
+    included, instead of each query embedding its text again. Returns an empty
+    dict when there is nothing to embed or the call failed; the queries then embed
+    their own text as before.
+    """
+    values = _embedding_values(entity_extraction, preplanned)
+    if embed is None or not values:
+        return {}
+    try:
+        vectors = embed(values)
+    except Exception as embed_error:
+        print(f"Batched query embedding failed, embedding per query instead: {embed_error}")
+        return {}
+    if len(vectors) != len(values):
+        return {}
+    return dict(zip(values, vectors))
+
+
 def plan_entity_resolutions(
     *,
     connection,
     entity_extraction,
     chromadb_collections_by_name: dict,
+    preplanned: dict | None = None,
+    embed=None,
 ) -> dict[str, Any]:
     """Resolve every extracted entity as far as the generated SQL is not needed.
 
@@ -876,429 +1570,169 @@ def plan_entity_resolutions(
         connection: Open database connection used for the resolution lookups.
         entity_extraction: Extraction payload, ``{"question": ..., "<Key>": value}``.
         chromadb_collections_by_name: Embeddings collections, keyed by name.
+        preplanned: Entities already planned while the extraction was streaming,
+            ``{key: (value, _PlannedEntity)}`` (see :func:`plan_entity`). An entry
+            is reused when the final payload still carries the same value.
+        embed: Optional embedding function; when given, the embeddings-mode values
+            are embedded in one batch first (see :func:`embed_entity_values`).
 
     Returns:
         dict with ``entities`` (list of :class:`_PlannedEntity`, in extraction
-        order) and ``planning_time`` (seconds spent here, for the timing breakdown).
+        order), ``planning_time`` (seconds spent here, for the timing breakdown)
+        ``reused`` (how many entries of ``preplanned`` were used) and ``embedded``
+        (how many values the batched embedding call covered).
     """
     planning_start_time = time.time()
     planned_entities: list[_PlannedEntity] = []
+    reused = 0
+    query_embeddings = embed_entity_values(embed, entity_extraction, preplanned)
 
     if isinstance(entity_extraction, dict):
         with connection.cursor() as cursor:
             for key, value in entity_extraction.items():
                 if key == "question":
                     continue
-
-                placeholder = "{{" + str(key) + "}}"
-                planned = _PlannedEntity(str(key), placeholder)
+                planned = _reusable_plan(preplanned, key, value)
+                if planned is not None:
+                    reused += 1
+                else:
+                    planned = _plan_entity(cursor, key, value, entity_extraction, chromadb_collections_by_name, query_embeddings)
                 planned_entities.append(planned)
 
-                regex_rule = _match_regex_placeholder_rule(key)
-                if regex_rule is not None:
-                    prefix, pattern, is_numeric = regex_rule
-                    raw_value = "" if value is None else str(value).strip()
-                    if raw_value == "" or not re.fullmatch(pattern, raw_value):
-                        planned.note(
-                            f"Entity resolution: {placeholder} -> rejected '{raw_value}' "
-                            f"(does not match expected pattern {pattern} for {prefix}); leaving placeholder unresolved"
-                        )
-                        continue
-
-                    if is_numeric:
-                        sub_sql = raw_value
-                        kind = "numeric"
-                    else:
-                        sub_sql = f"'{_sql_escape_literal(raw_value)}'"
-                        kind = "regex string"
+    return {
+        "entities": planned_entities,
+        "planning_time": time.time() - planning_start_time,
+        "reused": reused,
+        "embedded": len(query_embeddings),
+    }
 
-                    planned.resolve_with(
-                        _substitute_literal(placeholder, sub_sql, raw_value),
-                        final_message=f"Entity resolution: {placeholder} -> {raw_value} ({kind})",
-                    )
-                    continue
 
-                if isinstance(key, str) and (key.startswith("Movie_genre") or key.startswith("Serie_genre")):
-                    raw_value = "" if value is None else str(value).strip()
-                    if raw_value == "":
-                        continue
+async def aplan_entity_resolutions(
+    *,
+    connection,
+    entity_extraction,
+    chromadb_collections_by_name: dict,
+    preplanned: dict | None = None,
+    embed=None,
+) -> dict[str, Any]:
+    """Concurrent form of :func:`plan_entity_resolutions`, used by the API request path.
 
-                    if key.startswith("Movie_genre"):
-                        genre_id = closed_vocab.resolve_movie_genre(raw_value)
-                        side = "movie genre"
-                    else:
-                        genre_id = closed_vocab.resolve_serie_genre(raw_value)
-                        side = "serie genre"
-                    if genre_id is None:
-                        planned.note(f"Entity resolution: {placeholder} -> unknown {side} '{raw_value}'; leaving placeholder unresolved")
-                        continue
+    Each placeholder is planned as its own task on the DB executor, with its own
+    cursor: the request's ``connection`` serves one task, and up to
+    ``ENTITY_RESOLUTION_CONCURRENCY - 1`` more connections are checked out of the
+    pool for the others (never waited for: when the pool is exhausted, the tasks
+    share the connections they already have). The resolution then costs the
+    slowest placeholder instead of the sum of all of them. With ``embed``, the
+    embeddings-mode values are first embedded in one batch, shared by all tasks.
 
-                    genre_id_str = str(genre_id)
-                    planned.resolve_with(
-                        _substitute_literal(placeholder, genre_id_str, raw_value),
-                        final_message=f"Entity resolution: {placeholder} -> {genre_id_str} ({raw_value}) ({side})",
-                    )
-                    continue
+    Returns:
+        The same dict as :func:`plan_entity_resolutions`, ``entities`` still in
+        extraction order, plus ``timings``: ``(key, seconds, reused)`` per entity,
+        and ``concurrency``, the number of connections used.
+    """
+    planning_start_time = time.time()
+    if not isinstance(entity_extraction, dict):
+        return {"entities": [], "planning_time": 0.0, "reused": 0, "embedded": 0, "timings": [], "concurrency": 0}
+
+    items = [(key, value) for key, value in entity_extraction.items() if key != "question"]
+    planned_entities: list = [None] * len(items)
+    timings: list = [None] * len(items)
+    reused = 0
+    pending = []
+    for index, (key, value) in enumerate(items):
+        planned = _reusable_plan(preplanned, key, value)
+        if planned is not None:
+            planned_entities[index] = planned
+            timings[index] = (str(key), 0.0, True)
+            reused += 1
+        else:
+            pending.append(index)
 
-                if isinstance(key, str) and key.startswith("Technical_format"):
-                    raw_value = "" if value is None else str(value).strip()
-                    if raw_value == "":
-                        continue
+    query_embeddings = {}
+    if pending and embed is not None:
+        query_embeddings = await asyncio.to_thread(
+            embed_entity_values, embed, {items[i][0]: items[i][1] for i in pending},
+        )
 
-                    technical_id = closed_vocab.resolve_technical(raw_value)
-                    if technical_id is None:
-                        planned.note(f"Entity resolution: {placeholder} -> unknown technical format '{raw_value}'; leaving placeholder unresolved")
-                        continue
+    idle_connections: asyncio.Queue = asyncio.Queue()
+    idle_connections.put_nowait(connection)
+    borrowed: list = []
+    slots = min(ENTITY_RESOLUTION_CONCURRENCY, len(pending))
+    opened = 1
 
-                    technical_id_str = str(technical_id)
-                    planned.resolve_with(
-                        _substitute_literal(placeholder, technical_id_str, raw_value),
-                        final_message=f"Entity resolution: {placeholder} -> {technical_id_str} ({raw_value}) (technical_format)",
-                    )
-                    continue
+    async def _acquire():
+        nonlocal opened
+        if idle_connections.empty() and opened < slots:
+            opened += 1
+            try:
+                extra = await db.run_db(db.get_connection, 0)
+                borrowed.append(extra)
+                return extra
+            except Exception as pool_error:
+                opened -= 1
+                print(f"Concurrent entity resolution: no extra connection ({pool_error}); sharing the ones held.")
+        return await idle_connections.get()
+
+    def _plan_on(conn, key, value):
+        started = time.time()
+        with conn.cursor() as cursor:
+            planned = _plan_entity(cursor, key, value, entity_extraction, chromadb_collections_by_name, query_embeddings)
+        return planned, time.time() - started
+
+    async def _plan_one(index):
+        key, value = items[index]
+        conn = await _acquire()
+        try:
+            planned_entities[index], seconds = await db.run_db(_plan_on, conn, key, value)
+            timings[index] = (str(key), seconds, False)
+        finally:
+            idle_connections.put_nowait(conn)
+
+    # Not in a finally: on cancellation a worker may still be using a borrowed
+    # connection, and the request's abort path (db.abort_connections) reclaims it.
+    results = await asyncio.gather(*(_plan_one(index) for index in pending), return_exceptions=True)
+    for extra in borrowed:
+        try:
+            await db.run_db(extra.close)
+        except Exception:
+            pass
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
 
-                if isinstance(key, str) and (
-                    key.startswith("Status_name")
-                    or key.startswith("Serie_type")
-                    or key.startswith("Department_name")
-                ):
-                    raw_value = "" if value is None else str(value).strip()
-                    if raw_value == "":
-                        continue
-
-                    if key.startswith("Status_name"):
-                        entity_name = "Status_name"
-                    elif key.startswith("Serie_type"):
-                        entity_name = "Serie_type"
-                    else:
-                        entity_name = "Department_name"
-                    canonical = closed_vocab.resolve(entity_name, raw_value)
-                    if canonical is None:
-                        planned.note(
-                            f"Entity resolution: {placeholder} -> unknown {entity_name} value '{raw_value}'; "
-                            "leaving placeholder unresolved"
-                        )
-                        continue
+    return {
+        "entities": planned_entities,
+        "planning_time": time.time() - planning_start_time,
+        "reused": reused,
+        "embedded": len(query_embeddings),
+        "timings": timings,
+        "concurrency": len(borrowed) + 1 if pending else 0,
+    }
 
-                    canonical_sql = _sql_escape_literal(str(canonical))
-                    planned.resolve_with(
-                        _substitute_literal(placeholder, f"'{canonical_sql}'", str(canonical)),
-                        final_message=f"Entity resolution: {placeholder} -> {canonical} ({raw_value}) ({entity_name})",
-                    )
-                    continue
 
-                cfg = _find_entity_config(key)
-                if cfg is None:
-                    raw_value = "" if value is None else str(value)
-                    if raw_value.strip() == "":
-                        continue
-                    raw_value_sql = _sql_escape_literal(raw_value)
-                    planned.resolve_with(
-                        _substitute_plain(placeholder, raw_value_sql, raw_value),
-                        final_message=f"Entity resolution: {placeholder} -> {raw_value} (generic)",
-                        require_present=True,
-                    )
-                    continue
+def needs_full_extraction(key) -> bool:
+    """True when planning ``key`` reads other placeholders (the year context of its embeddings search)."""
+    cfg = _find_entity_config(key) if isinstance(key, str) else None
+    if cfg is None:
+        return False
+    return any(search_cfg.get("year_metadata_filter") for search_cfg in _iter_entity_searches(cfg))
 
-                raw_value = "" if value is None else str(value)
-                if raw_value.strip() == "":
-                    continue
 
-                raw_value_sql = _sql_escape_literal(raw_value)
-                searches = _iter_entity_searches(cfg)
-                resolved = False
-                language_family = None
-                if isinstance(key, str) and key.startswith("Person_name"):
-                    try:
-                        language_family = guess_language_family(raw_value)
-                    except Exception:
-                        language_family = None
-                    planned.note(f"Entity resolution: {placeholder} guessed language family = {language_family or 'unknown'}")
-
-                for search_cfg in searches:
-                    apply_when_language_family_in = search_cfg.get("apply_when_language_family_in")
-                    if isinstance(apply_when_language_family_in, list):
-                        if language_family is None or language_family not in apply_when_language_family_in:
-                            continue
-
-                    apply_when_language_family_not_in = search_cfg.get("apply_when_language_family_not_in")
-                    if isinstance(apply_when_language_family_not_in, list):
-                        if language_family is not None and language_family in apply_when_language_family_not_in:
-                            continue
-
-                    search_mode = (search_cfg.get("search_mode") or "").strip().lower()
-
-                    if search_mode == "rapidfuzz":
-                        strtablename = search_cfg.get("strtablename")
-                        strtableid = search_cfg.get("strtableid")
-                        if not strtablename or not strtableid:
-                            continue
-
-                        strcolumndesc = search_cfg.get("default_field")
-                        strcolumndescnorm = search_cfg.get("rapidfuzz_col_norm") or (f"{strcolumndesc}_NORM" if strcolumndesc else None)
-                        strcolumndesckey = search_cfg.get("rapidfuzz_col_key") or (f"{strcolumndesc}_KEY" if strcolumndesc else None)
-                        strcolumnpopularity = search_cfg.get("rapidfuzz_col_popularity") or search_cfg.get("order_by") or "POPULARITY"
-                        if not strcolumndesc or not strcolumndescnorm or not strcolumndesckey:
-                            continue
-
-                        if isinstance(key, str) and key.startswith("Person_name"):
-                            planned.note(f"Entity resolution: {placeholder} searching with RapidFuzz in table {strtablename} (language family: {language_family or 'unknown'})")
+def plan_entity(*, connection, key, value, chromadb_collections_by_name: dict) -> _PlannedEntity:
+    """Plan one placeholder on its own, as soon as its pair has streamed out of the extraction.
 
-                        try:
-                            has_fulltext = rapidfuzz_query.db_has_fulltext(cursor, strtablename, strcolumndescnorm)
-                            bktree_idx = None
-                            if BKTREE_ENABLED:
-                                cache_key = (strtablename, strtableid, strcolumndescnorm)
-                                was_cached = cache_key in _BKTREE_CACHE
-                                try:
-                                    bktree_idx = get_or_build_bktree(
-                                        cache_key,
-                                        lambda: rapidfuzz_query.build_bktree_for_config(
-                                            cursor,
-                                            {
-                                                "table": strtablename,
-                                                "id": strtableid,
-                                                "norm": strcolumndescnorm,
-                                            },
-                                        ),
-                                    )
-                                    if not was_cached and bktree_idx is not None:
-                                        print(f"[entity] BK-tree loaded on-demand for RapidFuzz search on {strtablename}.{strcolumndescnorm}: {bktree_idx.size} entries")
-                                except Exception:
-                                    bktree_idx = None
-                            rapidfuzz_result = rapidfuzz_query.search_first_match(
-                                cursor,
-                                strtablename,
-                                strtableid,
-                                strcolumndesc,
-                                strcolumndescnorm,
-                                strcolumndesckey,
-                                strcolumnpopularity,
-                                raw=raw_value,
-                                has_fulltext=has_fulltext,
-                                timings_enabled=False,
-                                bktree=bktree_idx,
-                                # Neutralize generic franchise words (collections): "Star Wars
-                                # universe" ~ "Star Wars Collection". Applied to the query and,
-                                # in-memory, to each candidate NORM, so no stored-column backfill
-                                # is required. Opt-in per strategy in entity_resolution.json.
-                                strip_stopwords=bool(search_cfg.get("strip_franchise_stopwords")),
-                            )
-                        except Exception:
-                            continue
-
-                        best = (rapidfuzz_result or {}).get("best")
-                        if not isinstance(best, dict):
-                            continue
-
-                        # Confidence gate (FASTAPI-TEXT2SQL-062): when `require_confident`
-                        # is set, only accept an exact / high-confidence auto-correct
-                        # (rapidfuzz `auto` True) so a low-confidence lexical guess falls
-                        # through to the next strategy (e.g. embeddings) instead of
-                        # substituting a wrong entity. Off by default so existing
-                        # Person_name strategies keep their always-resolve behaviour.
-                        if search_cfg.get("require_confident") and not (rapidfuzz_result or {}).get("auto"):
-                            planned.note(
-                                f"Entity resolution: {placeholder} -> RapidFuzz best match not confident "
-                                f"({(rapidfuzz_result or {}).get('reason')}); falling through to next strategy"
-                            )
-                            continue
-
-                        docid = best.get(strtableid)
-                        if docid is None:
-                            continue
-
-                        resolve_to_canonical = search_cfg.get("resolve_to_canonical")
-                        if isinstance(resolve_to_canonical, dict):
-                            aka_value = best.get(strcolumndesc) if strcolumndesc else None
-                            if aka_value is None:
-                                aka_value = raw_value
-
-                            canonical_value = None
-                            try:
-                                from_col = resolve_to_canonical.get("from_column")
-                                canonical_table = resolve_to_canonical.get("table")
-                                canonical_id_col = resolve_to_canonical.get("id_column")
-                                canonical_value_col = resolve_to_canonical.get("value_column")
-                                canonical_id_val = best.get(from_col) if from_col else None
-                                if canonical_id_val is not None and canonical_table and canonical_id_col and canonical_value_col:
-                                    cursor.execute(
-                                        f"SELECT `{canonical_value_col}` FROM `{canonical_table}` WHERE `{canonical_id_col}` = %s LIMIT 1",
-                                        (canonical_id_val,),
-                                    )
-                                    row = cursor.fetchone()
-                                    if isinstance(row, dict):
-                                        canonical_value = row.get(canonical_value_col)
-                            except Exception:
-                                canonical_value = None
-
-                            if canonical_value is None or str(canonical_value).strip() == "":
-                                planned.note(f"Entity resolution: {placeholder} -> {aka_value} (rapidfuzz; canonical lookup failed, using AKA value)")
-                                canonical_value = aka_value
-
-                            target_col = search_cfg.get("default_field") or strcolumndesc
-                            if target_col:
-                                justification_value = str(aka_value)
-                                if str(canonical_value) != str(aka_value):
-                                    justification_value = f"{aka_value} ({canonical_value})"
-                                    final_message = f"Entity resolution: {placeholder} -> {canonical_value} (SQL canonical), {aka_value} ({canonical_value}) (justification AKA + canonical) (rapidfuzz, source table: {strtablename})"
-                                else:
-                                    final_message = f"Entity resolution: {placeholder} -> {canonical_value} (SQL canonical and justification) (rapidfuzz, source table: {strtablename})"
-                                planned.resolve_with(
-                                    _substitute_canonical(placeholder, target_col, canonical_value, justification_value),
-                                    final_message=final_message,
-                                )
-                                resolved = True
-                                break
-                            continue
-
-                        if _plan_entity_row_substitution(
-                            cursor=cursor,
-                            planned=planned,
-                            cfg=search_cfg,
-                            docid=docid,
-                            doclang="*",
-                            message=f"Entity resolution: {{placeholder}} -> {{resolved}} (rapidfuzz, source table: {strtablename})",
-                        ):
-                            resolved = True
-                            break
-                        continue
-
-                    if search_mode != "embeddings":
-                        continue
-
-                    collection_name = search_cfg.get("collection")
-                    current_collection = chromadb_collections_by_name.get(collection_name)
-                    if current_collection is None:
-                        continue
-
-                    # Hybrid (voie B): when this entity carries year metadata and a
-                    # sibling Release_year is present, tighten the shortlist with a
-                    # ChromaDB metadata filter. Falls back to an unfiltered search if
-                    # the filter yields nothing (e.g. before the year backfill has run,
-                    # or for movies whose RELEASE_YEAR is NULL) so behaviour never regresses.
-                    results = None
-                    if search_cfg.get("year_metadata_filter"):
-                        _year_ctx = _extract_year_context(entity_extraction)
-                        if _year_ctx is not None:
-                            try:
-                                _filtered = current_collection.query(
-                                    query_texts=[raw_value],
-                                    n_results=10,
-                                    where={"year": {"$gte": _year_ctx - 1, "$lte": _year_ctx + 1}},
-                                )
-                                if (_filtered.get("documents", [[]]) or [[]])[0] or []:
-                                    results = _filtered
-                            except Exception:
-                                results = None
-                    if results is None:
-                        results = current_collection.query(query_texts=[raw_value], n_results=10)
-                    documents = (results.get("documents", [[]]) or [[]])[0] or []
-                    ids = (results.get("ids", [[]]) or [[]])[0] or []
-                    distances = (results.get("distances", [[]]) or [[]])[0] or []
-                    if not documents or not ids:
-                        continue
-
-                    matched_result_position = 0
-                    found_match = False
-                    try:
-                        target_value_norm = raw_value.strip().lower()
-                    except Exception:
-                        target_value_norm = ""
-
-                    for i, document in enumerate(documents):
-                        if isinstance(document, str) and document.strip().lower() == target_value_norm:
-                            matched_result_position = i
-                            found_match = True
-                            break
-                    if not found_match and target_value_norm:
-                        # Typo-tolerant rerank of the shortlist (voie B): pick the
-                        # candidate whose title is lexically closest to the typed value
-                        # (e.g. "le bonnheur" -> "Le Bonheur"). Falls back to the
-                        # embedding top-1 if nothing scores.
-                        best_score = -1.0
-                        for i, document in enumerate(documents):
-                            if not isinstance(document, str):
-                                continue
-                            score = fuzz.WRatio(target_value_norm, document.strip().lower())
-                            if score > best_score:
-                                best_score = score
-                                matched_result_position = i
-
-                    # Confidence gate (FASTAPI-TEXT2SQL-062): when the chosen
-                    # candidate is not an exact normalized match, optionally reject
-                    # it so a degraded / near-miss shortlist yields "unresolved"
-                    # (safe) rather than a confidently wrong entity. Opt-in per
-                    # strategy via `max_distance` and/or `min_fuzz_ratio`; an exact
-                    # match always passes. `fuzz.ratio` (edit distance) is used, not
-                    # WRatio, because titles sharing a common suffix (e.g.
-                    # "... Collection") inflate WRatio's token_set component and let
-                    # unrelated entries through (observed: "Mad Max collection" ->
-                    # "Max und die Wilde 7 Collection", WRatio=85 but ratio=62).
-                    max_distance = search_cfg.get("max_distance")
-                    min_fuzz_ratio = search_cfg.get("min_fuzz_ratio")
-                    if not found_match and (max_distance is not None or min_fuzz_ratio is not None):
-                        chosen_doc = documents[matched_result_position] if matched_result_position < len(documents) else ""
-                        chosen_doc_norm = chosen_doc.strip().lower() if isinstance(chosen_doc, str) else ""
-                        chosen_distance = None
-                        if matched_result_position < len(distances):
-                            try:
-                                chosen_distance = float(distances[matched_result_position])
-                            except (TypeError, ValueError):
-                                chosen_distance = None
-                        chosen_ratio = fuzz.ratio(target_value_norm, chosen_doc_norm) if chosen_doc_norm else 0.0
-
-                        distance_ok = (max_distance is None) or (chosen_distance is None) or (chosen_distance <= max_distance)
-                        ratio_ok = (min_fuzz_ratio is None) or (chosen_ratio >= min_fuzz_ratio)
-                        if not (distance_ok and ratio_ok):
-                            shortlist_parts = []
-                            for j in range(min(len(ids), 5)):
-                                dtxt = ""
-                                if j < len(distances):
-                                    try:
-                                        dtxt = f" d={float(distances[j]):.3f}"
-                                    except (TypeError, ValueError):
-                                        dtxt = ""
-                                shortlist_parts.append(f"{ids[j]}{dtxt}")
-                            planned.note(
-                                f"Entity resolution: {placeholder} -> rejected best embeddings candidate "
-                                f"'{chosen_doc}' (distance={chosen_distance}, fuzz_ratio={chosen_ratio:.0f}) "
-                                f"below confidence threshold (max_distance={max_distance}, min_fuzz_ratio={min_fuzz_ratio}); "
-                                f"shortlist: {', '.join(shortlist_parts)}"
-                            )
-                            continue
-
-                    first_record_id = ids[matched_result_position]
-                    parts = str(first_record_id).split("_")
-                    docid = parts[1] if len(parts) > 1 else None
-                    doclang = parts[2] if len(parts) > 2 else "*"
-                    if docid is None:
-                        continue
-
-                    if _plan_entity_row_substitution(
-                        cursor=cursor,
-                        planned=planned,
-                        cfg=search_cfg,
-                        docid=docid,
-                        doclang=doclang,
-                        message=f"Entity resolution: {{placeholder}} -> {{resolved}} (lang={doclang})",
-                    ):
-                        resolved = True
-                        break
-
-                if resolved:
-                    continue
+    Blocking (DB and ChromaDB lookups); run it through ``db.run_db``. Callers skip
+    keys for which :func:`needs_full_extraction` is True.
+    """
+    with connection.cursor() as cursor:
+        return _plan_entity(cursor, key, value, {key: value}, chromadb_collections_by_name)
 
-                planned.resolve_with(
-                    _substitute_plain(placeholder, raw_value_sql, raw_value),
-                    final_message=f"Entity resolution: {placeholder} -> {raw_value} (raw fallback)",
-                    require_present=True,
-                )
 
-    return {
-        "entities": planned_entities,
-        "planning_time": time.time() - planning_start_time,
-    }
+def _reusable_plan(preplanned: dict | None, key, value) -> _PlannedEntity | None:
+    if not preplanned or key not in preplanned or needs_full_extraction(key):
+        return None
+    planned_value, planned = preplanned[key]
+    return planned if planned_value == value else None
 
 
 def apply_entity_resolutions(
@@ -1342,6 +1776,19 @@ def apply_entity_resolutions(
 
     ambiguous_question_for_text2sql = 0
 
+    timings = [t for t in (plan or {}).get("timings") or [] if t is not None]
+    if timings:
+        slowest = max(seconds for _, seconds, _ in timings)
+        add_message(
+            f"Entity resolution timings ({plan.get('concurrency', 1)} connection(s), slowest {slowest:.3f}s, "
+            f"sum {sum(seconds for _, seconds, _ in timings):.3f}s): "
+            + ", ".join(f"{key} {'reused' if was_reused else f'{seconds:.3f}s'}" for key, seconds, was_reused in timings)
+            + "."
+        )
+
+    if (plan or {}).get("embedded"):
+        add_message(f"Embedded {plan['embedded']} entity value(s) in one batch for the vector searches.")
+
     for planned in (plan or {}).get("entities", []) or []:
         for text in planned.messages:
             add_message(text)
@@ -1379,6 +1826,39 @@ def apply_entity_resolutions(
     }
 
 
+async def aresolve_entities(
+    *,
+    connection,
+    entity_extraction,
+    sql_query,
+    justification,
+    answer="",
+    position_counter: int,
+    text_message_cls,
+    messages: list,
+    chromadb_collections_by_name: dict,
+    preplanned: dict | None = None,
+    embed=None,
+) -> dict[str, Any]:
+    """Async twin of :func:`resolve_entities`, planning the placeholders concurrently."""
+    plan = await aplan_entity_resolutions(
+        connection=connection,
+        entity_extraction=entity_extraction,
+        chromadb_collections_by_name=chromadb_collections_by_name,
+        preplanned=preplanned,
+        embed=embed,
+    )
+    return apply_entity_resolutions(
+        plan=plan,
+        sql_query=sql_query,
+        justification=justification,
+        answer=answer,
+        position_counter=position_counter,
+        text_message_cls=text_message_cls,
+        messages=messages,
+    )
+
+
 def resolve_entities(
     *,
     connection,
@@ -1390,6 +1870,8 @@ def resolve_entities(
     text_message_cls,
     messages: list,
     chromadb_collections_by_name: dict,
+    preplanned: dict | None = None,
+    embed=None,
 ) -> dict[str, Any]:
     """Resolve extracted entities into concrete SQL, justification and answer substitutions.
 
@@ -1400,6 +1882,8 @@ def resolve_entities(
         connection=connection,
         entity_extraction=entity_extraction,
         chromadb_collections_by_name=chromadb_collections_by_name,
+        preplanned=preplanned,
+        embed=embed,
     )
     return apply_entity_resolutions(
         plan=plan,
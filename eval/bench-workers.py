@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Memory and throughput of a running API, for comparing API_WORKERS settings.
+
+Run the API with API_WORKERS=1, 2, 4 and 8 in turn, and run this script against
+each. It prints one markdown row per run, the row the README's "Multi-worker
+serving" table expects:
+
+  workers | parent USS | worker USS (avg) | total PSS | total RSS | req/s | p50 | p95
+
+Memory comes from psutil's smaps-based counters for the parent and all of its
+children. USS is what each process owns alone, and PSS charges each shared page
+to every process that maps it, in proportion. Copy-on-write sharing of the
+BK-trees therefore shows up as a worker USS far below the parent's, and a total
+PSS far below N times a single-process RSS. Plain RSS counts shared pages once
+per process, which is why a sum of RSS overstates pre-fork memory. It is still
+printed for comparison.
+
+Throughput is measured by posting the same cached questions over and over,
+`--concurrency` at a time, for `--duration` seconds. Cached questions skip the LLM,
+so the number reflects the server, not the provider. Use `--path /movies/550
+--method GET` to load a detail endpoint instead.
+
+Usage:
+  uv run eval/bench-workers.py --pid $(pgrep -of "python ./main.py")
+  uv run eval/bench-workers.py --pid 1234 --concurrency 32 --duration 60
+  uv run eval/bench-workers.py --pid 1234 --method GET --path /movies/550
+
+Reads API_KEYS and API_PORT_BLUE from the repository .env, like the rest of the stack.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+import psutil
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_QUESTIONS = [
+    "Movies with Humphrey Bogart",
+    "Films directed by Akira Kurosawa",
+    "TV series created by David Simon",
+    "Best rated movies of 1994",
+]
+
+
+def memory_snapshot(parent_pid: int) -> dict:
+    """USS/PSS/RSS in MiB for the parent process and each of its children."""
+    parent = psutil.Process(parent_pid)
+    procs = [parent] + parent.children(recursive=True)
+    rows = []
+    for proc in procs:
+        try:
+            info = proc.memory_full_info()
+        except psutil.Error:
+            continue
+        rows.append({
+            "pid": proc.pid,
+            "uss": info.uss / 2**20,
+            "pss": getattr(info, "pss", 0) / 2**20,
+            "rss": info.rss / 2**20,
+        })
+    workers = [r for r in rows if r["pid"] != parent_pid]
+    parent_row = next((r for r in rows if r["pid"] == parent_pid), {"uss": 0.0, "pss": 0.0, "rss": 0.0})
+    return {
+        "workers": max(1, len(workers)),
+        "parent_uss": parent_row["uss"],
+        "worker_uss_avg": statistics.mean(r["uss"] for r in workers) if workers else parent_row["uss"],
+        "total_pss": sum(r["pss"] for r in rows),
+        "total_rss": sum(r["rss"] for r in rows),
+    }
+
+
+async def load(base_url: str, api_key: str, method: str, path: str, concurrency: int, duration: float) -> dict:
+    """Keep `concurrency` requests in flight for `duration` seconds; return rate and latency."""
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    headers = {"X-API-Key": api_key}
+
+    async def worker(client: httpx.AsyncClient, worker_index: int) -> None:
+        nonlocal errors
+        i = worker_index
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                if method == "GET":
+                    resp = await client.get(path, headers=headers)
+                else:
+                    question = DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)]
+                    resp = await client.post(path, headers=headers, json={"question": question})
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+            except httpx.HTTPError:
+                errors += 1
+            i += 1
+
+    t_start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await asyncio.gather(*(worker(client, k) for k in range(concurrency)))
+    elapsed = time.perf_counter() - t_start
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, required=True, help="PID of the API parent process")
+    parser.add_argument("--base-url", default=f"http://127.0.0.1:{os.getenv('API_PORT_BLUE', '8000')}")
+    parser.add_argument("--api-key", default=(os.getenv("API_KEYS") or os.getenv("API_KEY", "")).split(",")[0].strip())
+    parser.add_argument("--method", choices=["GET", "POST"], default="POST")
+    parser.add_argument("--path", default="/search/text2sql")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    before = memory_snapshot(args.pid)
+    result = asyncio.run(load(args.base_url, args.api_key, args.method, args.path, args.concurrency, args.duration))
+    after = memory_snapshot(args.pid)
+
+    print(f"memory before load: {before}")
+    print(f"memory after load:  {after}")
+    print(f"load: {result}")
+    print()
+    print("| workers | parent USS (MiB) | worker USS avg (MiB) | total PSS (MiB) | total RSS (MiB) | req/s | p50 (s) | p95 (s) |")
+    print("|---|---|---|---|---|---|---|---|")
+    print(
+        f"| {after['workers']} | {after['parent_uss']:.0f} | {after['worker_uss_avg']:.0f} | {after['total_pss']:.0f} "
+        f"| {after['total_rss']:.0f} | {result['rps']:.1f} | {result['p50']:.3f} | {result['p95']:.3f} |"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -624,6 +624,8 @@ try:
                                     "complex_question_processing": True,
                                     "complex_question_already_resolved": False,
                                     "ui_language": strevallang,
+                                    # Queue behind interactive traffic when a provider is saturated.
+                                    "priority": "batch",
                                 }
                                 print(url)
                                 print(payload)
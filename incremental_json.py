@@ -0,0 +1,124 @@
+"""Incremental parser for the top-level JSON object of a streamed LLM reply.
+
+Entity extraction answers with one flat object, ``{"question": ..., "Person_name1":
+..., ...}``. When that reply is streamed, :class:`ObjectPairParser` is fed the text
+deltas as they arrive and hands back each top-level ``(key, value)`` pair as soon
+as the pair is complete, so the caller can start working on it before the model
+has finished writing the rest.
+
+The parser is deliberately lenient about what surrounds the object (a Markdown
+code fence, a leading sentence): it skips everything before the first ``{`` and
+stops at the matching ``}``. Values are decoded with :class:`json.JSONDecoder`,
+so nested objects, arrays and escaped strings behave exactly as with
+``json.loads``. A bare number is only accepted once a ``,``, ``}`` or whitespace
+follows it (``"19"`` may still become ``"1999"``, ``"1"`` may become ``"1.5"``).
+Malformed input never raises: the parser just stops emitting pairs, and the
+caller validates the full reply as before.
+"""
+
+from __future__ import annotations
+
+import json
+
+
+_WHITESPACE = " \t\r\n"
+_NUMBER_END = ",}" + _WHITESPACE
+
+
+class ObjectPairParser:
+    """Emits the completed top-level pairs of a JSON object fed in fragments."""
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        # seek_object -> key -> colon -> value -> separator -> key ... -> done / failed
+        self._state = "seek_object"
+        self._key = None
+
+    @property
+    def done(self) -> bool:
+        """True once the closing brace was read (or the input stopped being parsable)."""
+        return self._state in {"done", "failed"}
+
+    def feed(self, delta: str) -> list:
+        """Append ``delta`` and return the ``(key, value)`` pairs it completed, in order."""
+        if self.done or not delta:
+            return []
+        self._buffer += delta
+        pairs = []
+        while not self.done:
+            pair = self._step()
+            if pair is False:
+                break
+            if pair is not None:
+                pairs.append(pair)
+        return pairs
+
+    def _skip_whitespace(self) -> bool:
+        """Advance past whitespace; False when the buffer ran out."""
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+            self._pos += 1
+        return self._pos < len(self._buffer)
+
+    def _step(self):
+        """Consume one token; return a completed pair, None to continue, False to wait for input."""
+        if self._state == "seek_object":
+            start = self._buffer.find("{", self._pos)
+            if start < 0:
+                self._pos = len(self._buffer)
+                return False
+            self._pos = start + 1
+            self._state = "key"
+            return None
+
+        if not self._skip_whitespace():
+            return False
+        char = self._buffer[self._pos]
+
+        if self._state == "key":
+            if char == "}":
+                self._state = "done"
+                return None
+            if char != '"':
+                self._state = "failed"
+                return None
+            try:
+                self._key, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                return False
+            self._state = "colon"
+            return None
+
+        if self._state == "colon":
+            if char != ":":
+                self._state = "failed"
+                return None
+            self._pos += 1
+            self._state = "value"
+            return None
+
+        if self._state == "value":
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                return False
+            # A number is only complete once a delimiter follows it: "1" may still
+            # become "1.5", "1e3" or "19".
+            if (char == "-" or char.isdigit()) and (end >= len(self._buffer) or self._buffer[end] not in _NUMBER_END):
+                return False
+            self._pos = end
+            self._state = "separator"
+            return (self._key, value)
+
+        # separator
+        if char == ",":
+            self._pos += 1
+            self._state = "key"
+            return None
+        if char == "}":
+            self._pos += 1
+            self._state = "done"
+            return None
+        self._state = "failed"
+        return None
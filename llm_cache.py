@@ -0,0 +1,271 @@
+"""Deterministic response cache for temperature-0 LLM calls.
+
+Entity extraction, text-to-SQL, answer-entity classification and the
+complex-question steps all run at temperature 0, and their inputs recur all the
+time: a retried request, an eval run, the ``en``/``fr`` variants of one question
+(the extraction prompts do not depend on ``ui_language``), a version bump that
+left a prompt untouched. This cache sits in front of ``_call_chat_llm`` and
+``_acall_chat_llm`` and answers those repeats without calling the provider.
+
+- **Key.** SHA-256 over (provider, normalized model, hash of the system prompt,
+  hash of the rendered user prompt, temperature). Only temperature-0 calls are
+  cached; anything sampled is passed through.
+- **Memory tier.** An LRU within ``LLM_CACHE_MEMORY_BYTES``.
+- **Disk tier.** A SQLite file (``LLM_CACHE_DISK_PATH``, WAL mode) within
+  ``LLM_CACHE_DISK_BYTES``, evicting least recently used rows first. It survives
+  restarts and deploys and is shared by pre-forked workers. A disk hit is
+  promoted to memory.
+- **Expiry.** Entries older than ``LLM_CACHE_TTL`` seconds are ignored and
+  dropped in both tiers.
+- **Validation.** A reply is only stored once the caller's parser and
+  guardrails accepted it, and a cached reply they reject is dropped again with
+  ``discard``, so a malformed answer is never replayed.
+- **Invalidation.** When ``data_watcher`` reloads a prompt with new content,
+  the prompt's owner calls ``invalidate(labels)`` and every entry recorded under
+  those ``cache_label`` values is dropped. The keys already change with the
+  prompt, so this only frees space early.
+
+Per-label hit/miss counters are in ``stats()``, and each call reports its outcome
+in the response ``messages`` (see ``text2sql._call_chat_llm``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_BYTES = int(float(os.getenv("LLM_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024))))
+# Empty disables the disk tier.
+LLM_CACHE_DISK_PATH = os.getenv(
+    "LLM_CACHE_DISK_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "llm_cache.sqlite3"),
+).strip()
+LLM_CACHE_DISK_BYTES = int(float(os.getenv("LLM_CACHE_DISK_BYTES", str(256 * 1024 * 1024))))
+
+_lock = threading.Lock()
+# key -> (label, text, created_at)
+_memory: "OrderedDict[str, tuple[str, str, float]]" = OrderedDict()
+_memory_bytes = 0
+_counters: dict[str, dict[str, int]] = {}
+
+_disk_lock = threading.Lock()
+_disk_conn: Optional[sqlite3.Connection] = None
+_disk_pid: Optional[int] = None
+_disk_failed = False
+_disk_writes_since_trim = 0
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_key(*, provider: str, model: str, system_prompt: str, user_prompt: str, temperature: float) -> Optional[str]:
+    """Cache key of one call, or None when the call is not cacheable (temperature > 0 or disabled)."""
+    if not LLM_CACHE_ENABLED or float(temperature) != 0.0:
+        return None
+    payload = json.dumps([provider, model, _sha(system_prompt), _sha(user_prompt), float(temperature)])
+    return _sha(payload)
+
+
+def _count(label: str, outcome: str) -> None:
+    with _lock:
+        bucket = _counters.setdefault(label, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "rejected": 0})
+        bucket[outcome] += 1
+
+
+def _expired(created_at: float, now: float) -> bool:
+    return LLM_CACHE_TTL > 0 and now - created_at > LLM_CACHE_TTL
+
+
+def _memory_put(key: str, label: str, text: str, created_at: float) -> None:
+    """Insert into the memory tier and evict LRU entries over budget; caller holds ``_lock``."""
+    global _memory_bytes
+    size = len(text.encode("utf-8"))
+    if size > LLM_CACHE_MEMORY_BYTES:
+        return
+    old = _memory.pop(key, None)
+    if old is not None:
+        _memory_bytes -= len(old[1].encode("utf-8"))
+    _memory[key] = (label, text, created_at)
+    _memory_bytes += size
+    while _memory_bytes > LLM_CACHE_MEMORY_BYTES and _memory:
+        _, (_, evicted, _) = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted.encode("utf-8"))
+
+
+def _disk() -> Optional[sqlite3.Connection]:
+    """This process's SQLite connection, opened (and the table created) on first use."""
+    global _disk_conn, _disk_pid, _disk_failed
+    if not LLM_CACHE_DISK_PATH or _disk_failed:
+        return None
+    pid = os.getpid()
+    if _disk_conn is not None and _disk_pid == pid:
+        return _disk_conn
+    try:
+        os.makedirs(os.path.dirname(LLM_CACHE_DISK_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_DISK_PATH, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, label TEXT NOT NULL, response TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_label ON llm_cache (label)")
+    except Exception as exc:
+        _disk_failed = True
+        print(f"[llm-cache] Disk tier disabled, cannot open {LLM_CACHE_DISK_PATH}: {exc}", flush=True)
+        return None
+    _disk_conn, _disk_pid = conn, pid
+    return conn
+
+
+def get(key: Optional[str], label: str) -> tuple[Optional[str], str]:
+    """Look ``key`` up; return ``(text, tier)`` with tier "memory", "disk" or "miss".
+
+    Blocking when it reaches the disk tier (a SQLite read).
+    """
+    if key is None:
+        return None, "miss"
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None and _expired(entry[2], now):
+            _memory.pop(key, None)
+            entry = None
+        if entry is not None:
+            _memory.move_to_end(key)
+    if entry is not None:
+        _count(label, "memory_hits")
+        return entry[1], "memory"
+
+    conn = _disk()
+    if conn is not None:
+        try:
+            with _disk_lock:
+                row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and _expired(row[1], now):
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as exc:
+            print(f"[llm-cache] Disk read failed: {exc}", flush=True)
+            row = None
+        if row is not None:
+            with _lock:
+                _memory_put(key, label, row[0], row[1])
+            _count(label, "disk_hits")
+            return row[0], "disk"
+
+    _count(label, "misses")
+    return None, "miss"
+
+
+def put(key: Optional[str], label: str, text: str) -> None:
+    """Store a successful response in both tiers (blocking: a SQLite write)."""
+    global _disk_writes_since_trim
+    if key is None or not text:
+        return
+    now = time.time()
+    with _lock:
+        _memory_put(key, label, text, now)
+    _count(label, "stores")
+    conn = _disk()
+    if conn is None:
+        return
+    try:
+        with _disk_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, label, response, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, label, text, len(text.encode("utf-8")), now, now),
+            )
+            _disk_writes_since_trim += 1
+            if _disk_writes_since_trim >= 100:
+                _disk_writes_since_trim = 0
+                _trim_disk(conn, now)
+    except sqlite3.Error as exc:
+        print(f"[llm-cache] Disk write failed: {exc}", flush=True)
+
+
+def discard(key: Optional[str], label: str) -> None:
+    """Drop one entry from both tiers (a cached reply that no longer validates)."""
+    global _memory_bytes
+    if key is None:
+        return
+    with _lock:
+        old = _memory.pop(key, None)
+        if old is not None:
+            _memory_bytes -= len(old[1].encode("utf-8"))
+    _count(label, "rejected")
+    conn = _disk()
+    if conn is None:
+        return
+    try:
+        with _disk_lock:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+    except sqlite3.Error as exc:
+        print(f"[llm-cache] Disk delete failed: {exc}", flush=True)
+
+
+def _trim_disk(conn: sqlite3.Connection, now: float) -> None:
+    """Drop expired rows, then least recently used rows until the budget fits; caller holds ``_disk_lock``."""
+    if LLM_CACHE_TTL > 0:
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - LLM_CACHE_TTL,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+    if total <= LLM_CACHE_DISK_BYTES:
+        return
+    excess = total - LLM_CACHE_DISK_BYTES
+    freed = 0
+    victims = []
+    for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used_at"):
+        victims.append((key,))
+        freed += size
+        if freed >= excess:
+            break
+    conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+
+
+def invalidate(labels) -> None:
+    """Drop every entry recorded under one of ``labels`` (after a prompt reload)."""
+    global _memory_bytes
+    labels = set(labels)
+    with _lock:
+        for key in [k for k, (label, _, _) in _memory.items() if label in labels]:
+            _, text, _ = _memory.pop(key)
+            _memory_bytes -= len(text.encode("utf-8"))
+    conn = _disk()
+    if conn is not None:
+        try:
+            with _disk_lock:
+                conn.executemany("DELETE FROM llm_cache WHERE label = ?", [(label,) for label in labels])
+        except sqlite3.Error as exc:
+            print(f"[llm-cache] Disk invalidation failed: {exc}", flush=True)
+    print(f"[llm-cache] Invalidated entries for {', '.join(sorted(labels))}.", flush=True)
+
+
+def stats() -> dict:
+    """Settings, memory occupancy and per-label counters since process start."""
+    with _lock:
+        labels = {label: dict(bucket) for label, bucket in _counters.items()}
+        entries, size = len(_memory), _memory_bytes
+    return {
+        "enabled": LLM_CACHE_ENABLED,
+        "ttl": LLM_CACHE_TTL,
+        "memory_entries": entries,
+        "memory_bytes": size,
+        "memory_max_bytes": LLM_CACHE_MEMORY_BYTES,
+        "disk_path": LLM_CACHE_DISK_PATH if not _disk_failed else None,
+        "disk_max_bytes": LLM_CACHE_DISK_BYTES,
+        "labels": labels,
+    }
@@ -0,0 +1,315 @@
+"""Long-lived, pooled LLM provider clients.
+
+``text2sql._call_chat_llm`` used to build a fresh SDK client on every call
+(``openai.OpenAI(...)``, ``anthropic.Anthropic(...)``, ``genai.Client(...)``).
+Each client brings its own httpx connection pool, so every LLM step of every
+request opened a new TCP connection and paid a TLS handshake to the provider.
+That is 3-5 handshakes per uncached question (both extraction halves,
+text-to-SQL, classification, the complex retry).
+
+This module keeps one client per (provider, endpoint, credential, process),
+and one async client per event loop on top (``async_*_client``, for
+``text2sql._acall_chat_llm``):
+
+- Clients are created lazily on first use and reused by every later call. A
+  different credential for the same provider and endpoint builds a new client
+  and replaces the old one, so rotating a key takes effect immediately. The
+  process id is part of the key, so a pre-forked worker never reuses a pool
+  whose sockets belong to its parent.
+- All of them share the same httpx limits: ``LLM_HTTP_MAX_CONNECTIONS``
+  connections per client, ``LLM_HTTP_MAX_KEEPALIVE`` of them kept alive for up
+  to ``LLM_HTTP_KEEPALIVE_EXPIRY`` seconds between calls.
+- The transport records httpcore's connection events. Process-wide counters
+  (requests, new TCP connections, TLS handshakes, reused connections) are in
+  ``stats()``. ``observe()`` collects the same events for the calls made inside
+  it, so ``_call_chat_llm`` can report per step whether it reused a warm
+  connection or paid for a handshake, and how long that took.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+import httpx
+
+
+LLM_HTTP_MAX_CONNECTIONS = max(1, int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")))
+LLM_HTTP_MAX_KEEPALIVE = max(0, int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+_clients_lock = threading.Lock()
+# (provider, endpoint, flavor, pid) -> (credential fingerprint, client); flavor is
+# "sync" or "async:<event loop id>" (an async pool must stay on the loop it was made on).
+_clients: dict[tuple, tuple[str, Any]] = {}
+
+_counters_lock = threading.Lock()
+_counters: dict[str, dict[str, float]] = {}
+
+# Connection events of the LLM call(s) currently being observed (see observe()).
+_observation: "contextvars.ContextVar[Optional[dict]]" = contextvars.ContextVar("llm_http_observation", default=None)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _bump(provider: str, key: str, amount: float = 1) -> None:
+    with _counters_lock:
+        bucket = _counters.setdefault(provider, {"requests": 0, "connections": 0, "tls_handshakes": 0, "connect_time": 0.0})
+        bucket[key] += amount
+
+
+def _on_trace_event(provider: str, name: str, started: dict) -> None:
+    """Turn httpcore trace events into counters and the current observation."""
+    if name.endswith(".started"):
+        started[name[: -len(".started")]] = time.perf_counter()
+        return
+    if not name.endswith(".complete"):
+        return
+    step = name[: -len(".complete")]
+    elapsed = time.perf_counter() - started.pop(step, time.perf_counter())
+    observation = _observation.get()
+    if step == "connection.connect_tcp":
+        _bump(provider, "connections")
+        _bump(provider, "connect_time", elapsed)
+        if observation is not None:
+            observation["connections"] += 1
+            observation["tcp_time"] += elapsed
+    elif step == "connection.start_tls":
+        _bump(provider, "tls_handshakes")
+        _bump(provider, "connect_time", elapsed)
+        if observation is not None:
+            observation["tls_handshakes"] += 1
+            observation["tls_time"] += elapsed
+
+
+def _start_request(provider: str) -> None:
+    _bump(provider, "requests")
+    observation = _observation.get()
+    if observation is not None:
+        observation["requests"] += 1
+        observation["providers"].add(provider)
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that feeds httpcore's connection events into the counters."""
+
+    def __init__(self, provider: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._provider = provider
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _start_request(self._provider)
+        inner = request.extensions.get("trace")
+        started: dict = {}
+        provider = self._provider
+
+        def trace(name: str, info: dict) -> None:
+            _on_trace_event(provider, name, started)
+            if inner is not None:
+                inner(name, info)
+
+        request.extensions["trace"] = trace
+        return super().handle_request(request)
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    """Async twin of _CountingTransport (httpcore awaits async trace callbacks)."""
+
+    def __init__(self, provider: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._provider = provider
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _start_request(self._provider)
+        inner = request.extensions.get("trace")
+        started: dict = {}
+        provider = self._provider
+
+        async def trace(name: str, info: dict) -> None:
+            _on_trace_event(provider, name, started)
+            if inner is not None:
+                await inner(name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+
+def _async_http_client(provider: str) -> httpx.AsyncClient:
+    limits = _limits()
+    return httpx.AsyncClient(transport=_AsyncCountingTransport(provider, limits=limits), limits=limits, timeout=httpx.Timeout(600.0, connect=10.0))
+
+
+def _async_flavor() -> str:
+    return f"async:{id(asyncio.get_running_loop())}"
+
+
+def _http_client(provider: str) -> httpx.Client:
+    limits = _limits()
+    return httpx.Client(transport=_CountingTransport(provider, limits=limits), limits=limits, timeout=httpx.Timeout(600.0, connect=10.0))
+
+
+def _fingerprint(credential: Optional[str]) -> str:
+    return hashlib.sha256((credential or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _get_or_build(provider: str, endpoint: str, credential: Optional[str], build: Callable[[], Any], flavor: str = "sync") -> Any:
+    key = (provider, endpoint, flavor, os.getpid())
+    fingerprint = _fingerprint(credential)
+    cached = _clients.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    with _clients_lock:
+        cached = _clients.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        client = build()
+        if cached is not None:
+            print(f"[llm-http] Credential for {provider} ({endpoint}, {flavor}) changed; rebuilt its client.", flush=True)
+        _clients[key] = (fingerprint, client)
+        return client
+
+
+def openai_client(api_key: str, base_url: Optional[str] = None):
+    """Shared ``openai.OpenAI`` client for ``api_key`` (and ``base_url``, e.g. OpenRouter)."""
+    import openai
+
+    provider = "openrouter" if base_url and "openrouter" in base_url else "openai"
+
+    def build():
+        kwargs = {"api_key": api_key, "http_client": _http_client(provider)}
+        if base_url:
+            kwargs["base_url"] = base_url
+        return openai.OpenAI(**kwargs)
+
+    return _get_or_build(provider, base_url or "default", api_key, build)
+
+
+def anthropic_client(api_key: str):
+    """Shared ``anthropic.Anthropic`` client for ``api_key``."""
+    import anthropic
+
+    return _get_or_build(
+        "anthropic", "default", api_key,
+        lambda: anthropic.Anthropic(api_key=api_key, http_client=_http_client("anthropic")),
+    )
+
+
+def genai_client(api_key: str):
+    """Shared ``google.genai.Client`` for ``api_key``.
+
+    SDK releases that cannot take an httpx client keep their own pool: the client
+    is still reused, but its connections are not counted.
+    """
+    from google import genai
+    from google.genai import types as genai_types
+
+    def build():
+        try:
+            return genai.Client(api_key=api_key, http_options=genai_types.HttpOptions(httpx_client=_http_client("gemini")))
+        except Exception:
+            return genai.Client(api_key=api_key)
+
+    return _get_or_build("gemini", "default", api_key, build)
+
+
+def async_openai_client(api_key: str, base_url: Optional[str] = None):
+    """Shared ``openai.AsyncOpenAI`` client for ``api_key`` on the running event loop."""
+    import openai
+
+    provider = "openrouter" if base_url and "openrouter" in base_url else "openai"
+
+    def build():
+        kwargs = {"api_key": api_key, "http_client": _async_http_client(provider)}
+        if base_url:
+            kwargs["base_url"] = base_url
+        return openai.AsyncOpenAI(**kwargs)
+
+    return _get_or_build(provider, base_url or "default", api_key, build, flavor=_async_flavor())
+
+
+def async_anthropic_client(api_key: str):
+    """Shared ``anthropic.AsyncAnthropic`` client for ``api_key`` on the running event loop."""
+    import anthropic
+
+    return _get_or_build(
+        "anthropic", "default", api_key,
+        lambda: anthropic.AsyncAnthropic(api_key=api_key, http_client=_async_http_client("anthropic")),
+        flavor=_async_flavor(),
+    )
+
+
+def async_genai_client(api_key: str):
+    """Shared ``google.genai.Client`` whose ``.aio`` side runs on the running event loop."""
+    from google import genai
+    from google.genai import types as genai_types
+
+    def build():
+        try:
+            return genai.Client(api_key=api_key, http_options=genai_types.HttpOptions(httpx_async_client=_async_http_client("gemini")))
+        except Exception:
+            return genai.Client(api_key=api_key)
+
+    return _get_or_build("gemini", "default", api_key, build, flavor=_async_flavor())
+
+
+@contextlib.contextmanager
+def observe() -> Iterator[dict]:
+    """Collect the connection events of the LLM calls made inside the block (same context)."""
+    observation = {"requests": 0, "connections": 0, "tls_handshakes": 0, "tcp_time": 0.0, "tls_time": 0.0, "providers": set()}
+    token = _observation.set(observation)
+    try:
+        yield observation
+    finally:
+        _observation.reset(token)
+
+
+def describe(observation: dict) -> str:
+    """One-line summary of an observation, e.g. for a response message."""
+    requests = observation["requests"]
+    connections = observation["connections"]
+    if connections == 0:
+        return f"{requests} HTTP request(s) on reused keep-alive connection(s)"
+    text = (
+        f"{requests} HTTP request(s), {connections} new connection(s) "
+        f"(TCP {observation['tcp_time'] * 1000:.0f} ms"
+    )
+    if observation["tls_handshakes"]:
+        text += f", TLS {observation['tls_time'] * 1000:.0f} ms"
+    return text + ")"
+
+
+def stats() -> dict:
+    """Pool settings, live clients and per-provider connection counters since process start."""
+    with _counters_lock:
+        providers = {}
+        for provider, bucket in _counters.items():
+            providers[provider] = {
+                "requests": int(bucket["requests"]),
+                "connections": int(bucket["connections"]),
+                "tls_handshakes": int(bucket["tls_handshakes"]),
+                "reused": int(max(0, bucket["requests"] - bucket["connections"])),
+                "connect_time_total": round(bucket["connect_time"], 3),
+            }
+    pid = os.getpid()
+    return {
+        "max_connections": LLM_HTTP_MAX_CONNECTIONS,
+        "max_keepalive": LLM_HTTP_MAX_KEEPALIVE,
+        "keepalive_expiry": LLM_HTTP_KEEPALIVE_EXPIRY,
+        "clients": sorted(
+            f"{provider}:{endpoint}:{flavor.split(':')[0]}"
+            for provider, endpoint, flavor, client_pid in _clients if client_pid == pid
+        ),
+        "providers": providers,
+    }
@@ -0,0 +1,378 @@
+"""Latency hedging and quota failover for the pipeline's LLM steps.
+
+Each LLM step is bound to one model, so a slow provider costs the request its
+full tail latency, and a 429 ends the step with an error. This module gives every
+step (keyed by its ``cache_label``) an optional backup policy, read from
+``data/llm_hedging.json`` and hot-reloaded through ``data_watcher``:
+
+- **Hedging (async path).** When the primary call has not produced an answer
+  after the step's hedge delay, a backup call to a second model is fired, and
+  the first *valid* result wins. Valid means it parsed and passed
+  ``json_guardrails``, as judged by the step's own parser. The loser is
+  cancelled, which cancels its HTTP request. The hedge delay is the step's
+  rolling ``hedge_percentile`` latency (default p90) over the last
+  ``LLM_HEDGING_WINDOW`` primary calls, clamped to
+  [``min_delay_seconds``, ``max_delay_seconds``]. Until ``min_samples`` calls
+  have been seen, ``initial_delay_seconds`` applies. Only the provider round trip
+  is sampled (``text2sql`` wraps it in :func:`provider_call`): answers served by
+  the LLM response cache and time spent queueing for a scheduler slot would
+  otherwise drag the delay down to its floor and fire a backup on most calls.
+- **Failover (both paths).** A quota or rate-limit error from the primary
+  (HTTP 429, ``RESOURCE_EXHAUSTED``, ``RateLimitError``) fires the backup
+  immediately instead of waiting. So does a primary answer that fails
+  validation.
+
+Every hedged or failed-over call records a decision (primary and backup models,
+winner, reason, delay, elapsed time). ``text2sql`` turns it into a response
+message, and ``drain_decisions()`` feeds the response's ``llm_hedging`` field.
+Per-step counters and the current hedge delays are in ``stats()``.
+``LLM_HEDGING_ENABLED`` (default off) is the global switch, since every hedge is
+a second paid call and needs the backup provider's key.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+import data_watcher
+
+
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "0").strip().lower() in {"1", "true", "yes", "on"}
+LLM_HEDGING_WINDOW = max(1, int(os.getenv("LLM_HEDGING_WINDOW", "200")))
+
+strhedgingconfigfile = "llm_hedging.json"
+
+_DEFAULT_POLICY = {
+    "backup_models": [],
+    "hedge_percentile": 90,
+    "initial_delay_seconds": 8.0,
+    "min_delay_seconds": 1.0,
+    "max_delay_seconds": 30.0,
+    "min_samples": 20,
+    "failover_on_quota": True,
+}
+
+HEDGING_CONFIG: dict[str, dict] = {}
+
+_lock = threading.Lock()
+# (step, model) -> recent latencies of that model on that step, in seconds
+_latencies: dict[tuple[str, str], deque] = {}
+_counters: dict[str, dict[str, int]] = {}
+
+_decisions: "contextvars.ContextVar[Optional[list]]" = contextvars.ContextVar("llm_hedging_decisions", default=None)
+# The latency sample of the attempt running in this context: {"started", "seconds"}.
+_attempt_sample: "contextvars.ContextVar[Optional[dict]]" = contextvars.ContextVar("llm_hedging_attempt_sample", default=None)
+
+
+def _validate_hedging_config(parsed) -> dict:
+    if not isinstance(parsed, dict):
+        raise ValueError("llm_hedging.json must be an object keyed by pipeline step")
+    config = {}
+    for step, policy in parsed.items():
+        if step.startswith("_"):
+            continue
+        if not isinstance(policy, dict):
+            raise ValueError(f"policy for '{step}' must be an object")
+        merged = {**_DEFAULT_POLICY, **policy}
+        if not isinstance(merged["backup_models"], list) or not all(isinstance(m, str) for m in merged["backup_models"]):
+            raise ValueError(f"backup_models for '{step}' must be a list of model names")
+        if not 0 < float(merged["hedge_percentile"]) <= 100:
+            raise ValueError(f"hedge_percentile for '{step}' must be in (0, 100]")
+        config[step] = merged
+    return config
+
+
+def _on_hedging_config_change(content: str) -> None:
+    global HEDGING_CONFIG
+    try:
+        HEDGING_CONFIG = _validate_hedging_config(json.loads(content))
+    except Exception as e:
+        # Keep the previous valid config rather than crashing the running app.
+        print(f"[llm-hedging] Failed to reload {strhedgingconfigfile}, keeping previous config: {e}", flush=True)
+
+
+data_watcher.register(strhedgingconfigfile, _on_hedging_config_change)
+
+
+def backup_model(step: str, primary_model: str) -> Optional[str]:
+    """The backup model for ``step`` when ``primary_model`` is used, or None when the step is not hedged."""
+    if not LLM_HEDGING_ENABLED:
+        return None
+    policy = HEDGING_CONFIG.get(step)
+    if not policy:
+        return None
+    for model in policy["backup_models"]:
+        if model.strip() and model.strip() != primary_model:
+            return model.strip()
+    return None
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def hedge_delay(step: str, model: str) -> float:
+    """Seconds to wait on the primary before firing the backup."""
+    policy = HEDGING_CONFIG.get(step, _DEFAULT_POLICY)
+    with _lock:
+        samples = list(_latencies.get((step, model), ()))
+    if len(samples) < int(policy["min_samples"]):
+        delay = float(policy["initial_delay_seconds"])
+    else:
+        delay = _percentile(samples, float(policy["hedge_percentile"]))
+    return min(max(delay, float(policy["min_delay_seconds"])), float(policy["max_delay_seconds"]))
+
+
+def record_latency(step: str, model: str, seconds: float) -> None:
+    with _lock:
+        _latencies.setdefault((step, model), deque(maxlen=LLM_HEDGING_WINDOW)).append(seconds)
+
+
+@contextlib.contextmanager
+def provider_call() -> Iterator[None]:
+    """Time the provider round trip of the current hedged attempt as its latency sample.
+
+    Entered by the chat calls once they hold a scheduler slot; a no-op outside an attempt.
+    """
+    sample = _attempt_sample.get()
+    if sample is None:
+        yield
+        return
+    sample["started"] = time.monotonic()
+    try:
+        yield
+    finally:
+        sample["seconds"] = time.monotonic() - sample["started"]
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    """True for provider quota / rate-limit errors (what the API reports as error_code 429)."""
+    if getattr(exc, "status_code", None) == 429 or getattr(exc, "code", None) == 429:
+        return True
+    if type(exc).__name__ in {"RateLimitError", "ResourceExhausted"}:
+        return True
+    text = str(exc).upper()
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "RATE_LIMIT" in text or "QUOTA EXCEEDED" in text
+
+
+def _count(step: str, key: str) -> None:
+    with _lock:
+        bucket = _counters.setdefault(step, {
+            "calls": 0, "primary_fast": 0, "hedged": 0, "failovers": 0,
+            "primary_wins": 0, "backup_wins": 0, "no_valid_result": 0,
+        })
+        bucket[key] += 1
+
+
+def _decide(step: str, decision: dict) -> dict:
+    _count(step, "primary_wins" if decision["winner"] == "primary" else "backup_wins" if decision["winner"] == "backup" else "no_valid_result")
+    decisions = _decisions.get()
+    if decisions is not None:
+        decisions.append(decision)
+    return decision
+
+
+def reset_decisions() -> None:
+    """Install a fresh, empty decision list for the current request."""
+    _decisions.set([])
+
+
+def drain_decisions() -> list:
+    """Return the decisions recorded for the current request and clear the list."""
+    decisions = _decisions.get()
+    if not decisions:
+        return []
+    _decisions.set([])
+    return decisions
+
+
+def describe(decision: dict) -> str:
+    """One-line summary of a decision for the response messages."""
+    reason = {
+        "slow": f"primary exceeded the {decision['hedge_delay']:.1f}s hedge delay",
+        "quota": "primary hit a quota / rate limit",
+        "primary_invalid": "primary returned invalid JSON",
+    }.get(decision["reason"], decision["reason"])
+    winner = decision["winner"]
+    winner_text = (
+        f"{decision['winner_model']} ({winner}) answered" if winner in {"primary", "backup"}
+        else "no valid answer from either model"
+    )
+    return (
+        f"LLM hedging ({decision['step']}): {reason}; backup {decision['backup_model']} fired, "
+        f"{winner_text} in {decision['elapsed']:.2f}s."
+    )
+
+
+def _decision(step, primary_model, backup, reason, delay, winner, started) -> dict:
+    return {
+        "step": step,
+        "primary_model": primary_model,
+        "backup_model": backup,
+        "reason": reason,
+        "hedge_delay": round(delay, 3),
+        "winner": winner,
+        "winner_model": primary_model if winner == "primary" else backup if winner == "backup" else None,
+        "elapsed": round(time.monotonic() - started, 3),
+    }
+
+
+async def race(
+    step: str,
+    primary_model: str,
+    attempt: Callable[[str], Awaitable[Any]],
+    accept: Callable[[Any], bool],
+) -> tuple[Any, Optional[dict]]:
+    """Run ``attempt(primary_model)``, hedged and failed over per the step's policy.
+
+    Args:
+        step: Pipeline step (``cache_label``) whose policy applies.
+        primary_model: The model the request asked for.
+        attempt: Coroutine function running the step on one model and returning
+            its parsed result (raising on provider errors).
+        accept: True when a parsed result is valid.
+
+    Returns:
+        ``(result, decision)``. ``decision`` is None when the primary answered
+        validly before the hedge delay (or the step is not hedged). Without a
+        valid answer the primary's result is returned if it had one, else the
+        backup's; when neither produced one the primary's error is raised.
+    """
+    backup = backup_model(step, primary_model)
+    if backup is None:
+        return await attempt(primary_model), None
+
+    _count(step, "calls")
+    started = time.monotonic()
+    delay = hedge_delay(step, primary_model)
+    primary = asyncio.ensure_future(_timed(step, primary_model, attempt))
+    tasks = {primary: "primary"}
+    try:
+        await asyncio.wait({primary}, timeout=delay)
+        if primary.done():
+            exc = primary.exception()
+            if exc is None and accept(primary.result()):
+                _count(step, "primary_fast")
+                return primary.result(), None
+            if exc is not None and not (HEDGING_CONFIG[step]["failover_on_quota"] and is_quota_error(exc)):
+                raise exc
+            reason = "primary_invalid" if exc is None else "quota"
+            _count(step, "failovers")
+        else:
+            reason = "slow"
+            _count(step, "hedged")
+        print(f"[llm-hedging] {step}: firing backup {backup} ({reason}).", flush=True)
+        tasks[asyncio.ensure_future(_timed(step, backup, attempt))] = "backup"
+
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task, role in tasks.items():
+                if task.done() and not task.cancelled() and task.exception() is None and accept(task.result()):
+                    return task.result(), _decide(step, _decision(step, primary_model, backup, reason, delay, role, started))
+
+        decision = _decide(step, _decision(step, primary_model, backup, reason, delay, None, started))
+        for task in tasks:
+            if task.exception() is None:
+                return task.result(), decision
+        raise primary.exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # Retrieve what the losers raised so asyncio does not warn about it.
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()
+
+
+async def _timed(step: str, model: str, attempt: Callable[[str], Awaitable[Any]]) -> Any:
+    # Runs as its own task, so the sample is private to this attempt.
+    sample = {"started": None, "seconds": None}
+    _attempt_sample.set(sample)
+    try:
+        result = await attempt(model)
+    except asyncio.CancelledError:
+        # A slow provider call cancelled after running past the hedge delay still tells us
+        # the latency was at least this long; one cancelled early (a losing backup) does not.
+        if sample["started"] is not None:
+            elapsed = time.monotonic() - sample["started"]
+            if elapsed >= hedge_delay(step, model):
+                record_latency(step, model, elapsed)
+        raise
+    if sample["seconds"] is not None:
+        record_latency(step, model, sample["seconds"])
+    return result
+
+
+def _timed_blocking(step: str, model: str, attempt: Callable[[str], Any]) -> Any:
+    sample = {"started": None, "seconds": None}
+    token = _attempt_sample.set(sample)
+    try:
+        result = attempt(model)
+    finally:
+        _attempt_sample.reset(token)
+    if sample["seconds"] is not None:
+        record_latency(step, model, sample["seconds"])
+    return result
+
+
+def failover(
+    step: str,
+    primary_model: str,
+    attempt: Callable[[str], Any],
+    accept: Callable[[Any], bool],
+) -> tuple[Any, Optional[dict]]:
+    """Blocking counterpart of ``race`` without the hedge: only quota / invalid failover."""
+    backup = backup_model(step, primary_model)
+    if backup is None:
+        return attempt(primary_model), None
+
+    _count(step, "calls")
+    started = time.monotonic()
+    try:
+        result = _timed_blocking(step, primary_model, attempt)
+    except Exception as exc:
+        if not (HEDGING_CONFIG[step]["failover_on_quota"] and is_quota_error(exc)):
+            raise
+        reason, result = "quota", None
+    else:
+        if accept(result):
+            _count(step, "primary_fast")
+            return result, None
+        reason = "primary_invalid"
+    _count(step, "failovers")
+    print(f"[llm-hedging] {step}: failing over to {backup} ({reason}).", flush=True)
+    backup_result = attempt(backup)
+    if accept(backup_result):
+        return backup_result, _decide(step, _decision(step, primary_model, backup, reason, 0.0, "backup", started))
+    decision = _decide(step, _decision(step, primary_model, backup, reason, 0.0, None, started))
+    return (result if result is not None else backup_result), decision
+
+
+def stats() -> dict:
+    """Switch, per-step counters and the hedge delay currently applied to each observed model."""
+    with _lock:
+        counters = {step: dict(bucket) for step, bucket in _counters.items()}
+        observed = {key: len(samples) for key, samples in _latencies.items()}
+    delays = {
+        f"{step}:{model}": {"samples": count, "hedge_delay": round(hedge_delay(step, model), 3)}
+        for (step, model), count in observed.items()
+    }
+    return {
+        "enabled": LLM_HEDGING_ENABLED,
+        "steps": {step: policy["backup_models"] for step, policy in HEDGING_CONFIG.items()},
+        "counters": counters,
+        "delays": delays,
+    }
@@ -0,0 +1,394 @@
+"""Central admission scheduler for LLM provider calls.
+
+Nothing used to bound how many calls went to a provider at once. A burst (an
+eval run, a few busy clients) ran straight into provider 429s, and the clients
+then retried blindly. Every provider dispatch in ``text2sql._call_chat_llm`` /
+``_acall_chat_llm`` (after the response cache, so cache hits never queue) now
+holds a slot from this scheduler:
+
+- **Concurrency caps.** At most ``LLM_MAX_CONCURRENCY`` calls in flight per
+  provider and ``LLM_MAX_CONCURRENCY_PER_MODEL`` per model. The provider cap is
+  adaptive (AIMD): it is halved on a rate-limit error and grows back by about
+  one slot per cap's worth of successful calls.
+- **Token buckets.** Optional per-provider limits on requests per minute
+  (``LLM_RPM``) and estimated tokens per minute (``LLM_TPM``). A call's tokens
+  are estimated as prompt characters / 4 plus ``LLM_OUTPUT_TOKENS_ESTIMATE``.
+- **Priority queue.** Waiters are admitted in (priority, arrival) order:
+  ``interactive`` (``/search`` requests) before ``batch`` (eval traffic, which
+  sends ``"priority": "batch"``). A waiter whose model is at its own cap does
+  not block waiters for other models of the same provider.
+- **Backoff.** A rate-limit error pauses the provider for its ``retry-after``
+  hint (response header or the "retry in Ns" text in the error). Without a hint,
+  the pause is ``LLM_BACKOFF_INITIAL`` seconds, doubled on each consecutive 429
+  up to ``LLM_BACKOFF_MAX``.
+
+Each of the caps and rates can be set per provider with a suffix, e.g.
+``LLM_RPM_GEMINI=15`` or ``LLM_MAX_CONCURRENCY_ANTHROPIC=8``. Waiting honours
+the request deadline. The time a request spent queued is summed per request
+(``reset_queue_wait`` / ``queue_wait``) and reported as ``llm_queue_wait_time``.
+State is per process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from typing import AsyncIterator, Iterator, Optional
+
+import deadline
+
+
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "500"))
+LLM_BACKOFF_INITIAL = float(os.getenv("LLM_BACKOFF_INITIAL", "2"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_RETRY_AFTER_PATTERNS = [
+    r"Please retry in\s+([0-9]+(?:\.[0-9]+)?)s",
+    r"retryDelay['\"]?\s*[:=]\s*['\"]?([0-9]+(?:\.[0-9]+)?)s",
+    r"retry after\s+([0-9]+(?:\.[0-9]+)?)",
+]
+
+_lock = threading.Lock()
+_sequence = itertools.count()
+_providers: dict[str, "_Provider"] = {}
+
+_priority: "contextvars.ContextVar[str]" = contextvars.ContextVar("llm_priority", default="interactive")
+_queue_wait: "contextvars.ContextVar[Optional[dict]]" = contextvars.ContextVar("llm_queue_wait", default=None)
+
+
+def _setting(name: str, provider: str, default: str) -> float:
+    return float(os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default)))
+
+
+class _Bucket:
+    """Token bucket refilled continuously at ``per_minute`` / 60 per second (0 = unlimited)."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` is available (0 when it already is)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "model", "tokens", "granted", "abandoned", "event", "loop", "future", "enqueued_at")
+
+    def __init__(self, priority: int, model: str, tokens: float) -> None:
+        self.priority = priority
+        self.seq = next(_sequence)
+        self.model = model
+        self.tokens = tokens
+        self.granted = False
+        self.abandoned = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        elif self.loop is not None and self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Provider:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.max_concurrency = max(1, int(_setting("LLM_MAX_CONCURRENCY", name, "32")))
+        self.max_per_model = max(1, int(_setting("LLM_MAX_CONCURRENCY_PER_MODEL", name, "16")))
+        self.cap = float(self.max_concurrency)
+        self.requests = _Bucket(_setting("LLM_RPM", name, "0"))
+        self.tokens = _Bucket(_setting("LLM_TPM", name, "0"))
+        self.inflight = 0
+        self.inflight_by_model: dict[str, int] = {}
+        self.paused_until = 0.0
+        self.consecutive_429 = 0
+        self.queue: list[_Waiter] = []
+        self.counters = {"admitted": 0, "queued": 0, "rate_limited": 0, "wait_time": 0.0}
+
+    def pump(self, now: float) -> Optional[float]:
+        """Admit every waiter that fits, in priority order; caller holds ``_lock``.
+
+        Returns the seconds until a blocked waiter could be admitted without a
+        release (pause or bucket refill), or None when only a release can help.
+        """
+        retry_in: Optional[float] = None
+        if now < self.paused_until:
+            return self.paused_until - now
+        skipped = []
+        while self.queue and self.inflight < int(self.cap):
+            waiter = heapq.heappop(self.queue)
+            if waiter.abandoned:
+                continue
+            if self.inflight_by_model.get(waiter.model, 0) >= self.max_per_model:
+                skipped.append(waiter)
+                continue
+            wait = max(self.requests.wait_for(1, now), self.tokens.wait_for(waiter.tokens, now))
+            if wait > 0:
+                # Buckets are shared by the provider's models: later waiters must not overtake.
+                heapq.heappush(self.queue, waiter)
+                retry_in = wait
+                break
+            self._admit(waiter)
+            waiter.wake()
+        for waiter in skipped:
+            heapq.heappush(self.queue, waiter)
+        return retry_in
+
+    def _admit(self, waiter: _Waiter) -> None:
+        self.requests.take(1)
+        self.tokens.take(waiter.tokens)
+        self.inflight += 1
+        self.inflight_by_model[waiter.model] = self.inflight_by_model.get(waiter.model, 0) + 1
+        self.counters["admitted"] += 1
+        waiter.granted = True
+
+    def release(self, model: str) -> None:
+        self.inflight -= 1
+        self.inflight_by_model[model] -= 1
+
+    def on_success(self) -> None:
+        self.consecutive_429 = 0
+        self.cap = min(float(self.max_concurrency), self.cap + 1.0 / max(self.cap, 1.0))
+
+    def on_rate_limit(self, retry_after: Optional[float], now: float) -> float:
+        self.consecutive_429 += 1
+        self.counters["rate_limited"] += 1
+        self.cap = max(1.0, self.cap / 2.0)
+        if retry_after is None:
+            retry_after = min(LLM_BACKOFF_MAX, LLM_BACKOFF_INITIAL * 2 ** (self.consecutive_429 - 1))
+        self.paused_until = max(self.paused_until, now + min(retry_after, LLM_BACKOFF_MAX))
+        return retry_after
+
+
+def _provider(name: str) -> _Provider:
+    state = _providers.get(name)
+    if state is None:
+        state = _providers[name] = _Provider(name)
+    return state
+
+
+def estimate_tokens(*texts: str) -> float:
+    return sum(len(text or "") for text in texts) / 4.0 + LLM_OUTPUT_TOKENS_ESTIMATE
+
+
+def set_priority(priority: str) -> None:
+    """Set the scheduling priority ("interactive" or "batch") for the current request context."""
+    _priority.set(priority if priority in PRIORITIES else "interactive")
+
+
+def reset_queue_wait() -> None:
+    """Install a fresh queue-wait accumulator for the current request."""
+    _queue_wait.set({"seconds": 0.0})
+
+
+def queue_wait() -> float:
+    """Seconds the current request has spent waiting for LLM slots so far."""
+    accumulator = _queue_wait.get()
+    return accumulator["seconds"] if accumulator is not None else 0.0
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    """The provider's retry-after hint carried by ``exc``, in seconds, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("retry-after")
+            if value is not None:
+                return float(value)
+        except (TypeError, ValueError):
+            pass
+    text = str(exc)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = re.search(pattern, text, flags=re.IGNORECASE)
+        if match:
+            try:
+                return float(match.group(1))
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def _is_rate_limit(exc: BaseException) -> bool:
+    if getattr(exc, "status_code", None) == 429 or getattr(exc, "code", None) == 429:
+        return True
+    if type(exc).__name__ in {"RateLimitError", "ResourceExhausted"}:
+        return True
+    text = str(exc).upper()
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "RATE_LIMIT" in text
+
+
+def _enqueue(provider: str, model: str, tokens: float) -> tuple[_Provider, _Waiter, Optional[float]]:
+    waiter = _Waiter(PRIORITIES[_priority.get()], model, tokens)
+    with _lock:
+        state = _provider(provider)
+        heapq.heappush(state.queue, waiter)
+        retry_in = state.pump(time.monotonic())
+        if not waiter.granted:
+            state.counters["queued"] += 1
+    return state, waiter, retry_in
+
+
+def _max_wait() -> Optional[float]:
+    left = deadline.remaining()
+    if left is not None and left <= 0:
+        raise deadline.DeadlineExceeded("deadline exceeded while waiting for an LLM slot")
+    return left
+
+
+def _abandon(state: _Provider, waiter: _Waiter) -> None:
+    with _lock:
+        waiter.abandoned = True
+        if waiter.granted:
+            state.release(waiter.model)
+            state.pump(time.monotonic())
+
+
+def _finish(state: _Provider, waiter: _Waiter, exc: Optional[BaseException], label: str) -> None:
+    with _lock:
+        now = time.monotonic()
+        state.release(waiter.model)
+        if exc is None:
+            state.on_success()
+        elif _is_rate_limit(exc):
+            pause = state.on_rate_limit(retry_after_of(exc), now)
+            print(
+                f"[llm-scheduler] {state.name} rate-limited ({label}); pausing {pause:.1f}s, "
+                f"concurrency cap now {int(state.cap)}.",
+                flush=True,
+            )
+        state.pump(now)
+
+
+def _waited(state: _Provider, waiter: _Waiter) -> float:
+    waited = time.monotonic() - waiter.enqueued_at
+    with _lock:
+        state.counters["wait_time"] += waited
+    accumulator = _queue_wait.get()
+    if accumulator is not None:
+        accumulator["seconds"] += waited
+    return waited
+
+
+@contextlib.contextmanager
+def slot(provider: str, model: str, tokens: float, label: str) -> Iterator[float]:
+    """Hold an admission slot for one blocking provider call; yields the seconds waited."""
+    if not LLM_SCHEDULER_ENABLED or not provider:
+        yield 0.0
+        return
+    state, waiter, retry_in = _enqueue(provider, model, tokens)
+    if not waiter.granted:
+        waiter.event = threading.Event()
+    try:
+        while not waiter.granted:
+            left = _max_wait()
+            timeout = min(x for x in (retry_in, left, 1.0) if x is not None)
+            waiter.event.wait(max(timeout, 0.01))
+            with _lock:
+                if not waiter.granted:
+                    retry_in = state.pump(time.monotonic())
+    except BaseException:
+        _abandon(state, waiter)
+        raise
+    waited = _waited(state, waiter)
+    try:
+        yield waited
+    except BaseException as exc:
+        _finish(state, waiter, exc, label)
+        raise
+    _finish(state, waiter, None, label)
+
+
+@contextlib.asynccontextmanager
+async def aslot(provider: str, model: str, tokens: float, label: str) -> AsyncIterator[float]:
+    """Async twin of ``slot``: waiting suspends the task instead of blocking a thread."""
+    if not LLM_SCHEDULER_ENABLED or not provider:
+        yield 0.0
+        return
+    loop = asyncio.get_running_loop()
+    state, waiter, retry_in = _enqueue(provider, model, tokens)
+    try:
+        while not waiter.granted:
+            future = loop.create_future()
+            with _lock:
+                if waiter.granted:
+                    break
+                waiter.loop, waiter.future = loop, future
+            left = _max_wait()
+            timeout = min(x for x in (retry_in, left, 1.0) if x is not None)
+            try:
+                await asyncio.wait_for(future, max(timeout, 0.01))
+            except asyncio.TimeoutError:
+                pass
+            with _lock:
+                if not waiter.granted:
+                    retry_in = state.pump(time.monotonic())
+    except BaseException:
+        _abandon(state, waiter)
+        raise
+    waited = _waited(state, waiter)
+    try:
+        yield waited
+    except BaseException as exc:
+        _finish(state, waiter, exc, label)
+        raise
+    _finish(state, waiter, None, label)
+
+
+def stats() -> dict:
+    """Per-provider caps, occupancy, queue length, pause and counters since process start."""
+    now = time.monotonic()
+    with _lock:
+        providers = {
+            name: {
+                "concurrency_cap": int(state.cap),
+                "max_concurrency": state.max_concurrency,
+                "max_per_model": state.max_per_model,
+                "rpm": state.requests.capacity or None,
+                "tpm": state.tokens.capacity or None,
+                "inflight": state.inflight,
+                "queued_now": sum(1 for w in state.queue if not w.abandoned),
+                "paused_for": round(max(0.0, state.paused_until - now), 3),
+                "admitted": state.counters["admitted"],
+                "queued": state.counters["queued"],
+                "rate_limited": state.counters["rate_limited"],
+                "wait_time_total": round(state.counters["wait_time"], 3),
+            }
+            for name, state in _providers.items()
+        }
+    return {"enabled": LLM_SCHEDULER_ENABLED, "providers": providers}
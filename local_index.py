@@ -0,0 +1,300 @@
+"""In-process exact vector index for the small ChromaDB collections.
+
+Collections such as ``deaths``, ``awards``, ``nominations`` or ``movements`` hold
+at most tens of thousands of vectors, yet every entity lookup against them paid
+an HTTP round trip to the ChromaDB server. An embeddings strategy in
+``entity_resolution.json`` can now opt in with ``"local_index"``:
+
+- ``true`` or an object with optional ``dtype`` (``"float32"``, the default, or
+  ``"float16"`` to halve the memory at some CPU cost), ``space`` (overrides the
+  collection's ``hnsw:space``) and ``max_vectors`` (overrides
+  ``LOCAL_VECTOR_INDEX_MAX_VECTORS``).
+- The collection's ids, documents, metadatas and embeddings are copied into a
+  NumPy matrix, in the background on first use (or at startup, see
+  :func:`warm_up`). Until the copy is ready, and for collections above the size
+  limit (``persons``, ``movies``), queries go to the server as before.
+- A query is an exact top-k over the whole matrix, with the distance of the
+  collection's space (``l2``: squared Euclidean, ``cosine``: 1 - cosine
+  similarity, ``ip``: 1 - inner product), so the distances and the
+  ``max_distance`` gates in the config keep their meaning. ``where`` filters
+  (``{"year": {"$gte": ..., "$lte": ...}}``, ``$eq``, ``$ne``, ``$in``, ``$nin``,
+  ``$and``, ``$or``) are evaluated locally; an operator this module does not
+  know sends the query to the server.
+- The copy is refreshed in the background every ``LOCAL_VECTOR_INDEX_REFRESH``
+  seconds, and queries are served from the previous copy meanwhile.
+
+The index is per process. Built before the fork (``API_WORKERS`` > 1), its
+matrices are shared copy-on-write by the workers. ``stats()`` lists each
+collection's state, size and local/remote query counts.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "1").strip().lower() in {"1", "true", "yes", "on"}
+LOCAL_VECTOR_INDEX_MAX_VECTORS = int(os.getenv("LOCAL_VECTOR_INDEX_MAX_VECTORS", "50000"))
+LOCAL_VECTOR_INDEX_REFRESH = float(os.getenv("LOCAL_VECTOR_INDEX_REFRESH", "3600"))
+
+_PAGE_SIZE = 1000
+# Rows up-cast at once when the matrix is float16.
+_CHUNK_ROWS = 8192
+
+_lock = threading.Lock()
+# collection name -> {"index", "loading_pid", "checked_at", "too_large", "error", "local", "remote"}
+_states: dict[str, dict] = {}
+_embed: Optional[Callable[[list], list]] = None
+
+
+def set_embedding_function(embed: Callable[[list], list]) -> None:
+    """Embedding function for queries that arrive as text (the collections' own)."""
+    global _embed
+    _embed = embed
+
+
+def settings(value) -> Optional[dict]:
+    """The ``local_index`` value of a strategy as a settings dict, or None when not enabled."""
+    if value is True:
+        return {}
+    if isinstance(value, dict):
+        return value
+    return None
+
+
+class _Index:
+    """One collection's vectors, ready for exact search."""
+
+    def __init__(self, ids: list, documents: list, metadatas: list, matrix: np.ndarray, space: str):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.space = space
+        if space == "cosine":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix).astype(np.float32) if space == "l2" else None
+        self.matrix = matrix
+        self.loaded_at = time.monotonic()
+        self._numeric_fields: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _dot(self, vector: np.ndarray) -> np.ndarray:
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ vector
+        return np.concatenate([
+            self.matrix[start:start + _CHUNK_ROWS].astype(np.float32) @ vector
+            for start in range(0, len(self.ids), _CHUNK_ROWS)
+        ]) if len(self.ids) else np.empty(0, dtype=np.float32)
+
+    def distances(self, vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.space == "cosine":
+            norm = float(np.linalg.norm(vector))
+            return 1.0 - self._dot(vector / (norm or 1.0))
+        if self.space == "ip":
+            return 1.0 - self._dot(vector)
+        return self.sq_norms - 2.0 * self._dot(vector) + float(vector @ vector)
+
+    def _numeric(self, field: str) -> np.ndarray:
+        values = self._numeric_fields.get(field)
+        if values is None:
+            values = np.array([
+                float(m[field]) if isinstance(m, dict) and isinstance(m.get(field), (int, float)) and not isinstance(m.get(field), bool) else np.nan
+                for m in self.metadatas
+            ], dtype=np.float64)
+            self._numeric_fields[field] = values
+        return values
+
+    def _values(self, field: str) -> list:
+        return [m.get(field) if isinstance(m, dict) else None for m in self.metadatas]
+
+    def mask(self, where: dict) -> np.ndarray:
+        """Rows matching a ChromaDB ``where`` filter; ValueError for an unsupported operator."""
+        result = np.ones(len(self.ids), dtype=bool)
+        for field, condition in where.items():
+            if field in ("$and", "$or"):
+                masks = [self.mask(clause) for clause in condition]
+                combined = np.logical_and.reduce(masks) if field == "$and" else np.logical_or.reduce(masks)
+                result &= combined
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    values = self._numeric(field)
+                    with np.errstate(invalid="ignore"):
+                        result &= {"$gt": values > operand, "$gte": values >= operand, "$lt": values < operand, "$lte": values <= operand}[op]
+                elif op in ("$eq", "$ne", "$in", "$nin"):
+                    operands = operand if op in ("$in", "$nin") else [operand]
+                    present = np.fromiter((value in operands for value in self._values(field)), dtype=bool, count=len(self.ids))
+                    result &= present if op in ("$eq", "$in") else ~present
+                else:
+                    raise ValueError(f"unsupported where operator {op}")
+        return result
+
+    def query(self, vector, n_results: int, where: Optional[dict]) -> dict:
+        distances = self.distances(vector)
+        if where:
+            distances = np.where(self.mask(where), distances, np.inf)
+        candidates = int(np.count_nonzero(np.isfinite(distances)))
+        k = min(n_results, candidates)
+        if k <= 0:
+            top = np.empty(0, dtype=np.int64)
+        else:
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top], kind="stable")]
+        return {
+            "ids": [[self.ids[i] for i in top]],
+            "documents": [[self.documents[i] for i in top]],
+            "metadatas": [[self.metadatas[i] for i in top]],
+            "distances": [[float(distances[i]) for i in top]],
+        }
+
+
+def _space(collection, spec: dict) -> str:
+    space = spec.get("space") or (getattr(collection, "metadata", None) or {}).get("hnsw:space") or "l2"
+    return str(space).lower()
+
+
+def _load(name: str, collection, spec: dict) -> None:
+    """Copy ``collection`` into a new index (blocking); the previous one serves meanwhile."""
+    started = time.perf_counter()
+    state = _states[name]
+    max_vectors = int(spec.get("max_vectors") or LOCAL_VECTOR_INDEX_MAX_VECTORS)
+    try:
+        count = collection.count()
+        if count > max_vectors:
+            with _lock:
+                state.update(index=None, too_large=True, error=None, checked_at=time.monotonic())
+            print(f"[local-index] {name}: {count} vectors exceed {max_vectors}, queries stay on the server.", flush=True)
+            return
+        ids, documents, metadatas, blocks = [], [], [], []
+        dtype = np.float16 if str(spec.get("dtype", "float32")).lower() == "float16" else np.float32
+        for offset in range(0, max(count, 1), _PAGE_SIZE):
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=_PAGE_SIZE, offset=offset)
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            ids.extend(page_ids)
+            documents.extend(page.get("documents") or [None] * len(page_ids))
+            metadatas.extend(page.get("metadatas") or [None] * len(page_ids))
+            blocks.append(np.asarray(page.get("embeddings"), dtype=np.float32))
+        matrix = np.vstack(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+        index = _Index(ids, documents, metadatas, matrix, _space(collection, spec))
+        if dtype is np.float16:
+            index.matrix = index.matrix.astype(np.float16)
+        with _lock:
+            state.update(index=index, too_large=False, error=None, checked_at=time.monotonic())
+        print(
+            f"[local-index] {name}: {len(ids)} vectors ({index.space}, {np.dtype(dtype).name}, "
+            f"{index.matrix.nbytes / 1e6:.0f} MB) loaded in {time.perf_counter() - started:.1f}s.",
+            flush=True,
+        )
+    except Exception as exc:
+        with _lock:
+            state.update(error=str(exc)[:200], checked_at=time.monotonic())
+        print(f"[local-index] {name}: load failed, queries stay on the server: {exc}", flush=True)
+    finally:
+        with _lock:
+            state["loading_pid"] = None
+
+
+def _state(name: str) -> dict:
+    return _states.setdefault(name, {"index": None, "loading_pid": None, "checked_at": None, "too_large": False, "error": None, "local": 0, "remote": 0})
+
+
+def _schedule(name: str, collection, spec: dict) -> None:
+    """Start a background (re)load unless one is running or the last attempt is recent."""
+    with _lock:
+        state = _state(name)
+        if state["loading_pid"] == os.getpid():
+            return
+        # A failed load is retried sooner than a successful one is refreshed.
+        interval = min(60.0, LOCAL_VECTOR_INDEX_REFRESH) if state["error"] else LOCAL_VECTOR_INDEX_REFRESH
+        if state["checked_at"] is not None and time.monotonic() - state["checked_at"] < interval:
+            return
+        state["loading_pid"] = os.getpid()
+    threading.Thread(target=_load, args=(name, collection, spec), name=f"local-index-{name}", daemon=True).start()
+
+
+def query(name: str, collection, spec: dict, *, query_input: dict, n_results: int, where: Optional[dict] = None) -> Optional[dict]:
+    """ChromaDB-shaped results from the local index, or None when the server must answer.
+
+    ``query_input`` is ``{"query_embeddings": [vector]}`` or ``{"query_texts": [text]}``
+    (embedded with the function given to :func:`set_embedding_function`).
+    """
+    if not LOCAL_VECTOR_INDEX:
+        return None
+    _schedule(name, collection, spec)
+    with _lock:
+        state = _state(name)
+        index = state["index"]
+    result = None
+    if index is not None:
+        try:
+            vectors = query_input.get("query_embeddings")
+            if vectors is None and _embed is not None:
+                vectors = _embed(list(query_input.get("query_texts") or []))
+            if vectors is not None and len(vectors) == 1 and len(np.asarray(vectors[0])) == index.matrix.shape[1]:
+                result = index.query(vectors[0], n_results, where)
+        except Exception as exc:
+            # Unsupported filter, embedding failure: the server answers instead.
+            print(f"[local-index] {name}: local query failed, using the server: {exc}", flush=True)
+            result = None
+    with _lock:
+        state["local" if result is not None else "remote"] += 1
+    return result
+
+
+def warm_up(collections_by_name: dict, specs: dict) -> None:
+    """Load the configured collections now (blocking), e.g. before the workers fork."""
+    if not LOCAL_VECTOR_INDEX:
+        return
+    for name, spec in specs.items():
+        collection = collections_by_name.get(name)
+        if collection is None:
+            continue
+        with _lock:
+            _state(name)["loading_pid"] = os.getpid()
+        _load(name, collection, spec)
+
+
+def retain(names) -> None:
+    """Forget the indexes of collections no longer configured (after a config reload)."""
+    names = set(names)
+    with _lock:
+        for name in [n for n in _states if n not in names]:
+            del _states[name]
+
+
+def stats() -> dict:
+    """Settings and, per collection, state, size and local/remote query counts."""
+    now = time.monotonic()
+    with _lock:
+        collections = {}
+        for name, state in _states.items():
+            index = state["index"]
+            collections[name] = {
+                "state": "ready" if index is not None else "too_large" if state["too_large"] else "error" if state["error"] else "loading",
+                "vectors": len(index) if index is not None else 0,
+                "bytes": index.matrix.nbytes if index is not None else 0,
+                "space": index.space if index is not None else None,
+                "age": round(now - index.loaded_at, 1) if index is not None else None,
+                "error": state["error"],
+                "local_queries": state["local"],
+                "remote_queries": state["remote"],
+            }
+    return {
+        "enabled": LOCAL_VECTOR_INDEX,
+        "max_vectors": LOCAL_VECTOR_INDEX_MAX_VECTORS,
+        "refresh": LOCAL_VECTOR_INDEX_REFRESH,
+        "collections": collections,
+    }
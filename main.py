@@ -1,7 +1,8 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 import asyncio
 from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 import httpx
 from fastmcp import FastMCP
@@ -28,6 +29,23 @@ import entity
 import logs
 import sql_cache
 import closed_vocab
+import data_watcher
+import db
+import prefork
+import sql_governor
+import deadline
+import llm_cache
+import llm_clients
+import llm_hedging
+import llm_scheduler
+import local_index
+import prompt_slicer
+import context_cache
+import embedding_cache
+import model_cascade
+import model_registry
+import result_cache
+import resolution_cache
 import samples_assertions as sa
 
 # Load environment variables from .env file
@@ -143,9 +161,16 @@ class OpenAIEmbeddingFunction:
         self.model = model
 
     def __call__(self, input):
-        """Generate embeddings for a list of texts using OpenAI's embedding model."""
+        """Generate embeddings for a list of texts using OpenAI's embedding model.
+
+        Texts already embedded by any worker are read from ``embedding_cache``.
+        """
+        return embedding_cache.embed(self.model, list(input), self._create_embeddings)
+
+    def _create_embeddings(self, texts):
+        """Call the OpenAI embeddings endpoint for ``texts`` (the cache misses)."""
         response = openai.embeddings.create(
-            input=input, # Ensure parameter name matches ChromaDB's expectations
+            input=texts, # Ensure parameter name matches ChromaDB's expectations
             model=self.model
         )
         # Convert to numpy arrays for ChromaDB compatibility
@@ -160,30 +185,21 @@ class OpenAIEmbeddingFunction:
         else:
             query_input = input
             
-        response = openai.embeddings.create(
-            input=query_input,
-            model=self.model
-        )
         # Return as a list of numpy arrays (same format as __call__ method)
-        embeddings = [item.embedding for item in response.data]
-        return [np.array(embedding) for embedding in embeddings]
+        return embedding_cache.embed(self.model, list(query_input), self._create_embeddings)
     
     def name(self):
         """Return the name of the embedding function for ChromaDB compatibility."""
         return f"openai_{self.model.replace('-', '_')}"
 
-# Initialize ChromaDB with persistent storage
-_chromadb_host = os.getenv("CHROMADB_HOST", "localhost")
-_chromadb_port = os.getenv("CHROMADB_PORT", 8000)
-print(f"[startup] Connecting to ChromaDB at {_chromadb_host}:{_chromadb_port}...", flush=True)
-_t0 = time.perf_counter()
-chroma_client = chromadb.HttpClient(host=_chromadb_host, port=_chromadb_port)
-print(f"[startup] ChromaDB connected in {time.perf_counter() - _t0:.2f}s.", flush=True)
-
 # Initialize ChromaDB with OpenAI's embedding function
 embedding_function = OpenAIEmbeddingFunction(model="text-embedding-3-large")
+local_index.set_embedding_function(embedding_function)
 print("[startup] OpenAI embedding function initialized (text-embedding-3-large).", flush=True)
 
+_chromadb_host = os.getenv("CHROMADB_HOST", "localhost")
+_chromadb_port = os.getenv("CHROMADB_PORT", 8000)
+
 # Create or load entity collections with the custom embedding function
 _collection_names = [
     "persons",
@@ -202,23 +218,40 @@ _collection_names = [
     "nominations",
     "movements",
 ]
-print(f"[startup] Creating/loading {len(_collection_names)} ChromaDB entity collections...", flush=True)
-_t0 = time.perf_counter()
-CHROMADB_COLLECTIONS_BY_NAME = {
-    name: chroma_client.get_or_create_collection(name=name, embedding_function=embedding_function)
-    for name in _collection_names
-}
-print(f"[startup] ChromaDB entity collections ready ({len(CHROMADB_COLLECTIONS_BY_NAME)}) in {time.perf_counter() - _t0:.2f}s.", flush=True)
-
 #Anonymized queries collection
 strentitycollection = "anonymizedqueries"
-print(f"[startup] Creating/loading {strentitycollection} cache collection...", flush=True)
-_t0 = time.perf_counter()
-anonymizedqueries = chroma_client.get_or_create_collection(
-    name=strentitycollection,
-    embedding_function=embedding_function  # Custom embedding model
-)
-print(f"[startup] {strentitycollection} collection ready in {time.perf_counter() - _t0:.2f}s.", flush=True)
+
+
+def _open_chromadb_collections() -> None:
+    """Connect to ChromaDB and (re)load every collection handle into the module globals.
+
+    Runs once at startup and again in every pre-forked worker (API_WORKERS > 1): the
+    HTTP client's pooled sockets must not be shared across processes.
+    """
+    global chroma_client, CHROMADB_COLLECTIONS_BY_NAME, anonymizedqueries
+    print(f"[startup] Connecting to ChromaDB at {_chromadb_host}:{_chromadb_port}...", flush=True)
+    _t0 = time.perf_counter()
+    chroma_client = chromadb.HttpClient(host=_chromadb_host, port=_chromadb_port)
+    print(f"[startup] ChromaDB connected in {time.perf_counter() - _t0:.2f}s.", flush=True)
+
+    print(f"[startup] Creating/loading {len(_collection_names)} ChromaDB entity collections...", flush=True)
+    _t0 = time.perf_counter()
+    CHROMADB_COLLECTIONS_BY_NAME = {
+        name: chroma_client.get_or_create_collection(name=name, embedding_function=embedding_function)
+        for name in _collection_names
+    }
+    print(f"[startup] ChromaDB entity collections ready ({len(CHROMADB_COLLECTIONS_BY_NAME)}) in {time.perf_counter() - _t0:.2f}s.", flush=True)
+
+    print(f"[startup] Creating/loading {strentitycollection} cache collection...", flush=True)
+    _t0 = time.perf_counter()
+    anonymizedqueries = chroma_client.get_or_create_collection(
+        name=strentitycollection,
+        embedding_function=embedding_function  # Custom embedding model
+    )
+    print(f"[startup] {strentitycollection} collection ready in {time.perf_counter() - _t0:.2f}s.", flush=True)
+
+
+_open_chromadb_collections()
 
 # By default, do not use embeddings-based question cache (read/write) for anonymized queries.
 USE_ANONYMIZEDQUERIES_EMBEDDINGS_CACHE = False
@@ -231,6 +264,17 @@ USE_ANONYMIZEDQUERIES_EMBEDDINGS_CACHE = False
 # the strictly sequential path (same results, no overlap).
 ENTITY_RESOLUTION_PARALLEL = os.getenv("ENTITY_RESOLUTION_PARALLEL", "1").strip().lower() in {"1", "true", "yes", "on"}
 
+# Same fork point for the answer-entity classifier: it reads only the original question,
+# so it runs while the SQL is being written and is joined where the guard needs it,
+# instead of costing a second LLM round trip after f_text2sql. Set
+# RESULT_ENTITY_PARALLEL=0 to classify after SQL generation, as before.
+RESULT_ENTITY_PARALLEL = os.getenv("RESULT_ENTITY_PARALLEL", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+# Pre-fork serving (see prefork.py). 1 (default): one uvicorn process, BK-trees warm up
+# in the background. >1: this process builds the BK-trees and closed vocabularies in the
+# foreground, then forks that many workers that share them copy-on-write.
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+
 
 def _mark_task_exception_retrieved(task) -> None:
     """Consume a background task's exception so an orphan never logs a bare warning.
@@ -242,6 +286,16 @@ def _mark_task_exception_retrieved(task) -> None:
     if not task.cancelled():
         task.exception()
 
+
+async def _timed_result_entity_classification(input_text: str):
+    """The answer-entity classification of the original question, and the seconds it took."""
+    start_time = time.time()
+    with deadline.stage("result_entity"):
+        expected_result_entity = await t2s.af_classify_result_entity(
+            input_text, list(_RESULT_ENTITY_SOURCES.keys()),
+        )
+    return expected_result_entity, time.time() - start_time
+
 if intcleanupenabled:
     if USE_ANONYMIZEDQUERIES_EMBEDDINGS_CACHE:
         print(f"[startup] Cleaning up {strentitycollection} embeddings for previous API versions...", flush=True)
@@ -277,32 +331,35 @@ mcp_app = mcp.http_app(stateless_http=True)
 app = FastAPI(title="Text2SQL API", version=strapiversion, description="Text2SQL API for text to SQL query conversion", lifespan=mcp_app.lifespan)
 
 def get_db_connection():
-    """Establish and return a database connection to MySQL.
-    
-    Reads database configuration from environment variables and creates
-    a PyMySQL connection with DictCursor for dictionary-based results.
-    
+    """Check out a MariaDB connection from the process-wide pool.
+
+    The pool (see ``db.py``) is bounded, pre-warmed and health-checked; the
+    returned connection uses DictCursor like before, and its ``close()`` hands it
+    back to the pool instead of tearing down the socket, so every existing
+    ``conn = get_db_connection() ... finally: conn.close()`` site works unchanged.
+
     Returns:
-        pymysql.Connection: Database connection object with DictCursor
-        
+        db.PooledConnection: Pooled database connection with DictCursor
+
     Raises:
-        pymysql.Error: If database connection fails
-        ValueError: If required environment variables are missing
+        pymysql.Error: If a new connection has to be opened and that fails
+        db.PoolTimeoutError: If the pool stays exhausted for DB_POOL_TIMEOUT seconds
     """
-    strdbhost = os.getenv('DB_HOST')
-    lngdbport = int(os.getenv('DB_PORT', 3306))
-    strdbuser = os.getenv('DB_USER')
-    strdbpassword = os.getenv('DB_PASSWORD')
-    strdbname = os.getenv('DB_NAME')
-
-    return pymysql.connect(
-        host=strdbhost,
-        port=lngdbport,
-        user=strdbuser,
-        password=strdbpassword,
-        database=strdbname,
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    return db.get_connection()
+
+
+def get_read_connection():
+    """Check out a connection for a pure read that may be served by a read replica.
+
+    Used for the LLM-generated SELECTs and the entity detail endpoints. Routes to a
+    healthy replica (DB_REPLICA_HOSTS, lag within DB_REPLICA_MAX_LAG) and falls back
+    to the primary pool otherwise. Anything that writes, or that must see a write
+    made moments ago (the SQL-cache paths), keeps using get_db_connection().
+
+    Returns:
+        db.PooledConnection: Pooled connection with DictCursor (replica or primary)
+    """
+    return db.get_read_connection()
 
 answer=42
 
@@ -311,8 +368,13 @@ _db_port = os.getenv('DB_PORT', 3306)
 _db_name = os.getenv('DB_NAME', '?')
 print(f"[startup] Connecting to MariaDB {_db_name} at {_db_host}:{_db_port}...", flush=True)
 _t0 = time.perf_counter()
+# Pre-warm the pool so the first requests after a deploy skip the handshake too.
+_pool_warmed = db.get_pool().warm()
 connection = get_db_connection()
-print(f"[startup] MariaDB connected in {time.perf_counter() - _t0:.2f}s.", flush=True)
+print(f"[startup] MariaDB connected in {time.perf_counter() - _t0:.2f}s (pool: {_pool_warmed} warm connection(s), max {db.DB_POOL_SIZE}).", flush=True)
+if db.DB_REPLICA_HOSTS:
+    print(f"[startup] Checking {len(db.DB_REPLICA_HOSTS)} read replica(s) (max lag {db.DB_REPLICA_MAX_LAG:.0f}s)...", flush=True)
+    db.start_replica_monitor()
 
 if intcleanupenabled:
     print("[startup] Cleaning up SQL cache for current API version...", flush=True)
@@ -324,12 +386,15 @@ print("[startup] Loading closed-vocabulary canonicals from DB (Status_name, Seri
 _t0 = time.perf_counter()
 closed_vocab.init(connection)
 print(f"[startup] Closed-vocabulary canonicals loaded in {time.perf_counter() - _t0:.2f}s.", flush=True)
+# Startup is done with it: hand the connection back so requests can reuse it.
+connection.close()
 
 # BK-tree warm-up runs in the BACKGROUND (FASTAPI-TEXT2SQL-145) so uvicorn serves
 # immediately instead of blocking for minutes on large person tables. The warm-up
 # thread uses its OWN DB connection; any RapidFuzz query that arrives before a tree is
 # ready lazy-builds it, and get_or_build_bktree makes that race-safe (built once).
-print("[startup] Starting RapidFuzz BK-tree warm-up in the background (API available immediately; first RapidFuzz query may lazy-build)...", flush=True)
+# The warm-up checks its connection out of the shared pool like any request; it holds
+# one slot for the duration of the build, so DB_POOL_SIZE should leave room for it.
 def _warm_bktrees_background():
     _t = time.perf_counter()
     conn_bg = None
@@ -345,7 +410,40 @@ def _warm_bktrees_background():
                 conn_bg.close()
             except Exception:
                 pass
-threading.Thread(target=_warm_bktrees_background, name="bktree-warmup", daemon=True).start()
+if API_WORKERS > 1:
+    # Pre-fork mode: the trees must exist BEFORE the fork so every worker inherits the
+    # same copy instead of each lazily building its own (API_WORKERS times the memory).
+    print(f"[startup] Building RapidFuzz BK-trees in the foreground before forking {API_WORKERS} workers...", flush=True)
+    _warm_bktrees_background()
+else:
+    print("[startup] Starting RapidFuzz BK-tree warm-up in the background (API available immediately; first RapidFuzz query may lazy-build)...", flush=True)
+    threading.Thread(target=_warm_bktrees_background, name="bktree-warmup", daemon=True).start()
+
+# Model registry warm-up (model_registry.py): probe which endpoint and concrete model
+# name serve the pipeline's models, so the first requests already skip dead paths.
+# Like the BK-trees, done before the fork in pre-fork mode so every worker inherits it.
+if model_registry.MODEL_REGISTRY_WARMUP:
+    _registry_models = [
+        entity.strentityextractionmodeldefault,
+        t2s.strtext2sqlmodeldefault,
+        t2s.strcomplexquestionmodeldefault,
+        *(model_cascade.MODEL_CASCADE_FAST_MODELS.values() if model_cascade.MODEL_CASCADE else []),
+        *model_registry.MODEL_REGISTRY_WARMUP_MODELS,
+    ]
+    if API_WORKERS > 1:
+        t2s.warm_model_registry(_registry_models)
+    else:
+        threading.Thread(target=t2s.warm_model_registry, args=(_registry_models,), name="model-registry-warmup", daemon=True).start()
+
+# Local vector indexes (local_index.py) for the collections whose embeddings strategy sets
+# "local_index" in entity_resolution.json. Loaded before the fork in pre-fork mode so the
+# workers share the matrices; otherwise in the background, queries using the server until then.
+_local_index_specs = entity.local_index_collections()
+if local_index.LOCAL_VECTOR_INDEX and _local_index_specs:
+    if API_WORKERS > 1:
+        local_index.warm_up(CHROMADB_COLLECTIONS_BY_NAME, _local_index_specs)
+    else:
+        threading.Thread(target=local_index.warm_up, args=(CHROMADB_COLLECTIONS_BY_NAME, _local_index_specs), name="local-index-warmup", daemon=True).start()
 
 print(f"[startup] Startup tasks complete in {time.perf_counter() - _startup_t0:.2f}s. Handing off to uvicorn.", flush=True)
 
@@ -994,6 +1092,22 @@ def _detect_bare_id(question):
     return None
 
 
+def _execute_fetchall(cursor, sql: str) -> list:
+    """Execute ``sql`` on ``cursor`` and return every row (blocking; run via db.run_db)."""
+    cursor.execute(sql)
+    return cursor.fetchall()
+
+
+def _hydrate_name_ambiguity_with_new_connection(name_ambiguity: dict) -> None:
+    """Run hydrate_name_ambiguity_candidates on a connection of its own (blocking; run via db.run_db)."""
+    conn = get_read_connection()
+    try:
+        with conn.cursor() as cursor:
+            hydrate_name_ambiguity_candidates(cursor, name_ambiguity)
+    finally:
+        conn.close()
+
+
 def _run_bare_id_fast_path(connection, kind, id_value, lngpage, lngrowsperpage):
     """Resolve a bare-id question with a direct indexed SQL lookup (no LLM).
 
@@ -1425,6 +1539,15 @@ class Text2SQLRequest(BaseModel):
     complex_question_processing: bool = False
     complex_question_already_resolved: bool = False
     ui_language: Optional[str] = "en"
+    # Opt-in NDJSON streaming (application/x-ndjson): a header record, one record per
+    # row read from a server-side cursor, then an end record. See _ndjson_records.
+    stream: bool = False
+    # Seconds the caller is prepared to wait; capped by TEXT2SQL_DEADLINE_MAX, defaults
+    # to TEXT2SQL_DEADLINE_DEFAULT. See deadline.py.
+    deadline_seconds: Optional[float] = None
+    # Scheduling priority of this request's LLM calls: "interactive" requests are admitted
+    # before "batch" ones (eval runs) when a provider is saturated. See llm_scheduler.py.
+    priority: Literal["interactive", "batch"] = "interactive"
 
     @field_validator("ui_language", mode="before")
     @classmethod
@@ -1473,6 +1596,11 @@ class Text2SQLResponse(BaseModel):
     entity_extraction_processing_time: float
     text2sql_processing_time: float
     result_entity_processing_time: float = 0.0
+    # Part of result_entity_processing_time the request actually waited for; lower when
+    # the classifier overlapped SQL generation (RESULT_ENTITY_PARALLEL).
+    result_entity_wait_time: float = 0.0
+    # Seconds this request's LLM calls spent queued for a provider slot (llm_scheduler.py).
+    llm_queue_wait_time: float = 0.0
     embeddings_processing_time: float
     embeddings_cache_search_time: float = 0.0
     query_execution_time: float
@@ -1491,6 +1619,16 @@ class Text2SQLResponse(BaseModel):
     llm_model_text2sql: str
     llm_model_complex: str
     complex_model_used: bool = False
+    # Execution-governor verdict for the SQL that ran (see sql_governor.py): verdict,
+    # estimated_rows, budget, plan, statement_time. None when no SQL was executed.
+    sql_governor: Optional[dict] = None
+    # One entry per LLM step whose backup model was fired (see llm_hedging.py): step,
+    # primary_model, backup_model, reason, hedge_delay, winner, winner_model, elapsed.
+    llm_hedging: Optional[List[dict]] = None
+    # Per cascaded step (see model_cascade.py): the tier ("fast" / "strong") and model
+    # that answered, and the escalation reason when the strong model was called.
+    # None when the cascade did not apply.
+    model_cascade: Optional[dict] = None
     ui_language: str = "en"
     api_version: str
     messages: List[TextMessage] = []
@@ -1517,12 +1655,294 @@ async def f_hello_world(api_key: str = Depends(get_api_key)):
         Returns: {"message": "hello world! The universal answer is 42"}
     """
     global answer
-    result = {"message": "hello world! The universal answer is " + str(answer), "bktrees_ready": entity.BKTREES_READY}
+    result = {"message": "hello world! The universal answer is " + str(answer), "bktrees_ready": entity.BKTREES_READY, "db_pool": db.pool_stats(), "db_executor": db.executor_stats(), "db_replicas": db.replica_stats(), "sql_governor": sql_governor.stats(), "result_cache": result_cache.stats(), "text2sql_coalescing": coalesce_stats(), "text2sql_deadline": deadline_stats(), "llm_http": llm_clients.stats(), "llm_cache": llm_cache.stats(), "llm_hedging": llm_hedging.stats(), "llm_scheduler": llm_scheduler.stats(), "text2sql_prompt_slicing": prompt_slicer.stats(), "prompt_cache": context_cache.stats(), "model_cascade": model_cascade.stats(), "model_registry": model_registry.stats(), "embedding_cache": embedding_cache.stats(), "entity_resolution_cache": resolution_cache.stats(), "local_vector_index": local_index.stats()}
     logs.log_usage("hello", result, strapiversion)
     return result
 
+# Rows fetched per round trip in streaming mode. Bounds memory: at most one batch is
+# held at a time, whatever rows_per_page asks for.
+STREAM_BATCH_ROWS = max(1, int(os.getenv("STREAM_BATCH_ROWS", "500")))
+
+
+class _StreamedResult:
+    """A finished pipeline response whose result set is still open on a server-side cursor.
+
+    ``response.result`` holds the first batch; ``cursor`` (SSDictCursor) holds the rest,
+    on ``connection``, which is released once the stream ends.
+    """
+
+    def __init__(self, response: Text2SQLResponse, cursor, connection) -> None:
+        self.response = response
+        self.cursor = cursor
+        self.connection = connection
+
+
+def _execute_fetchmany(cursor, sql: str, size: int) -> list:
+    """Execute ``sql`` on ``cursor`` and return up to ``size`` rows (blocking; run via db.run_db)."""
+    cursor.execute(sql)
+    return cursor.fetchmany(size)
+
+
+def _localize_batch_with_new_connection(query_results, ui_language: str) -> None:
+    """localize_search_results for one streamed batch, on a short-lived pooled connection.
+
+    The streaming connection is busy with its unbuffered result and cannot run the
+    localization lookups itself.
+    """
+    if ui_language == DEFAULT_UI_LANGUAGE or not query_results:
+        return
+    conn = get_read_connection()
+    try:
+        localize_search_results(query_results, ui_language, conn)
+    finally:
+        conn.close()
+
+
+def _ndjson_line(record: dict) -> bytes:
+    return (json.dumps(jsonable_encoder(record), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def _ndjson_records(result, ui_language: str):
+    """Yield the NDJSON reply for a pipeline result.
+
+    Records, one JSON object per line:
+      - ``{"type": "header", ...}``: every Text2SQLResponse field except ``result``
+        (SQL, entity, timings, messages), sent before any row.
+      - ``{"type": "row", "index": n, "data": {...}}``: one per result row.
+      - ``{"type": "end", "row_count": n, "stream_time": s}``.
+
+    For a _StreamedResult the rows beyond the first batch are read STREAM_BATCH_ROWS at
+    a time from the open server-side cursor, so memory stays bounded by one batch. If
+    the client goes away mid-stream, the connection is discarded rather than drained.
+    """
+    streamed = isinstance(result, _StreamedResult)
+    response = result.response if streamed else result
+    stream_start = time.time()
+    header = response.model_dump(exclude={"result"})
+    header["type"] = "header"
+    yield _ndjson_line(header)
+
+    row_count = 0
+    for item in response.result:
+        yield _ndjson_line({"type": "row", **item})
+        row_count += 1
+
+    if streamed:
+        completed = False
+        try:
+            while True:
+                raw_rows = await db.run_db(result.cursor.fetchmany, STREAM_BATCH_ROWS)
+                if not raw_rows:
+                    break
+                batch = [
+                    {"index": row_count + i, "data": {k: html.unescape(v) if isinstance(v, str) else v for k, v in record.items()}}
+                    for i, record in enumerate(raw_rows)
+                ]
+                await db.run_db(_localize_batch_with_new_connection, batch, ui_language)
+                for item in batch:
+                    yield _ndjson_line({"type": "row", **item})
+                row_count += len(batch)
+            completed = True
+        finally:
+            if completed:
+                await db.run_db(result.cursor.close)
+                await db.run_db(result.connection.close)
+            else:
+                # Closing an unfinished SSCursor would read every remaining row off the
+                # wire first; dropping the socket is immediate.
+                result.connection.discard()
+
+    yield _ndjson_line({"type": "end", "row_count": row_count, "stream_time": time.time() - stream_start})
+
+
+# Single-flight coalescing of identical concurrent /search/text2sql requests.
+TEXT2SQL_COALESCE = os.getenv("TEXT2SQL_COALESCE", "1").strip().lower() in {"1", "true", "yes", "on"}
+# How long a follower waits for the leader before running the pipeline itself.
+TEXT2SQL_COALESCE_WAIT = float(os.getenv("TEXT2SQL_COALESCE_WAIT", "120"))
+
+
+class _InFlight:
+    """The leader's pending result for one coalescing key, and how many followers await it."""
+
+    def __init__(self) -> None:
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.followers = 0
+        self.started_at = time.time()
+
+
+_inflight_requests: dict[str, _InFlight] = {}
+_coalesce_counters = {"leaders": 0, "followers": 0, "follower_timeouts": 0, "leader_failures": 0}
+
+
+def _coalesce_key(request: Text2SQLRequest) -> str:
+    """Key identical requests: every field that shapes the response, question whitespace/case-normalized."""
+    fields = request.model_dump(exclude={"stream", "deadline_seconds", "priority"})
+    if isinstance(fields.get("question"), str):
+        fields["question"] = " ".join(fields["question"].split()).casefold()
+    fields["ui_language"] = normalize_ui_language(fields.get("ui_language"))
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+async def _coalesced_pipeline(request: Text2SQLRequest, api_key: str, http_request: Request):
+    """Run the pipeline once per identical in-flight request (single flight).
+
+    The first request for a key (the leader) runs the pipeline; identical requests
+    arriving while it runs (followers) await its result instead and get a copy with
+    a message saying so. A follower that waits longer than TEXT2SQL_COALESCE_WAIT (or
+    its own deadline), or whose leader was cancelled or ran out of its deadline, runs
+    the pipeline itself. Any other leader exception is re-raised to its followers:
+    the same request would fail the same way. A leader whose client disconnects
+    keeps running while followers wait on it.
+    """
+    key = _coalesce_key(request)
+    inflight = _inflight_requests.get(key)
+    if inflight is None:
+        inflight = _InFlight()
+        _inflight_requests[key] = inflight
+        _coalesce_counters["leaders"] += 1
+        try:
+            result = await _guarded_pipeline(request, api_key, http_request, inflight=inflight)
+        except asyncio.CancelledError:
+            inflight.future.cancel()
+            raise
+        except BaseException as exc:
+            _coalesce_counters["leader_failures"] += 1
+            inflight.future.set_exception(exc)
+            # Mark it retrieved so a leader failure without followers is not logged as
+            # "exception was never retrieved".
+            inflight.future.exception()
+            raise
+        else:
+            inflight.future.set_result(result)
+            return result
+        finally:
+            if _inflight_requests.get(key) is inflight:
+                del _inflight_requests[key]
+
+    inflight.followers += 1
+    _coalesce_counters["followers"] += 1
+    wait_start = time.time()
+    wait_limit = TEXT2SQL_COALESCE_WAIT
+    left = deadline.remaining()
+    if left is not None:
+        wait_limit = max(0.0, min(wait_limit, left))
+    try:
+        leader_result = await asyncio.wait_for(asyncio.shield(inflight.future), timeout=wait_limit)
+    except asyncio.TimeoutError:
+        _coalesce_counters["follower_timeouts"] += 1
+        return await _guarded_pipeline(request, api_key, http_request)
+    except asyncio.CancelledError:
+        if not inflight.future.cancelled():
+            raise  # this follower itself was cancelled
+        return await _guarded_pipeline(request, api_key, http_request)
+    except HTTPException as leader_error:
+        if leader_error.status_code not in (499, 504):
+            raise
+        # The leader's own deadline or client ran out; this request has its own.
+        return await _guarded_pipeline(request, api_key, http_request)
+    finally:
+        inflight.followers -= 1
+
+    response = leader_result.model_copy(deep=True)
+    next_position = max((m.position for m in response.messages), default=0) + 1
+    response.messages.append(TextMessage(
+        position=next_position,
+        text=(
+            f"Request coalesced with an identical in-flight request: waited {time.time() - wait_start:.2f}s "
+            f"for its pipeline result instead of running the pipeline again."
+        )
+    ))
+    return response
+
+
+# Seconds between two checks of whether the client of a running pipeline disconnected.
+TEXT2SQL_DISCONNECT_POLL = float(os.getenv("TEXT2SQL_DISCONNECT_POLL", "1"))
+
+_deadline_counters = {"deadline_exceeded": 0, "client_disconnects": 0, "aborted_connections": 0}
+
+
+async def _watch_disconnect(http_request: Request, pipeline_task: asyncio.Task, inflight: Optional[_InFlight], disconnected: list) -> None:
+    """Cancel ``pipeline_task`` once the client is gone, unless coalesced followers still wait on it."""
+    while not pipeline_task.done():
+        await asyncio.sleep(TEXT2SQL_DISCONNECT_POLL)
+        if not await http_request.is_disconnected():
+            continue
+        if inflight is not None and inflight.followers > 0:
+            continue
+        disconnected.append(True)
+        pipeline_task.cancel()
+        return
+
+
+async def _guarded_pipeline(request: Text2SQLRequest, api_key: str, http_request: Request, inflight: Optional[_InFlight] = None):
+    """Run the pipeline under the request deadline, aborting it when the client disconnects.
+
+    The pipeline runs as its own task so it can be cancelled mid-stage: a blocking
+    LLM call in a worker thread cannot be interrupted, but its awaiting stage can,
+    and nothing after it (further LLM calls, execution, cache writes) runs. DB
+    connections the cancelled pipeline still holds are aborted, which also
+    interrupts a query in flight, so no pool slot is left behind.
+
+    Raises:
+        HTTPException 504: the deadline ran out.
+        HTTPException 499: the client disconnected (nobody reads this reply).
+    """
+    tracked = db.track_connections()
+    pipeline_task = asyncio.create_task(_search_text2sql_pipeline(request, api_key))
+    disconnected: list = []
+    watcher = asyncio.create_task(_watch_disconnect(http_request, pipeline_task, inflight, disconnected))
+    succeeded = False
+    try:
+        left = deadline.remaining()
+        done, _ = await asyncio.wait({pipeline_task}, timeout=None if left is None else max(left, 0.0))
+        if not done:
+            pipeline_task.cancel()
+            _deadline_counters["deadline_exceeded"] += 1
+            raise HTTPException(status_code=504, detail="Deadline exceeded: the text2sql pipeline did not finish within its budget.")
+        if pipeline_task.cancelled() and disconnected:
+            _deadline_counters["client_disconnects"] += 1
+            raise HTTPException(status_code=499, detail="Client disconnected; text2sql pipeline aborted.")
+        try:
+            result = pipeline_task.result()
+        except deadline.DeadlineExceeded as exc:
+            _deadline_counters["deadline_exceeded"] += 1
+            raise HTTPException(status_code=504, detail=f"Deadline exceeded: {exc}")
+        succeeded = True
+        return result
+    except asyncio.CancelledError:
+        pipeline_task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+        if not succeeded:
+            # A streamed result keeps its connection open on success; on any other
+            # outcome nothing will close what the pipeline still holds.
+            _deadline_counters["aborted_connections"] += db.abort_connections(tracked)
+
+
+def deadline_stats() -> dict:
+    """Deadline settings and counters since process start."""
+    return {
+        "default": deadline.TEXT2SQL_DEADLINE_DEFAULT,
+        "max": deadline.TEXT2SQL_DEADLINE_MAX,
+        "optional_min": deadline.TEXT2SQL_DEADLINE_OPTIONAL_MIN,
+        **_deadline_counters,
+    }
+
+
+def coalesce_stats() -> dict:
+    """Single-flight settings, keys currently in flight and counters since process start."""
+    return {
+        "enabled": TEXT2SQL_COALESCE,
+        "wait": TEXT2SQL_COALESCE_WAIT,
+        "in_flight": len(_inflight_requests),
+        "waiting_followers": sum(f.followers for f in _inflight_requests.values()),
+        **_coalesce_counters,
+    }
+
+
 @app.post("/search/text2sql", response_model=Text2SQLResponse)
-async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_api_key)):
+async def search_text2sql(request: Text2SQLRequest, http_request: Request, api_key: str = Depends(get_api_key)):
     """Convert a natural language question about cinema or TV into SQL, execute it, and return the result set.
 
     Covers the full entertainment database: movies, TV series, persons (actors, directors,
@@ -1590,7 +2010,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
               result_entity_processing_time, embeddings_processing_time,
               query_execution_time, total_processing_time: Latency breakdown in
               seconds. `result_entity_processing_time` is 0.0 when the
-              answer-entity classifier did not run (no SQL, or a text2sql error).
+              answer-entity classifier did not run (no SQL, or a text2sql error);
+              `result_entity_wait_time` is the part of it on the critical path.
             - ambiguous_question_for_text2sql: True when the question was too vague to
               produce a SQL query.
             - messages (list): Ordered processing-step messages for debugging.
@@ -1600,6 +2021,32 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     Raises:
         ValueError: If neither question nor question_hashed is provided.
         HTTPException 401: If the API key is invalid.
+
+    With ``stream: true`` the reply is NDJSON instead (see _ndjson_records): a header
+    record carrying every field above except ``result``, one ``row`` record per result
+    row read incrementally from a server-side cursor, then an ``end`` record.
+
+    ``deadline_seconds`` bounds the whole pipeline (capped server-side): every stage
+    gets a slice of it, optional stages are skipped when it runs low, and the request
+    fails with HTTP 504 once it is spent. A client disconnect aborts the pipeline.
+    """
+    deadline.start(deadline.resolve_budget(request.deadline_seconds))
+    llm_scheduler.set_priority(request.priority)
+    if request.stream or not TEXT2SQL_COALESCE:
+        result = await _guarded_pipeline(request, api_key, http_request)
+    else:
+        result = await _coalesced_pipeline(request, api_key, http_request)
+    if request.stream:
+        return StreamingResponse(_ndjson_records(result, normalize_ui_language(request.ui_language)), media_type="application/x-ndjson")
+    return result
+
+
+async def _search_text2sql_pipeline(request: Text2SQLRequest, api_key: str):
+    """Run the whole text-to-SQL pipeline for one request (the body of search_text2sql).
+
+    Returns a Text2SQLResponse, or a _StreamedResult when ``request.stream`` is set and
+    the result set is larger than the first streamed batch. The complex-question retry
+    re-enters here directly, never through the HTTP endpoint.
     """
     total_start_time = time.time()
     
@@ -1612,6 +2059,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     # the same context and must share the buffer so its LLM calls are captured too.
     if not getattr(request, "complex_question_already_resolved", False):
         t2s.reset_prompt_cache_events()
+        llm_hedging.reset_decisions()
+        llm_scheduler.reset_queue_wait()
 
     # Strip whitespace and carriage return characters from question if provided
     if request.question:
@@ -1635,7 +2084,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     lngrowsperpage = request.rows_per_page or lngrowsperpagedefault
 
     # Open database connection once at the start
-    connection = get_db_connection()
+    connection = await db.run_db(get_db_connection)
     print("Database connection established")
     
     # Initialize variables
@@ -1663,11 +2112,15 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     entity_extraction_processing_time = 0.0
     text2sql_processing_time = 0.0
     result_entity_processing_time = 0.0
+    result_entity_wait_time = 0.0
     embeddings_processing_time = 0.0
     embeddings_cache_search_time = 0.0
     query_execution_time = 0.0
     total_processing_time = 0.0
     sql_execution_failed = False
+    sql_governor_verdict = None
+    streaming_cursor = None
+    read_connection = None
     ambiguous_question_for_text2sql = 0
     complex_model_used = False
     strentityextractionmodel = entity.strentityextractionmodeldefault
@@ -1685,6 +2138,16 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     print("- Text2SQL model:", strtext2sqlmodel)
     print("- Complex question model:", strcomplexquestionmodel)
 
+    # Model cascade (model_cascade.py): steps left on their default model try the fast
+    # model first; strentityextractionmodel / strtext2sqlmodel stay the strong tier.
+    cascade_extraction_model = model_cascade.fast_model("entity_extraction", request.llm_model_entity_extraction)
+    cascade_text2sql_model = model_cascade.fast_model("text2sql", request.llm_model_text2sql)
+    model_cascade_tiers = {}
+    strentityextractionmodelused = cascade_extraction_model or strentityextractionmodel
+    strtext2sqlmodelused = cascade_text2sql_model or strtext2sqlmodel
+    if cascade_extraction_model or cascade_text2sql_model:
+        print("- Model cascade fast tier:", cascade_extraction_model, cascade_text2sql_model)
+
     # --- Bare-identifier fast path (FASTAPI-TEXT2SQL-137) ----------------------
     # When the whole question is just a self-identifying id (tt…/nm…/Q…), answer it
     # with a direct indexed SQL lookup and skip the entire LLM pipeline (entity
@@ -1704,7 +2167,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         position_counter += 1
 
         _fp_start = time.time()
-        _fp = _run_bare_id_fast_path(connection, _kind, _id_value, lngpage, lngrowsperpage)
+        _fp = await db.run_db(_run_bare_id_fast_path, connection, _kind, _id_value, lngpage, lngrowsperpage)
         query_execution_time = time.time() - _fp_start
         result_entity_fp = _fp["result_entity"]
         resolved_via = _fp.get("resolved_via")
@@ -1761,9 +2224,9 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
 
         # FASTAPI-TEXT2SQL-162 (post-process variant): localize movie/serie rows by
         # ui_language before closing the connection. No-op for English.
-        localize_search_results(fast_path_results, normalize_ui_language(request.ui_language), connection)
+        await db.run_db(localize_search_results, fast_path_results, normalize_ui_language(request.ui_language), connection)
         try:
-            connection.close()
+            await db.run_db(connection.close)
         except Exception:
             pass
 
@@ -1785,6 +2248,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             question_anonymized=None,
             entity_extraction_processing_time=0.0,
             text2sql_processing_time=0.0,
+            llm_queue_wait_time=llm_scheduler.queue_wait(),
             embeddings_processing_time=0.0,
             embeddings_cache_search_time=0.0,
             query_execution_time=query_execution_time,
@@ -1831,7 +2295,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 text="Searching cache by question hash."
             ))
             position_counter += 1
-            cache_result_exact = sql_cache.search_sql_cache_by_question_hash(
+            cache_result_exact = await db.run_db(
+                sql_cache.search_sql_cache_by_question_hash,
                 connection,
                 request.question_hashed,
                 strapiversionformatted,
@@ -1852,7 +2317,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 text="Searching cache by question text."
             ))
             position_counter += 1
-            cache_result_exact = sql_cache.search_sql_cache_by_question_text(
+            cache_result_exact = await db.run_db(
+                sql_cache.search_sql_cache_by_question_text,
                 connection,
                 request.question,
                 strapiversionformatted,
@@ -1926,6 +2392,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 is_retryable=False,
                 entity_extraction_processing_time=0.0,
                 text2sql_processing_time=0.0,
+                llm_queue_wait_time=llm_scheduler.queue_wait(),
                 embeddings_processing_time=0.0,
                 embeddings_cache_search_time=0.0,
                 query_execution_time=0.0,
@@ -1969,15 +2436,103 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         # the open types and one for the closed vocabularies, merged back together.
         entity_extraction_start_time = time.time()
         entity_extraction_split_notes = []
-        if entity.ENTITY_EXTRACTION_SPLIT:
-            entity_extraction = await asyncio.to_thread(
-                entity.f_entity_extraction_split,
-                input_text, strentityextractionmodel, entity_extraction_split_notes,
-            )
-        else:
-            entity_extraction = await asyncio.to_thread(
-                entity.f_entity_extraction, input_text, strentityextractionmodel,
-            )
+
+        # --- Speculative work while the extraction streams in -------------------
+        # With ENTITY_EXTRACTION_STREAMING, each placeholder is handed over as soon
+        # as its key/value pair is complete, and planned here (closed vocabularies,
+        # BK-tree, ChromaDB) while the model is still writing the rest; the
+        # anonymized-question cache lookup starts as soon as "question" is complete.
+        # One worker does this serially on the request connection, which sits idle
+        # during extraction, and it is always joined before the connection is used
+        # again. Placeholders whose search reads a year from other placeholders are
+        # left to the regular planning. The results are only used when the final
+        # payload still carries the same values.
+        speculative_preplanned = {}
+        speculative_anonymized_lookup = {}
+        speculative_counts = {"deferred": 0, "failed": 0}
+        speculative_queue = asyncio.Queue()
+
+        def _on_extraction_pair(key, value):
+            speculative_queue.put_nowait((key, value))
+
+        async def _speculative_worker():
+            while True:
+                item = await speculative_queue.get()
+                if item is None:
+                    return
+                key, value = item
+                if key == "question":
+                    if request.retrieve_from_cache and isinstance(value, str) and value:
+                        try:
+                            speculative_anonymized_lookup[value] = await db.run_db(
+                                sql_cache.search_sql_cache_by_question_text,
+                                connection,
+                                value,
+                                strapiversionformatted,
+                                ui_language=request.ui_language,
+                                is_anonymized=True,
+                            )
+                        except Exception as lookup_error:
+                            print(f"Early anonymized cache lookup failed: {str(lookup_error)}")
+                    continue
+                if entity.needs_full_extraction(key):
+                    speculative_counts["deferred"] += 1
+                    continue
+                try:
+                    speculative_preplanned[key] = (value, await db.run_db(
+                        entity.plan_entity,
+                        connection=connection,
+                        key=key,
+                        value=value,
+                        chromadb_collections_by_name=CHROMADB_COLLECTIONS_BY_NAME,
+                    ))
+                except Exception as planning_error:
+                    speculative_counts["failed"] += 1
+                    print(f"Speculative planning of {key} failed: {str(planning_error)}")
+
+        speculative_task = None
+        if entity.ENTITY_EXTRACTION_STREAMING:
+            speculative_task = asyncio.create_task(_speculative_worker())
+            speculative_task.add_done_callback(_mark_task_exception_retrieved)
+
+        async def _extract_entities(model):
+            with deadline.stage("entity_extraction"):
+                if entity.ENTITY_EXTRACTION_SPLIT:
+                    return await entity.af_entity_extraction_split(
+                        input_text, model, entity_extraction_split_notes,
+                        on_pair=_on_extraction_pair if speculative_task is not None else None,
+                    )
+                return await entity.af_entity_extraction(
+                    input_text, model,
+                    on_pair=_on_extraction_pair if speculative_task is not None else None,
+                )
+
+        try:
+            entity_extraction = await _extract_entities(strentityextractionmodelused)
+            if cascade_extraction_model is not None:
+                # Model cascade: an invalid fast answer is redone by the strong model.
+                # Plans made from the fast stream are reused only where the strong
+                # answer carries the same values.
+                cascade_escalation = model_cascade.needs_escalation("entity_extraction", entity_extraction)
+                if cascade_escalation is None:
+                    model_cascade_tiers["entity_extraction"] = model_cascade.tier("fast", cascade_extraction_model)
+                else:
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=f"Model cascade: entity extraction with fast model '{cascade_extraction_model}' failed ({cascade_escalation}); escalating to '{strentityextractionmodel}'."
+                    ))
+                    position_counter += 1
+                    entity_extraction_split_notes.clear()
+                    strentityextractionmodelused = strentityextractionmodel
+                    model_cascade_tiers["entity_extraction"] = model_cascade.tier("strong", strentityextractionmodel, model_cascade.INVALID_ANSWER)
+                    entity_extraction = await _extract_entities(strentityextractionmodelused)
+        finally:
+            if speculative_task is not None:
+                speculative_queue.put_nowait(None)
+                try:
+                    await speculative_task
+                except Exception as speculative_error:
+                    print(f"Speculative entity work failed: {str(speculative_error)}")
         print("Entity extraction:", entity_extraction)
         entity_extraction_end_time = time.time()
         entity_extraction_processing_time = entity_extraction_end_time - entity_extraction_start_time
@@ -1986,7 +2541,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         strentityextractionshape = "two concurrent prompts (open types + closed vocabularies)" if entity.ENTITY_EXTRACTION_SPLIT else "a single prompt"
         messages.append(TextMessage(
             position=position_counter,
-            text=f"Processed question with entity extraction and anonymization using LLM model '{strentityextractionmodel}' and {strentityextractionshape}."
+            text=f"Processed question with entity extraction and anonymization using LLM model '{strentityextractionmodelused}' and {strentityextractionshape}."
         ))
         position_counter += 1
 
@@ -1997,6 +2552,16 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             ))
             position_counter += 1
 
+        if speculative_preplanned or speculative_counts["deferred"] or speculative_counts["failed"]:
+            messages.append(TextMessage(
+                position=position_counter,
+                text=(
+                    f"Streamed entity extraction: {len(speculative_preplanned)} placeholder(s) resolved while the reply was generated, "
+                    f"{speculative_counts['deferred']} deferred (year-filtered search), {speculative_counts['failed']} failed."
+                )
+            ))
+            position_counter += 1
+
         # Detailed JSON structure from f_entity_extraction()
         try:
             entity_extraction_json = json.dumps(entity_extraction, ensure_ascii=False)
@@ -2016,7 +2581,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             print("Falling back to original question without entity extraction")
             messages.append(TextMessage(
                 position=position_counter, 
-                text=f"Entity extraction failed using LLM model '{strentityextractionmodel}'; using original question without anonymization."
+                text=f"Entity extraction failed using LLM model '{strentityextractionmodelused}'; using original question without anonymization."
             ))
             position_counter += 1
             input_text_anonymized = input_text  # Use original question as fallback
@@ -2024,7 +2589,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             print("Entity extraction successful and returned a dictionary:", entity_extraction)
             messages.append(TextMessage(
                 position=position_counter, 
-                text=f"Entity extraction successful using LLM model '{strentityextractionmodel}'; question anonymized."
+                text=f"Entity extraction successful using LLM model '{strentityextractionmodelused}'; question anonymized."
             ))
             position_counter += 1
             input_text_anonymized = entity_extraction['question']
@@ -2036,13 +2601,22 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 text="Searching cache for anonymized question."
             ))
             position_counter += 1
-            cache_result_anonymized = sql_cache.search_sql_cache_by_question_text(
-                connection,
-                input_text_anonymized,
-                strapiversionformatted,
-                ui_language=request.ui_language,
-                is_anonymized=True,
-            )
+            cache_result_anonymized = speculative_anonymized_lookup.get(input_text_anonymized)
+            if cache_result_anonymized is not None:
+                messages.append(TextMessage(
+                    position=position_counter,
+                    text="Anonymized question cache lookup already ran during the streamed extraction; reusing its result."
+                ))
+                position_counter += 1
+            else:
+                cache_result_anonymized = await db.run_db(
+                    sql_cache.search_sql_cache_by_question_text,
+                    connection,
+                    input_text_anonymized,
+                    strapiversionformatted,
+                    ui_language=request.ui_language,
+                    is_anonymized=True,
+                )
             
             if cache_result_anonymized.get("found"):
                 print("Found anonymized question in the SQL cache")
@@ -2210,17 +2784,19 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             # payload, not over the placeholders found in the SQL, and f_text2sql only
             # ever sees input_text_anonymized. The two branches are therefore genuinely
             # independent, and the expensive half of the resolution (regex, closed
-            # vocabularies, ChromaDB, RapidFuzz) can run in a worker thread here. Only
-            # the substitution, microseconds of string work, waits for the SQL. The task
+            # vocabularies, ChromaDB, RapidFuzz) can run here, one DB worker per
+            # placeholder (ENTITY_RESOLUTION_CONCURRENCY). Only the substitution,
+            # microseconds of string work, waits for the SQL. The task
             # is always joined below, before the connection can be closed by the
             # complex-question retry path.
             entity_resolution_task = None
             if ENTITY_RESOLUTION_PARALLEL and isinstance(entity_extraction, dict) and 'error' not in entity_extraction:
-                entity_resolution_task = asyncio.create_task(asyncio.to_thread(
-                    entity.plan_entity_resolutions,
+                entity_resolution_task = asyncio.create_task(entity.aplan_entity_resolutions(
                     connection=connection,
                     entity_extraction=entity_extraction,
                     chromadb_collections_by_name=CHROMADB_COLLECTIONS_BY_NAME,
+                    preplanned=speculative_preplanned,
+                    embed=embedding_function,
                 ))
                 entity_resolution_task.add_done_callback(_mark_task_exception_retrieved)
                 messages.append(TextMessage(
@@ -2229,80 +2805,142 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 ))
                 position_counter += 1
 
-            messages.append(TextMessage(
-                position=position_counter,
-                text=f"Generating SQL using LLM model '{strtext2sqlmodel}'."
-            ))
-            position_counter += 1
-            json_content = await asyncio.to_thread(
-                t2s.f_text2sql, input_text_anonymized, strtext2sqlmodel, ui_language=request.ui_language,
-            )
-            if not isinstance(json_content, dict):
-                json_content = {"error": str(json_content)}
-
-            print("JSON content:", json_content)
-            if 'sql_query' not in json_content:
-                ambiguous_question_for_text2sql = 1
-                sql_query = ""
-                sql_query_anonymized = ""
-                result_entity = ""
-                justification = json_content.get('justification') or ""
-                justification_anonymized = justification
-                answer = json_content.get('answer') or ""
-                answer_anonymized = answer
-                error_text2sql = json_content.get('error') or 'Text2SQL failed to return sql_query'
+            # --- Fork: classify the answer entity while the SQL is being written ----
+            # Joined by the answer-entity guard below, or cancelled when there is no SQL
+            # to guard, or when the request fails or is cancelled (504, client
+            # disconnect) before the join.
+            result_entity_task = None
+            try:
+                if RESULT_ENTITY_PARALLEL and deadline.allow_optional("result_entity"):
+                    result_entity_task = asyncio.create_task(_timed_result_entity_classification(input_text))
+                    result_entity_task.add_done_callback(_mark_task_exception_retrieved)
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text="Started answer-entity classification in parallel with SQL generation."
+                    ))
+                    position_counter += 1
+
                 messages.append(TextMessage(
                     position=position_counter,
-                    text=f"Text2SQL failed using LLM model '{strtext2sqlmodel}': {error_text2sql}"
+                    text=f"Generating SQL using LLM model '{strtext2sqlmodelused}'."
+                ))
+                position_counter += 1
+                with deadline.stage("text2sql"):
+                    json_content = await t2s.af_text2sql(input_text_anonymized, strtext2sqlmodelused, ui_language=request.ui_language)
+                if cascade_text2sql_model is not None:
+                    # Model cascade: a fast answer that failed to parse or the JSON guardrail
+                    # is regenerated by the strong model.
+                    cascade_escalation = model_cascade.needs_escalation("text2sql", json_content)
+                    if cascade_escalation is None:
+                        model_cascade_tiers["text2sql"] = model_cascade.tier("fast", cascade_text2sql_model)
+                    else:
+                        messages.append(TextMessage(
+                            position=position_counter,
+                            text=f"Model cascade: SQL generation with fast model '{cascade_text2sql_model}' failed ({cascade_escalation}); escalating to '{strtext2sqlmodel}'."
+                        ))
+                        position_counter += 1
+                        strtext2sqlmodelused = strtext2sqlmodel
+                        model_cascade_tiers["text2sql"] = model_cascade.tier("strong", strtext2sqlmodel, model_cascade.INVALID_ANSWER)
+                        with deadline.stage("text2sql"):
+                            json_content = await t2s.af_text2sql(input_text_anonymized, strtext2sqlmodelused, ui_language=request.ui_language)
+                if not isinstance(json_content, dict):
+                    json_content = {"error": str(json_content)}
+
+                print("JSON content:", json_content)
+                if 'sql_query' not in json_content:
+                    ambiguous_question_for_text2sql = 1
+                    sql_query = ""
+                    sql_query_anonymized = ""
+                    result_entity = ""
+                    justification = json_content.get('justification') or ""
+                    justification_anonymized = justification
+                    answer = json_content.get('answer') or ""
+                    answer_anonymized = answer
+                    error_text2sql = json_content.get('error') or 'Text2SQL failed to return sql_query'
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=f"Text2SQL failed using LLM model '{strtext2sqlmodelused}': {error_text2sql}"
+                    ))
+                    position_counter += 1
+                else:
+                    sql_query = json_content.get('sql_query') or ""
+                    if sql_query.endswith(';'):
+                        sql_query = sql_query[:-1]
+                    sql_query_anonymized = sql_query
+                    result_entity = (json_content.get('result_entity') or "").strip().lower()
+                    justification = json_content.get('justification') or ""
+                    justification_anonymized = justification
+                    answer = json_content.get('answer') or ""
+                    answer_anonymized = answer
+                    error_text2sql = json_content.get('error') or ''
+
+                text2sql_end_time = time.time()
+                text2sql_processing_time = text2sql_end_time - text2sql_start_time
+                messages.append(TextMessage(
+                    position=position_counter,
+                    text=f"Generated SQL query: {sql_query_anonymized.replace('"', '\\"')}"
                 ))
                 position_counter += 1
-            else:
-                sql_query = json_content.get('sql_query') or ""
-                if sql_query.endswith(';'):
-                    sql_query = sql_query[:-1]
-                sql_query_anonymized = sql_query
-                result_entity = (json_content.get('result_entity') or "").strip().lower()
-                justification = json_content.get('justification') or ""
-                justification_anonymized = justification
-                answer = json_content.get('answer') or ""
-                answer_anonymized = answer
-                error_text2sql = json_content.get('error') or ''
-
-            text2sql_end_time = time.time()
-            text2sql_processing_time = text2sql_end_time - text2sql_start_time
-            messages.append(TextMessage(
-                position=position_counter,
-                text=f"Generated SQL query: {sql_query_anonymized.replace('"', '\\"')}"
-            ))
-            position_counter += 1
-            messages.append(TextMessage(
-                position=position_counter,
-                text="Justification: " + justification
-            ))
-            position_counter += 1
-            if error_text2sql != "":
                 messages.append(TextMessage(
                     position=position_counter,
-                    text="Error: " + error_text2sql
+                    text="Justification: " + justification
                 ))
                 position_counter += 1
+                if error_text2sql != "":
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text="Error: " + error_text2sql
+                    ))
+                    position_counter += 1
 
-            # --- Answer-entity expectation from the ORIGINAL question --------------
-            # result_entity above is decided by the LLM on the ANONYMIZED question.
-            # Anonymizing a head-noun entity word flips the apparent answer type:
-            # "Which movie directors died in 2025?" -> "Which movie {{Department_name1}}
-            # died in {{Death_year1}}?" reads as a movie query, so the model returns
-            # movies instead of the directors. Re-derive the expected answer type from
-            # the original question (still says "directors") and let the guard enforce
-            # it. Empty -> fall back to the LLM's own result_entity (legacy behavior).
-            expected_result_entity = ""
-            if sql_query and not error_text2sql:
-                _result_entity_start_time = time.time()
-                expected_result_entity = await asyncio.to_thread(
-                    t2s.f_classify_result_entity,
-                    input_text, list(_RESULT_ENTITY_SOURCES.keys()),
-                )
-                result_entity_processing_time = time.time() - _result_entity_start_time
+                # --- Answer-entity expectation from the ORIGINAL question --------------
+                # result_entity above is decided by the LLM on the ANONYMIZED question.
+                # Anonymizing a head-noun entity word flips the apparent answer type:
+                # "Which movie directors died in 2025?" -> "Which movie {{Department_name1}}
+                # died in {{Death_year1}}?" reads as a movie query, so the model returns
+                # movies instead of the directors. Re-derive the expected answer type from
+                # the original question (still says "directors") and let the guard enforce
+                # it. Empty -> fall back to the LLM's own result_entity (legacy behavior).
+                expected_result_entity = ""
+                _classified = False
+                if result_entity_task is not None and not (sql_query and not error_text2sql):
+                    result_entity_task.cancel()
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text="Answer-entity classification cancelled: no SQL to guard."
+                    ))
+                    position_counter += 1
+                elif result_entity_task is not None:
+                    _result_entity_join_time = time.time()
+                    try:
+                        expected_result_entity, result_entity_processing_time = await result_entity_task
+                    except Exception as result_entity_error:
+                        print(f"Parallel answer-entity classification failed: {str(result_entity_error)}")
+                        expected_result_entity = ""
+                    result_entity_wait_time = time.time() - _result_entity_join_time
+                    _classified = True
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=(
+                            f"Answer-entity classification ran in parallel with SQL generation "
+                            f"({result_entity_processing_time:.3f}s, of which {result_entity_wait_time:.3f}s on the critical path)."
+                        )
+                    ))
+                    position_counter += 1
+                elif sql_query and not error_text2sql and not deadline.allow_optional("result_entity"):
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=f"Deadline: {deadline.remaining():.1f}s left; skipping answer-entity classification."
+                    ))
+                    position_counter += 1
+                elif sql_query and not error_text2sql:
+                    expected_result_entity, result_entity_processing_time = await _timed_result_entity_classification(input_text)
+                    result_entity_wait_time = result_entity_processing_time
+                    _classified = True
+            finally:
+                if result_entity_task is not None and not result_entity_task.done():
+                    result_entity_task.cancel()
+            if _classified:
                 if expected_result_entity and expected_result_entity != result_entity:
                     messages.append(TextMessage(
                         position=position_counter,
@@ -2326,23 +2964,40 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 _expected_id, _entity_table = _RESULT_ENTITY_SOURCES[_guard_entity]
                 _select_clause = re.split(r"\bfrom\b", sql_query, maxsplit=1, flags=re.IGNORECASE)[0].upper()
                 _is_union = bool(re.search(r"\bunion\b", sql_query, re.IGNORECASE)) or ("CONTENT_TYPE" in sql_query)
-                if not _is_union and _expected_id not in _select_clause:
+                if not _is_union and _expected_id not in _select_clause and not deadline.allow_optional("guard_regeneration"):
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=f"Answer-entity guard: query did not return the expected entity '{_guard_entity}' ({_expected_id}), but only {deadline.remaining():.1f}s of the deadline is left; keeping the original query."
+                    ))
+                    position_counter += 1
+                elif not _is_union and _expected_id not in _select_clause:
                     messages.append(TextMessage(
                         position=position_counter,
                         text=f"Answer-entity guard: query did not return the expected entity '{_guard_entity}' ({_expected_id}); regenerating once."
                     ))
                     position_counter += 1
+                    # Model cascade: a fast-tier query that fired the guard is regenerated
+                    # by the strong model.
+                    _guard_escalated = model_cascade_tiers.get("text2sql", {}).get("tier") == "fast"
+                    if _guard_escalated:
+                        strtext2sqlmodelused = strtext2sqlmodel
+                        model_cascade_tiers["text2sql"]["escalation"] = model_cascade.ANSWER_ENTITY_GUARD
+                        messages.append(TextMessage(
+                            position=position_counter,
+                            text=f"Model cascade: escalating the regeneration from fast model '{cascade_text2sql_model}' to '{strtext2sqlmodel}'."
+                        ))
+                        position_counter += 1
                     _correction_hint = (
                         f"CORRECTION: The user wants {_guard_entity} rows returned (result_entity = \"{_guard_entity}\"). "
                         f"The previous SQL returned the wrong entity. Regenerate so the primary result table is "
                         f"{_entity_table} and the SELECT projects {_expected_id} with the {_guard_entity} 'Result Columns'. "
                         f"Any other named movie, person or serie is only a filter reached via joins, never the SELECT target."
                     )
-                    json_content_retry = await asyncio.to_thread(
-                        t2s.f_text2sql,
-                        input_text_anonymized, strtext2sqlmodel,
-                        ui_language=request.ui_language, correction_hint=_correction_hint,
-                    )
+                    with deadline.stage("guard_regeneration"):
+                        json_content_retry = await t2s.af_text2sql(
+                            input_text_anonymized, strtext2sqlmodelused,
+                            ui_language=request.ui_language, correction_hint=_correction_hint,
+                        )
                     if isinstance(json_content_retry, dict) and json_content_retry.get('sql_query'):
                         _retry_sql = json_content_retry.get('sql_query') or ""
                         if _retry_sql.endswith(';'):
@@ -2356,6 +3011,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                             answer = json_content_retry.get('answer') or answer
                             answer_anonymized = answer
                             result_entity = (json_content_retry.get('result_entity') or _guard_entity).strip().lower()
+                            if _guard_escalated:
+                                model_cascade_tiers["text2sql"] = model_cascade.tier("strong", strtext2sqlmodel, model_cascade.ANSWER_ENTITY_GUARD)
                             messages.append(TextMessage(
                                 position=position_counter,
                                 text=f"Answer-entity guard: regenerated query now returns '{result_entity}' ({_expected_id})."
@@ -2383,6 +3040,12 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                         text=f"Entity resolution completed in parallel with SQL generation ({entity_resolution_planning_time:.3f}s of work overlapped)."
                     ))
                     position_counter += 1
+                    if entity_resolution_plan.get("reused"):
+                        messages.append(TextMessage(
+                            position=position_counter,
+                            text=f"Entity resolution reused {entity_resolution_plan['reused']} placeholder(s) resolved during the streamed extraction."
+                        ))
+                        position_counter += 1
                 except Exception as parallel_resolution_error:
                     entity_resolution_plan = None
                     entity_resolution_planning_time = 0.0
@@ -2395,6 +3058,13 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     async def _retry_with_resolved_complex_question(*, start_message: str, success_message: str, empty_question_message: str, error_message: str):
         """Retry the full pipeline using a stronger-model simplification of the original question."""
         nonlocal position_counter, complex_model_used
+        if not deadline.allow_optional("complex_retry"):
+            messages.append(TextMessage(
+                position=position_counter,
+                text=f"Deadline: {deadline.remaining():.1f}s left; skipping the complex-question retry."
+            ))
+            position_counter += 1
+            return None
         complex_model_used = True
         messages.append(TextMessage(
             position=position_counter,
@@ -2402,7 +3072,11 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         ))
         position_counter += 1
 
-        retry_payload = t2s.f_resolve_complex_question_retry_payload(original_question, strcomplexquestionmodel)
+        # The re-entered pipeline below slices whatever budget this call leaves.
+        with deadline.stage("complex_retry"):
+            retry_payload = await asyncio.to_thread(
+                t2s.f_resolve_complex_question_retry_payload, original_question, strcomplexquestionmodel,
+            )
         resolved_complex = retry_payload.get("resolved")
         try:
             resolved_complex_json = json.dumps(resolved_complex, ensure_ascii=False)
@@ -2424,7 +3098,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 position_counter += 1
 
                 try:
-                    connection.close()
+                    await db.run_db(connection.close)
                 except Exception:
                     pass
 
@@ -2433,7 +3107,10 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 retry_request.question_hashed = None
                 retry_request.complex_question_already_resolved = True
 
-                retry_response = await search_text2sql(retry_request, api_key)
+                # The retry result is always materialized; the endpoint still streams it
+                # as NDJSON when the original request asked for a stream.
+                retry_request.stream = False
+                retry_response = await _search_text2sql_pipeline(retry_request, api_key)
 
                 reasoning_justification = str(retry_payload.get("justification") or "").strip()
                 if reasoning_justification != "":
@@ -2444,9 +3121,10 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
 
                 if request.store_to_cache:
                     try:
-                        retry_connection = get_db_connection()
+                        retry_connection = await db.run_db(get_db_connection)
                         original_question_hash = hashlib.sha256(original_question.encode('utf-8')).hexdigest()
-                        sql_cache.write_sql_cache_entry(
+                        await db.run_db(
+                            sql_cache.write_sql_cache_entry,
                             retry_connection,
                             question=original_question,
                             question_hashed=original_question_hash,
@@ -2469,10 +3147,10 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                             text="Stored original complex question and final SQL query to cache after stronger-model retry."
                         ))
                         position_counter += 1
-                        retry_connection.close()
+                        await db.run_db(retry_connection.close)
                     except Exception as cache_retry_error:
                         try:
-                            retry_connection.close()
+                            await db.run_db(retry_connection.close)
                         except Exception:
                             pass
                         messages.append(TextMessage(
@@ -2516,6 +3194,57 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         position_counter += 1
         return None
 
+    async def _escalate_model_cascade(reason: str, start_message: str):
+        """Rerun the full pipeline with the strong models when a fast-tier answer failed downstream."""
+        nonlocal position_counter
+        if not deadline.allow_optional("cascade_escalation"):
+            messages.append(TextMessage(
+                position=position_counter,
+                text=f"Deadline: {deadline.remaining():.1f}s left; keeping the fast-tier answer (no model cascade escalation)."
+            ))
+            position_counter += 1
+            return None
+        escalated_tiers = model_cascade.escalated(
+            model_cascade_tiers,
+            {"entity_extraction": strentityextractionmodel, "text2sql": strtext2sqlmodel},
+            reason,
+        )
+        messages.append(TextMessage(
+            position=position_counter,
+            text=start_message + " Model cascade: rerunning the pipeline with " + ", ".join(
+                f"{step} on '{entry['model']}'" for step, entry in escalated_tiers.items()
+            ) + "."
+        ))
+        position_counter += 1
+
+        try:
+            await db.run_db(connection.close)
+        except Exception:
+            pass
+
+        # Explicit model names: the re-entered pipeline does not cascade again.
+        retry_request = request.model_copy(deep=True)
+        retry_request.llm_model_entity_extraction = strentityextractionmodel
+        retry_request.llm_model_text2sql = strtext2sqlmodel
+        retry_request.stream = False
+        retry_response = await _search_text2sql_pipeline(retry_request, api_key)
+
+        merged_messages = []
+        pos = 1
+        for m in (messages or []):
+            merged_messages.append(TextMessage(position=pos, text=m.text))
+            pos += 1
+        for m in (getattr(retry_response, "messages", None) or []):
+            merged_messages.append(TextMessage(position=pos, text=m.text))
+            pos += 1
+        try:
+            retry_response.messages = merged_messages
+            retry_response.model_cascade = escalated_tiers
+        except Exception:
+            pass
+        model_cascade.record(escalated_tiers)
+        return retry_response
+
     sql_query_llm = sql_query
     # if the error element is found in json content
     if error_text2sql!="" and error_text2sql!=None:
@@ -2578,6 +3307,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             position_counter += 1
     
     embeddings_start_time = time.time()
+    unresolved_placeholders = False
     if not cached_exact_question and (not ambiguous_question_for_text2sql or justification):
         print("Computing embeddings for entity resolution")
         messages.append(TextMessage(
@@ -2598,21 +3328,25 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 messages=messages,
             )
         else:
-            entity_resolution_result = entity.resolve_entities(
-                connection=connection,
-                entity_extraction=entity_extraction,
-                sql_query=sql_query,
-                justification=justification,
-                answer=answer or "",
-                position_counter=position_counter,
-                text_message_cls=TextMessage,
-                messages=messages,
-                chromadb_collections_by_name=CHROMADB_COLLECTIONS_BY_NAME,
-            )
+            with deadline.stage("resolution"):
+                entity_resolution_result = await entity.aresolve_entities(
+                    connection=connection,
+                    entity_extraction=entity_extraction,
+                    sql_query=sql_query,
+                    justification=justification,
+                    answer=answer or "",
+                    position_counter=position_counter,
+                    text_message_cls=TextMessage,
+                    messages=messages,
+                    chromadb_collections_by_name=CHROMADB_COLLECTIONS_BY_NAME,
+                    preplanned=speculative_preplanned,
+                    embed=embedding_function,
+                )
         sql_query = entity_resolution_result["sql_query"]
         justification = entity_resolution_result["justification"]
         answer = entity_resolution_result["answer"]
         position_counter = entity_resolution_result["position_counter"]
+        unresolved_placeholders = bool(entity_resolution_result.get("ambiguous_question_for_text2sql", 0))
         ambiguous_question_for_text2sql = max(
             ambiguous_question_for_text2sql,
             entity_resolution_result.get("ambiguous_question_for_text2sql", 0),
@@ -2624,6 +3358,17 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     # never waited for it. The saving shows up in total_processing_time, where it belongs.
     embeddings_processing_time = (embeddings_end_time - embeddings_start_time) + entity_resolution_planning_time
 
+    # Model cascade: a fast-tier answer whose placeholders did not all resolve (a wrong
+    # surface form extracted, or a placeholder the SQL does not use) is redone with the
+    # strong models before anything runs against the database.
+    if unresolved_placeholders and sql_query_llm and request.question and model_cascade.has_fast_answer(model_cascade_tiers):
+        cascade_response = await _escalate_model_cascade(
+            model_cascade.UNRESOLVED_PLACEHOLDERS,
+            "Entity placeholders left unresolved by the fast-tier answer.",
+        )
+        if cascade_response is not None:
+            return cascade_response
+
     # Execute the SQL query and get results
     query_results = []
     query_execution_time = 0.0
@@ -2638,7 +3383,16 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             text="Preparing to execute SQL query."
         ))
         position_counter += 1
-        with connection.cursor() as cursor:
+        # The generated SQL is read-only analytical work: run it on a replica when a
+        # healthy one is configured, so it never competes with the cache writes below.
+        read_connection = await db.run_db(get_read_connection)
+        if read_connection.pool_name != "primary":
+            messages.append(TextMessage(
+                position=position_counter,
+                text=f"Routing generated SQL to read replica '{read_connection.pool_name}'."
+            ))
+            position_counter += 1
+        with read_connection.cursor() as cursor:
             # Measure SQL query execution time
             query_start_time = time.time()
             # Calculate pagination parameters
@@ -2682,10 +3436,12 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
 
                 base_offset = llm_defined_offset or 0
                 offset = base_offset + calculated_offset
+                result_cache_base_sql = sql_query
                 sql_query = sql_query + f" LIMIT {limit} OFFSET {offset}"
             else:
                 # Add pagination: LIMIT and OFFSET based on page number
                 offset = calculated_offset
+                result_cache_base_sql = sql_query
                 if lngpage > 1:
                     messages.append(TextMessage(
                         position=position_counter, 
@@ -2712,9 +3468,73 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                     text=f"Executing SQL query: {sql_query}"
                 ))
                 position_counter += 1
-                print("cursor.execute(sql_query)")
-                cursor.execute(sql_query)
-                raw_results = cursor.fetchall()
+                # Result cache: pages inside the cached prefix of the same unpaginated SQL
+                # are served from memory without touching MariaDB. Streaming reads its own
+                # server-side cursor and bypasses it.
+                use_result_cache = not request.stream and result_cache.fits(offset, limit)
+                cached_page = result_cache.lookup(result_cache_base_sql, offset, limit) if use_result_cache else None
+                if cached_page is not None:
+                    raw_results = cached_page["rows"]
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=(
+                            f"Result cache hit: rows {offset}-{offset + len(raw_results)} served from a cached prefix of "
+                            f"{cached_page['cached_rows']} row(s){' (complete result)' if cached_page['complete'] else ''}, "
+                            f"age {cached_page['age']:.1f}s; SQL not executed."
+                        )
+                    ))
+                    position_counter += 1
+                else:
+                    sql_to_execute = result_cache.prefix_sql(result_cache_base_sql) if use_result_cache else sql_query
+                    # Bound the server-side timeout by the execution slice of the deadline.
+                    with deadline.stage("execution"):
+                        execution_statement_time = deadline.statement_time(sql_governor.SQL_MAX_STATEMENT_TIME)
+                    # Execution governor: statement timeout plus the optional EXPLAIN cost gate.
+                    # A cost rejection raises here so it takes the same sql_execution_failed
+                    # path (and complex-question retry) as a MariaDB error.
+                    sql_governor_verdict = await db.run_db(sql_governor.govern, cursor, sql_to_execute, execution_statement_time)
+                    messages.append(TextMessage(
+                        position=position_counter,
+                        text=sql_governor.describe(sql_governor_verdict)
+                    ))
+                    position_counter += 1
+                    if sql_governor_verdict["verdict"] == "rejected":
+                        raise sql_governor.CostRejected(
+                            f"estimated {sql_governor_verdict['estimated_rows']:,} rows exceed the "
+                            f"EXPLAIN budget of {sql_governor_verdict['budget']:,}; query not executed"
+                        )
+                    print("cursor.execute(sql_query)")
+                    if request.stream:
+                        # Unbuffered server-side cursor: read only the first batch now. When
+                        # the batch is full, more rows may follow and the cursor stays open
+                        # for _ndjson_records to drain batch by batch after the header is sent.
+                        stream_cursor = read_connection.cursor(pymysql.cursors.SSDictCursor)
+                        try:
+                            raw_results = await db.run_db(_execute_fetchmany, stream_cursor, sql_governor_verdict["sql"], STREAM_BATCH_ROWS)
+                        except Exception:
+                            await db.run_db(stream_cursor.close)
+                            raise
+                        if len(raw_results) == STREAM_BATCH_ROWS:
+                            streaming_cursor = stream_cursor
+                        else:
+                            await db.run_db(stream_cursor.close)
+                    elif use_result_cache:
+                        # Fetch the whole cacheable prefix once; this page and any later page
+                        # inside it are then sliced from memory.
+                        prefix_rows = await db.run_db(_execute_fetchall, cursor, sql_governor_verdict["sql"])
+                        cached = result_cache.store(result_cache_base_sql, prefix_rows)
+                        messages.append(TextMessage(
+                            position=position_counter,
+                            text=(
+                                f"Result cache miss: fetched {len(prefix_rows)} prefix row(s) "
+                                f"(LIMIT {result_cache.RESULT_CACHE_PREFIX_ROWS})"
+                                + ("; stored for later pages." if cached else "; too large to store.")
+                            )
+                        ))
+                        position_counter += 1
+                        raw_results = prefix_rows[offset:offset + limit]
+                    else:
+                        raw_results = await db.run_db(_execute_fetchall, cursor, sql_governor_verdict["sql"])
                 # Format results with integer index and record data
                 for index, record in enumerate(raw_results):
                     query_results.append({
@@ -2724,6 +3544,9 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             except Exception as e:
                 print(f"Database operation failed: {e}")
                 sql_execution_failed = True
+                if sql_governor_verdict is not None and sql_governor.is_statement_timeout(e):
+                    sql_governor.record_timeout()
+                    sql_governor_verdict["verdict"] = "timed_out"
                 messages.append(TextMessage(
                     position=position_counter, 
                     text=f"Database query execution failed: {str(e)}"
@@ -2733,12 +3556,30 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 # query_results = [{"error": str(e)}]
         query_end_time = time.time()
         query_execution_time = query_end_time - query_start_time
+        if streaming_cursor is None:
+            await db.run_db(read_connection.close)
+        else:
+            messages.append(TextMessage(
+                position=position_counter,
+                text=f"Streaming result: first {STREAM_BATCH_ROWS} rows read; the rest follow as NDJSON from a server-side cursor."
+            ))
+            position_counter += 1
         messages.append(TextMessage(
             position=position_counter, 
             text=f"Executed SQL query with pagination: page={lngpage}, limit={limit}, offset={offset}."
         ))
         position_counter += 1
 
+        # Model cascade: SQL written from a fast-tier answer failed to execute; the strong
+        # models get the question before the complex-question retry is considered.
+        if sql_execution_failed and request.question and model_cascade.has_fast_answer(model_cascade_tiers):
+            cascade_response = await _escalate_model_cascade(
+                model_cascade.SQL_EXECUTION_FAILED,
+                "SQL query execution failed on the fast-tier answer.",
+            )
+            if cascade_response is not None:
+                return cascade_response
+
         # One-time retry: if SQL execution failed (e.g., MariaDB error), try simplifying the
         # initial/original question using the stronger model and rerun the whole pipeline.
         try:
@@ -2852,7 +3693,10 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             ))
             position_counter += 1
 
-            answer_result = t2s.f_answer_single_value(original_question, strcomplexquestionmodel)
+            with deadline.stage("complex_retry"):
+                answer_result = await asyncio.to_thread(
+                    t2s.f_answer_single_value, original_question, strcomplexquestionmodel,
+                )
 
             if answer_result.get("error"):
                 messages.append(TextMessage(
@@ -2885,13 +3729,16 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 position_counter += 1
 
                 try:
-                    with connection.cursor() as synth_cursor:
-                        synth_cursor.execute(synthetic_sql)
-                        synth_results = synth_cursor.fetchall()
-                        query_results = [
-                            {"index": idx, "data": {k: html.unescape(v) if isinstance(v, str) else v for k, v in row.items()}}
-                            for idx, row in enumerate(synth_results)
-                        ]
+                    synth_connection = await db.run_db(get_read_connection)
+                    try:
+                        with synth_connection.cursor() as synth_cursor:
+                            synth_results = await db.run_db(_execute_fetchall, synth_cursor, synthetic_sql)
+                    finally:
+                        await db.run_db(synth_connection.close)
+                    query_results = [
+                        {"index": idx, "data": {k: html.unescape(v) if isinstance(v, str) else v for k, v in row.items()}}
+                        for idx, row in enumerate(synth_results)
+                    ]
                     messages.append(TextMessage(
                         position=position_counter,
                         text=f"Synthetic SQL executed successfully; result returned from SQL execution."
@@ -2909,7 +3756,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 if synthetic_sql and request.store_to_cache and request.question:
                     synthetic_hash = hashlib.sha256(original_question.encode('utf-8')).hexdigest()
                     try:
-                        sql_cache.write_sql_cache_entry(
+                        await db.run_db(
+                            sql_cache.write_sql_cache_entry,
                             connection,
                             question=original_question,
                             question_hashed=synthetic_hash,
@@ -2963,7 +3811,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         if request.store_to_cache and not cached_exact_question and not sql_execution_failed and request.question:
             messages.append(TextMessage(position=position_counter, text="Storing exact question and SQL query to cache."))
             position_counter += 1
-            sql_cache.write_sql_cache_entry(
+            await db.run_db(
+                sql_cache.write_sql_cache_entry,
                 connection,
                 question=request.question,
                 question_hashed=question_hash,
@@ -3003,7 +3852,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 text="Storing anonymized question and SQL query to cache."
             ))
             position_counter += 1
-            sql_cache.write_sql_cache_entry(
+            await db.run_db(
+                sql_cache.write_sql_cache_entry,
                 connection,
                 question=input_text_anonymized,
                 question_hashed=question_hash,
@@ -3080,8 +3930,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     
     # FASTAPI-TEXT2SQL-162 (post-process variant): localize movie/serie result rows by
     # ui_language WITHOUT touching the prompt or the generated SQL. No-op for English.
-    localize_search_results(query_results, normalize_ui_language(request.ui_language), connection)
-    connection.close()
+    await db.run_db(localize_search_results, query_results, normalize_ui_language(request.ui_language), connection)
+    await db.run_db(connection.close)
 
     # Generate question hash if we have a question and no hash was provided
     response_question_hash = request.question_hashed
@@ -3102,6 +3952,7 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
             text=_cache_event["text"],
         ))
         position_counter += 1
+    llm_hedging_decisions = llm_hedging.drain_decisions()
 
     messages.append(TextMessage(
         position=position_counter,
@@ -3160,18 +4011,14 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
                 # `connection` is already closed by this point (see connection.close()
                 # above); compute_name_ambiguity is a pure function so it did not need it,
                 # but hydration queries the DB, so open a fresh short-lived connection.
-                _na_conn = get_db_connection()
-                try:
-                    with _na_conn.cursor() as _na_cursor:
-                        hydrate_name_ambiguity_candidates(_na_cursor, name_ambiguity)
-                finally:
-                    _na_conn.close()
+                await db.run_db(_hydrate_name_ambiguity_with_new_connection, name_ambiguity)
             except Exception as _na_hydrate_exc:
                 print(
                     f"name_ambiguity hydration skipped (entity="
                     f"{name_ambiguity.get('entity')}): {type(_na_hydrate_exc).__name__}: "
                     f"{_na_hydrate_exc}")
 
+    model_cascade.record(model_cascade_tiers)
     response = Text2SQLResponse(
         question=input_text,
         question_hashed=response_question_hash,
@@ -3192,7 +4039,9 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         question_anonymized=input_text_anonymized,
         entity_extraction_processing_time=entity_extraction_processing_time,
         text2sql_processing_time=text2sql_processing_time,
+        llm_queue_wait_time=llm_scheduler.queue_wait(),
         result_entity_processing_time=result_entity_processing_time,
+        result_entity_wait_time=result_entity_wait_time,
         embeddings_processing_time=embeddings_processing_time,
         embeddings_cache_search_time=embeddings_cache_search_time,
         query_execution_time=query_execution_time,
@@ -3211,6 +4060,9 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
         llm_model_text2sql=strtext2sqlmodel,
         llm_model_complex=strcomplexquestionmodel,
         complex_model_used=complex_model_used,
+        sql_governor=({k: v for k, v in sql_governor_verdict.items() if k != "sql"} if sql_governor_verdict else None),
+        llm_hedging=llm_hedging_decisions or None,
+        model_cascade=model_cascade_tiers or None,
         ui_language=request.ui_language,
         api_version=strapiversion,
         result=query_results,
@@ -3225,6 +4077,8 @@ async def search_text2sql(request: Text2SQLRequest, api_key: str = Depends(get_a
     print("LOG DATA:", log_data)
     logs.log_usage("text2sql_post", log_data, strapiversion)
     
+    if streaming_cursor is not None:
+        return _StreamedResult(response, streaming_cursor, read_connection)
     return response
 
 # ---------------------------------------------------------------------------
@@ -3718,7 +4572,8 @@ def _collection_context(cursor, entity_type, entity_id, ui_language="en"):
 
 
 @app.get("/movies/{id}", summary="Movie full detail")
-async def get_movie(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_movie(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a movie plus embedded relations: genres, production
     companies, production countries, spoken languages, topics, lists, collections,
     movements, technicals, awards, nominations, cast, and crew. The id is the TMDb
@@ -3814,7 +4669,7 @@ async def get_movie(id: int, ui_language: Optional[str] = "en", collection: Opti
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_MOVIE WHERE ID_MOVIE = %s", (id,))
@@ -4017,7 +4872,8 @@ async def get_movie(id: int, ui_language: Optional[str] = "en", collection: Opti
 
 
 @app.get("/series/{id}", summary="TV series full detail")
-async def get_series(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_series(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a TV series plus embedded relations: genres, production
     companies, networks, production countries, spoken languages, topics, lists,
     collections, movements, awards, nominations, cast, and crew. The id is the TMDb
@@ -4119,7 +4975,7 @@ async def get_series(id: int, ui_language: Optional[str] = "en", collection: Opt
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_SERIE WHERE ID_SERIE = %s", (id,))
@@ -4335,7 +5191,8 @@ async def get_series(id: int, ui_language: Optional[str] = "en", collection: Opt
 
 
 @app.get("/seasons/{id_serie}/{season_number}", summary="TV series season full detail")
-async def get_season(id_serie: int, season_number: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_season(id_serie: int, season_number: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a TV series season plus embedded relations: cast, crew,
     posters, backdrops, and a navigation stub for the parent series. The composite
     key is (ID_SERIE, SEASON_NUMBER); season 0 is the specials season when present.
@@ -4430,7 +5287,7 @@ async def get_season(id_serie: int, season_number: int, ui_language: Optional[st
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -4619,7 +5476,8 @@ async def get_season(id_serie: int, season_number: int, ui_language: Optional[st
     "/episodes/{id_serie}/{season_number}/{episode_number}",
     summary="TV series episode full detail",
 )
-async def get_episode(
+@db.offload
+def get_episode(
     id_serie: int,
     season_number: int,
     episode_number: int,
@@ -4719,7 +5577,7 @@ async def get_episode(
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -4879,7 +5737,8 @@ async def get_episode(
 
 
 @app.get("/persons/{id}", summary="Person full detail")
-async def get_person(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_person(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a person plus embedded relations: movie cast and crew,
     series cast and crew, groups, causes of death, awards, and nominations.
     The id is the TMDb person ID (ID_PERSON).
@@ -4941,7 +5800,7 @@ async def get_person(id: int, ui_language: Optional[str] = "en", collection: Opt
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_PERSON WHERE ID_PERSON = %s", (id,))
@@ -5062,7 +5921,8 @@ async def get_person(id: int, ui_language: Optional[str] = "en", collection: Opt
 
 
 @app.get("/companies/{id}", summary="Production company full detail")
-async def get_company(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_company(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a production company plus associated movies and TV series,
     ordered by adjusted IMDb rating. The id is ID_COMPANY.
 
@@ -5078,7 +5938,7 @@ async def get_company(id: int, ui_language: Optional[str] = "en", collection: Op
     null here because this base table has no ID_WIKIDATA. Returned on the full response
     only, not on a ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_COMPANY WHERE ID_COMPANY = %s", (id,))
@@ -5117,7 +5977,8 @@ async def get_company(id: int, ui_language: Optional[str] = "en", collection: Op
 
 
 @app.get("/networks/{id}", summary="TV network full detail")
-async def get_network(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_network(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a TV network plus associated TV series, ordered by
     adjusted IMDb rating. The id is ID_NETWORK.
 
@@ -5131,7 +5992,7 @@ async def get_network(id: int, ui_language: Optional[str] = "en", collection: Op
     null here because this base table has no ID_WIKIDATA. Returned on the full response
     only, not on a ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_NETWORK WHERE ID_NETWORK = %s", (id,))
@@ -5163,7 +6024,8 @@ async def get_network(id: int, ui_language: Optional[str] = "en", collection: Op
 
 
 @app.get("/collections/{id}", summary="Film/series collection full detail")
-async def get_collection(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_collection(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a named collection (trilogy, saga, universe, franchise) plus
     member movies and TV series ordered by DISPLAY_ORDER. The id is ID_T2S_COLLECTION.
 
@@ -5202,7 +6064,7 @@ async def get_collection(id: int, ui_language: Optional[str] = "en", collection:
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_COLLECTION WHERE ID_T2S_COLLECTION = %s", (id,))
@@ -5245,7 +6107,8 @@ async def get_collection(id: int, ui_language: Optional[str] = "en", collection:
 
 
 @app.get("/topics/{id}", summary="Topic full detail")
-async def get_topic(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_topic(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a topic (theme, keyword, recurring-character collection) plus linked
     movies and TV series ordered by DISPLAY_ORDER. The id is ID_TOPIC.
 
@@ -5284,7 +6147,7 @@ async def get_topic(id: int, ui_language: Optional[str] = "en", collection: Opti
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_TOPIC WHERE ID_TOPIC = %s", (id,))
@@ -5327,7 +6190,8 @@ async def get_topic(id: int, ui_language: Optional[str] = "en", collection: Opti
 
 
 @app.get("/lists/{id}", summary="Curated list full detail")
-async def get_list(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_list(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a named curated list plus member movies and TV series
     ordered by DISPLAY_ORDER. The id is ID_T2S_LIST.
 
@@ -5366,7 +6230,7 @@ async def get_list(id: int, ui_language: Optional[str] = "en", collection: Optio
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_LIST WHERE ID_T2S_LIST = %s", (id,))
@@ -5409,7 +6273,8 @@ async def get_list(id: int, ui_language: Optional[str] = "en", collection: Optio
 
 
 @app.get("/movements/{id}", summary="Film movement or style full detail")
-async def get_movement(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_movement(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a film movement or style plus associated movies and TV series
     ordered by DISPLAY_ORDER. The id is ID_MOVEMENT.
 
@@ -5448,7 +6313,7 @@ async def get_movement(id: int, ui_language: Optional[str] = "en", collection: O
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_MOVEMENT WHERE ID_MOVEMENT = %s", (id,))
@@ -5491,7 +6356,8 @@ async def get_movement(id: int, ui_language: Optional[str] = "en", collection: O
 
 
 @app.get("/technicals/{id}", summary="Technical format full detail")
-async def get_technical(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_technical(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a technical format (sound system, color/film/sound technology,
     or film format) plus associated movies and sibling technicals sharing the same
     TECHNICAL_TYPE. The id is ID_TECHNICAL.
@@ -5534,7 +6400,7 @@ async def get_technical(id: int, ui_language: Optional[str] = "en", collection:
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_TECHNICAL WHERE ID_TECHNICAL = %s", (id,))
@@ -5578,7 +6444,8 @@ async def get_technical(id: int, ui_language: Optional[str] = "en", collection:
 
 
 @app.get("/genres/{id}", summary="Movie / TV genre full detail")
-async def get_genre(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_genre(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return the closed-vocabulary genre identified by ID_GENRE (the TMDb genre id,
     e.g. 28 = Action, 878 = Science Fiction) plus its member movies and TV series.
 
@@ -5602,7 +6469,7 @@ async def get_genre(id: int, ui_language: Optional[str] = "en", collection: Opti
     null here because this base table has no ID_WIKIDATA. Returned on the full response
     only, not on a ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("""
@@ -5649,7 +6516,8 @@ async def get_genre(id: int, ui_language: Optional[str] = "en", collection: Opti
 
 
 @app.get("/groups/{id}", summary="Person group full detail")
-async def get_group(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_group(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a group (organization, club, musical group) plus associated
     persons ordered by DISPLAY_ORDER. The id is ID_GROUP.
 
@@ -5687,7 +6555,7 @@ async def get_group(id: int, ui_language: Optional[str] = "en", collection: Opti
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_GROUP WHERE ID_GROUP = %s", (id,))
@@ -5723,7 +6591,8 @@ async def get_group(id: int, ui_language: Optional[str] = "en", collection: Opti
 
 
 @app.get("/deaths/{id}", summary="Cause of death full detail")
-async def get_death(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_death(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a cause or circumstance of death plus associated persons
     ordered by DISPLAY_ORDER. The id is ID_DEATH.
 
@@ -5761,7 +6630,7 @@ async def get_death(id: int, ui_language: Optional[str] = "en", collection: Opti
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_DEATH WHERE ID_DEATH = %s", (id,))
@@ -5797,7 +6666,8 @@ async def get_death(id: int, ui_language: Optional[str] = "en", collection: Opti
 
 
 @app.get("/awards/{id}", summary="Award full detail")
-async def get_award(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_award(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for an award plus associated movies, TV series, and persons,
     all ordered by DISPLAY_ORDER. The id is ID_AWARD.
 
@@ -5836,7 +6706,7 @@ async def get_award(id: int, ui_language: Optional[str] = "en", collection: Opti
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_AWARD WHERE ID_AWARD = %s", (id,))
@@ -5886,7 +6756,8 @@ async def get_award(id: int, ui_language: Optional[str] = "en", collection: Opti
 
 
 @app.get("/nominations/{id}", summary="Award nomination full detail")
-async def get_nomination(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_nomination(id: int, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for an award nomination plus associated movies, TV series, and
     persons, all ordered by DISPLAY_ORDER. The id is ID_NOMINATION.
 
@@ -5925,7 +6796,7 @@ async def get_nomination(id: int, ui_language: Optional[str] = "en", collection:
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_NOMINATION WHERE ID_NOMINATION = %s", (id,))
@@ -5975,7 +6846,8 @@ async def get_nomination(id: int, ui_language: Optional[str] = "en", collection:
 
 
 @app.get("/locations/{wikidata_id}", summary="Location full detail")
-async def get_location(wikidata_id: str, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
+@db.offload
+def get_location(wikidata_id: str, ui_language: Optional[str] = "en", collection: Optional[str] = None, page: int = 1, rows_per_page: int = COLLECTION_ROWS_PER_PAGE_DEFAULT, api_key: str = Depends(get_api_key)):
     """Return all fields for a location identified by its Wikidata ID (e.g. Q90 for Paris)
     plus movies and series linked as narrative location (ID_PROPERTY=P840) or filming
     location (ID_PROPERTY=P915), ordered by adjusted IMDb rating.
@@ -6014,7 +6886,7 @@ async def get_location(wikidata_id: str, ui_language: Optional[str] = "en", coll
     null when the entity has no ID_WIKIDATA. Returned on the full response only, not on a
     ?collection= targeted page."""
     ui_language = normalize_ui_language(ui_language)
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM T_WC_T2S_ITEM WHERE ID_WIKIDATA = %s", (wikidata_id,))
@@ -6328,7 +7200,8 @@ def _fetch_sample_images(cursor, image_source, ids):
 
 
 @app.get("/samples", summary="Suggested sample questions")
-async def get_samples(ui_language: Optional[str] = "en", set: Optional[str] = "sample", api_key: str = Depends(get_api_key)):
+@db.offload
+def get_samples(ui_language: Optional[str] = "en", set: Optional[str] = "sample", api_key: str = Depends(get_api_key)):
     """Return the curated tree of suggested sample questions, each with a simulated result.
 
     Mirrors the front-end samples panel (lib/text2sql-samples.inc.php): a hierarchy of
@@ -6370,7 +7243,7 @@ async def get_samples(ui_language: Optional[str] = "en", set: Optional[str] = "s
     # interpolate into the query below (never the raw user value).
     sample_set = (set or "sample").strip().lower()
     sample_filter_col = "IS_SHOWCASE" if sample_set == "showcase" else "IS_SAMPLE"
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         pending = []  # (simulated_result, entity_type, ordered ids) to hydrate in batch
         with conn.cursor() as cursor:
@@ -6512,6 +7385,8 @@ async def _mcp_sql_search(
                     "llm_model_entity_extraction": llm_model_entity_extraction,
                     "llm_model_text2sql": llm_model_text2sql,
                     "llm_model_complex": llm_model_complex,
+                    # Finish (or give up) server-side before this client's 60 s timeout.
+                    "deadline_seconds": 55,
                 },
                 headers={"X-API-Key": MCP_INTERNAL_API_KEY},
             )
@@ -7149,4 +8024,24 @@ if __name__ == "__main__":
     result = {"message": f"Text2SQL API start version {strapiversion} on port {api_port}"}
     logs.log_usage("start", result, strapiversion)
     print(f"Starting API version {strapiversion} on port {api_port} (patch version {patch_version} is {'even' if patch_version % 2 == 0 else 'odd'})")
-    uvicorn.run(app, host="0.0.0.0", port=api_port)
+    if API_WORKERS > 1:
+        def _on_worker_start():
+            # Per-process state: fresh DB pool and executor, a running hot-reload
+            # watcher, and a ChromaDB client with its own sockets. The BK-trees and
+            # closed vocabularies are inherited from the parent, untouched.
+            db.reset_after_fork()
+            data_watcher.restart_after_fork()
+            _open_chromadb_collections()
+            db.get_pool().warm()
+            db.start_replica_monitor()
+
+        prefork.serve(
+            app,
+            host="0.0.0.0",
+            port=api_port,
+            workers=API_WORKERS,
+            before_fork=db.close_all_pools,
+            on_child_start=_on_worker_start,
+        )
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=api_port)
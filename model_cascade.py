@@ -0,0 +1,115 @@
+"""Two-tier model cascade for entity extraction and text-to-SQL.
+
+Both steps default to the strong model (``gpt-4o``), yet most questions are plain
+lookups ("movies with X") that a smaller, faster model gets right. With
+``MODEL_CASCADE`` on, a request that leaves a step on its default model tries
+that step on the fast model first, and ``search_text2sql`` escalates to the
+strong model only when the fast answer is not good enough:
+
+- **Invalid answer.** The fast reply did not parse or failed
+  ``json_guardrails.validate_llm_json``: the step is rerun at once with the
+  strong model. For extraction, any error payload escalates.
+- **Answer-entity guard.** The SELECT does not project the expected entity: the
+  guard's one regeneration is made by the strong model.
+- **SQL execution failed** or **placeholders left unresolved**: the whole
+  pipeline is rerun with the strong models, as the complex-question retry does.
+
+A request that names a model (``llm_model_entity_extraction``,
+``llm_model_text2sql``) is never cascaded. The response's ``model_cascade``
+field records, per step, the tier and model that answered and why the strong
+model was called, if it was. ``stats()`` counts the same per step, so the fast
+model and the split can be tuned from ``GET /``.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional
+
+
+MODEL_CASCADE = os.getenv("MODEL_CASCADE", "0").strip().lower() in {"1", "true", "yes", "on"}
+MODEL_CASCADE_FAST_MODEL = os.getenv("MODEL_CASCADE_FAST_MODEL", "gpt-4o-mini").strip()
+MODEL_CASCADE_FAST_MODELS = {
+    "entity_extraction": os.getenv("MODEL_CASCADE_ENTITY_EXTRACTION_MODEL", MODEL_CASCADE_FAST_MODEL).strip(),
+    "text2sql": os.getenv("MODEL_CASCADE_TEXT2SQL_MODEL", MODEL_CASCADE_FAST_MODEL).strip(),
+}
+
+# Escalation reasons, as recorded in the response and counted in stats().
+INVALID_ANSWER = "invalid_answer"
+ANSWER_ENTITY_GUARD = "answer_entity_guard"
+SQL_EXECUTION_FAILED = "sql_execution_failed"
+UNRESOLVED_PLACEHOLDERS = "unresolved_placeholders"
+
+_lock = threading.Lock()
+_usage: dict[str, dict] = {}
+
+
+def fast_model(step: str, requested_model: Optional[str]) -> Optional[str]:
+    """Fast model to try first for ``step``, or None when the cascade does not apply.
+
+    None when the cascade is off, no fast model is configured for the step, or the
+    request named its own model for it.
+    """
+    if not MODEL_CASCADE:
+        return None
+    if requested_model and requested_model.strip().lower() != "default":
+        return None
+    return MODEL_CASCADE_FAST_MODELS.get(step) or None
+
+
+def needs_escalation(step: str, payload) -> Optional[str]:
+    """Why a fast answer of ``step`` must be regenerated by the strong model, or None if it stands."""
+    if not isinstance(payload, dict):
+        return f"unexpected answer type {type(payload).__name__}"
+    if step == "entity_extraction":
+        if "error" in payload:
+            return str(payload["error"])
+        return None
+    # Text-to-SQL: only an answer that failed to parse or the JSON guardrail. An
+    # {"error": ...} the model chose to return is a handled answer.
+    if "error" in payload and "raw_content" in payload:
+        return str(payload["error"])
+    return None
+
+
+def tier(name: str, model: str, escalation: Optional[str] = None) -> dict:
+    """Per-step entry of the response's ``model_cascade`` field."""
+    return {"tier": name, "model": model, "escalation": escalation}
+
+
+def has_fast_answer(tiers: dict) -> bool:
+    """True when an answer the request still relies on came from the fast tier."""
+    return any(entry["tier"] == "fast" for entry in tiers.values())
+
+
+def escalated(tiers: dict, strong_models: dict, reason: str) -> dict:
+    """The tiers after rerunning every cascaded step with its strong model for ``reason``."""
+    return {step: tier("strong", strong_models[step], reason) for step in tiers}
+
+
+def record(tiers: dict) -> None:
+    """Count one request's final tiers."""
+    if not tiers:
+        return
+    with _lock:
+        for step, entry in tiers.items():
+            bucket = _usage.setdefault(step, {"requests": 0, "fast": 0, "strong": 0, "escalations": {}})
+            bucket["requests"] += 1
+            bucket[entry["tier"]] += 1
+            if entry["escalation"]:
+                bucket["escalations"][entry["escalation"]] = bucket["escalations"].get(entry["escalation"], 0) + 1
+
+
+def stats() -> dict:
+    """Settings and per-step tier counts since process start."""
+    with _lock:
+        steps = {
+            step: {
+                **{k: v for k, v in bucket.items() if k != "escalations"},
+                "escalations": dict(bucket["escalations"]),
+                "fast_rate": round(bucket["fast"] / bucket["requests"], 4) if bucket["requests"] else 0.0,
+            }
+            for step, bucket in _usage.items()
+        }
+    return {"enabled": MODEL_CASCADE, "fast_models": dict(MODEL_CASCADE_FAST_MODELS), "steps": steps}
@@ -0,0 +1,121 @@
+"""Remembered routes for LLM models whose endpoint or concrete name is probed.
+
+Two dispatch paths used to probe on every call. OpenAI ``o1*`` / ``o3*`` models
+tried the Responses API first and fell back to chat completions on any error.
+``gemini-*`` models walked a list of up to nine concrete model names, moving on
+at each ``NOT_FOUND``. A misconfigured or retired model name therefore paid the
+same failed round trips on every request.
+
+This registry remembers, per provider and requested model, the path (endpoint or
+concrete model name) that answered, and which paths are known to be
+unavailable:
+
+- :func:`candidates` orders a probe list: the remembered path first, then the
+  others in their original order, without the known-dead ones.
+- :func:`succeeded` and :func:`failed` record the outcome of a call. Only
+  "not there" errors mark a path dead (``NOT_FOUND``, an endpoint the SDK or
+  the model does not support); quota and transient errors say nothing about
+  the route.
+- Both kinds of entry expire after ``MODEL_REGISTRY_TTL`` seconds. The next
+  call then probes in the original order again, so a model that became
+  available, or a fallback that disappeared, is noticed.
+- :func:`warm_up` runs caller-supplied probes at startup
+  (``MODEL_REGISTRY_WARMUP``), so the first requests skip the dead paths too.
+
+The registry is per process. ``stats()`` lists the live routes and dead paths.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, Iterable
+
+
+MODEL_REGISTRY_TTL = float(os.getenv("MODEL_REGISTRY_TTL", "3600"))
+MODEL_REGISTRY_WARMUP = os.getenv("MODEL_REGISTRY_WARMUP", "0").strip().lower() in {"1", "true", "yes", "on"}
+# Models probed at startup besides the pipeline defaults (comma-separated).
+MODEL_REGISTRY_WARMUP_MODELS = [m.strip() for m in os.getenv("MODEL_REGISTRY_WARMUP_MODELS", "").split(",") if m.strip()]
+
+_lock = threading.Lock()
+# (provider, requested model) -> {"path", "expires_at"}
+_routes: dict[tuple[str, str], dict] = {}
+# (provider, path) -> {"error", "expires_at"}
+_dead: dict[tuple[str, str], dict] = {}
+_counters = {"routes_learned": 0, "paths_marked_dead": 0, "probes_skipped": 0}
+
+
+def _purge(now: float) -> None:
+    for key in [k for k, entry in _routes.items() if entry["expires_at"] <= now]:
+        del _routes[key]
+    for key in [k for k, entry in _dead.items() if entry["expires_at"] <= now]:
+        del _dead[key]
+
+
+def candidates(provider: str, requested: str, paths: Iterable[str]) -> list:
+    """``paths`` in probe order: the remembered one first, known-dead ones left out."""
+    paths = list(paths)
+    now = time.monotonic()
+    with _lock:
+        _purge(now)
+        route = _routes.get((provider, requested))
+        live = [path for path in paths if (provider, path) not in _dead]
+        _counters["probes_skipped"] += len(paths) - len(live)
+    if route is not None and route["path"] in live:
+        live.remove(route["path"])
+        live.insert(0, route["path"])
+    return live
+
+
+def succeeded(provider: str, requested: str, path: str) -> None:
+    """Remember that ``path`` answered for ``requested``."""
+    with _lock:
+        current = _routes.get((provider, requested))
+        if current is None or current["path"] != path:
+            _counters["routes_learned"] += 1
+            if requested != path:
+                print(f"[model-registry] {provider} '{requested}' is served by '{path}'.", flush=True)
+        _routes[(provider, requested)] = {"path": path, "expires_at": time.monotonic() + MODEL_REGISTRY_TTL}
+        _dead.pop((provider, path), None)
+
+
+def failed(provider: str, path: str, error) -> None:
+    """Mark ``path`` unavailable until the TTL runs out."""
+    with _lock:
+        if (provider, path) not in _dead:
+            _counters["paths_marked_dead"] += 1
+            print(f"[model-registry] {provider} '{path}' unavailable, skipped for {MODEL_REGISTRY_TTL:.0f}s: {error}", flush=True)
+        _dead[(provider, path)] = {"error": str(error)[:200], "expires_at": time.monotonic() + MODEL_REGISTRY_TTL}
+        for key in [k for k, entry in _routes.items() if k[0] == provider and entry["path"] == path]:
+            del _routes[key]
+
+
+def warm_up(probes: Iterable[Callable[[], None]]) -> None:
+    """Run the startup probes; each records its own outcome. Failures are logged, never raised."""
+    started = time.perf_counter()
+    for probe in probes:
+        try:
+            probe()
+        except Exception as exc:
+            print(f"[model-registry] Warm-up probe failed: {exc}", flush=True)
+    with _lock:
+        learned, dead = len(_routes), len(_dead)
+    print(f"[model-registry] Warm-up done in {time.perf_counter() - started:.2f}s: {learned} route(s), {dead} dead path(s).", flush=True)
+
+
+def stats() -> dict:
+    """Live routes, dead paths and counters since process start."""
+    now = time.monotonic()
+    with _lock:
+        _purge(now)
+        routes = [
+            {"provider": provider, "model": requested, "path": entry["path"], "expires_in": round(entry["expires_at"] - now, 1)}
+            for (provider, requested), entry in _routes.items()
+        ]
+        dead = [
+            {"provider": provider, "path": path, "error": entry["error"], "expires_in": round(entry["expires_at"] - now, 1)}
+            for (provider, path), entry in _dead.items()
+        ]
+        counters = dict(_counters)
+    return {"ttl": MODEL_REGISTRY_TTL, "warmup": MODEL_REGISTRY_WARMUP, **counters, "routes": routes, "dead_paths": dead}
@@ -0,0 +1,134 @@
+"""Pre-fork multi-worker serving.
+
+One uvicorn process serves every request on one event loop, and the CPU-bound
+parts of a request (BK-tree walks, RapidFuzz scoring, JSON handling) hold the
+GIL. Uvicorn's own ``--workers`` does not help here: it *spawns* fresh
+interpreters, so every worker would re-import ``main`` and rebuild the BK-trees
+and closed vocabularies from MariaDB, multiplying both startup time and memory
+by the worker count.
+
+This module forks instead. The parent imports the app, which builds every
+shared read-only structure once (BK-trees in the foreground, closed
+vocabularies, prompt templates), binds the listening socket, freezes the GC
+generations and then forks ``API_WORKERS`` children. Each child serves on the
+inherited socket (the kernel spreads connections across them) and sees the
+parent's indexes through copy-on-write pages: nothing is rebuilt or copied up
+front. The parent only supervises: a worker that dies is re-forked from the
+same warm parent, so it is serving again within milliseconds.
+
+State that must not be shared across processes (DB sockets, HTTP client pools,
+background threads) is dropped before the fork or rebuilt in the child through
+the ``on_child_start`` hook.
+"""
+
+from __future__ import annotations
+
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Optional
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_child(app, sock: socket.socket, worker_index: int, on_child_start: Optional[Callable[[], None]]) -> None:
+    """Child body: restore default signals, rebuild per-process state, serve until told to stop."""
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if on_child_start is not None:
+        on_child_start()
+    print(f"[prefork] Worker {worker_index} (pid {os.getpid()}) serving.", flush=True)
+    config = uvicorn.Config(app, log_level="info")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def serve(
+    app,
+    *,
+    host: str,
+    port: int,
+    workers: int,
+    before_fork: Optional[Callable[[], None]] = None,
+    on_child_start: Optional[Callable[[], None]] = None,
+) -> None:
+    """Serve ``app`` from ``workers`` forked processes sharing one listening socket.
+
+    Args:
+        app: The ASGI application, fully initialized in this (parent) process.
+        host: Interface to bind.
+        port: TCP port to bind.
+        workers: Number of worker processes to fork.
+        before_fork: Called once in the parent right before the first fork; the place
+            to close sockets the children must not inherit (e.g. pooled DB connections).
+        on_child_start: Called in every child right after the fork, before serving.
+    """
+    sock = _bind_socket(host, port)
+    if before_fork is not None:
+        before_fork()
+    # Move everything allocated so far (indexes, vocabularies, templates) into the
+    # permanent generation: a child's garbage collector then never touches those
+    # objects' headers, which would otherwise copy their pages one by one.
+    gc.collect()
+    gc.freeze()
+
+    children: dict[int, int] = {}
+    stopping = False
+
+    def _spawn(worker_index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                _run_child(app, sock, worker_index, on_child_start)
+            except BaseException as exc:
+                print(f"[prefork] Worker {worker_index} crashed: {exc}", file=sys.stderr, flush=True)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        children[pid] = worker_index
+
+    def _stop(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    print(f"[prefork] Parent {os.getpid()} forking {workers} worker(s) on {host}:{port}.", flush=True)
+    for worker_index in range(workers):
+        _spawn(worker_index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker_index = children.pop(pid, None)
+        if worker_index is None or stopping:
+            continue
+        print(f"[prefork] Worker {worker_index} (pid {pid}) exited with status {status}; re-forking.", flush=True)
+        time.sleep(1)  # do not spin if a worker dies on startup
+        _spawn(worker_index)
+
+    sock.close()
+    print("[prefork] All workers stopped.", flush=True)
@@ -0,0 +1,273 @@
+"""Schema-sliced text-to-SQL prompt.
+
+``data/text_to_sql.md`` is about 70 KB, and every uncached question used to send
+all of it, whether it asked for one movie's cast or for an award aggregate. This
+module indexes the prompt by its Markdown headings and assembles, per question,
+a prompt made of the sections the question can need:
+
+- **Core sections** (task, placeholders, the main tables, the query rules, the
+  join conditions, ...) are always sent, in their original order. Every sliced
+  prompt therefore starts with the same bytes, so the providers' prefix caches
+  and the Anthropic breakpoint (``CACHE_BOUNDARY_MARKER``, moved to the end of
+  the core) keep hitting.
+- **Optional sections** (the schema of awards, groups, images, ...; the matching
+  result-column blocks; the technical-format and recommendation rules) are
+  listed with their tags in ``data/text_to_sql_sections.json``, hot-reloaded via
+  ``data_watcher``. A tag is active when the anonymized question carries one of
+  its placeholder types (``{{Award_name1}}``) or one of its keywords. The active
+  sections are appended after the boundary, under a "(continued)" heading, and
+  the rest is left out.
+
+The caller (``text2sql``) falls back to the full prompt when the sliced answer
+fails the JSON guardrail, returns no SQL, or uses a table that only an omitted
+section declares; see :func:`fallback_reason`. Counters, tokens saved included,
+are in ``stats()``. ``TEXT2SQL_PROMPT_SLICING`` (default off) is the switch.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from typing import Optional
+
+import data_watcher
+
+
+TEXT2SQL_PROMPT_SLICING = os.getenv("TEXT2SQL_PROMPT_SLICING", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+strsectionsconfigfile = "text_to_sql_sections.json"
+
+SECTIONS_CONFIG: dict = {"tags": {}, "sections": {}}
+
+_HEADING_RE = re.compile(r"^(#{2,4}) (.*)$")
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Za-z_]+?)\d*\}\}")
+_TABLE_RE = re.compile(r"\bT_WC_[A-Z0-9_]+\b")
+
+_lock = threading.Lock()
+_index_cache: dict = {"template": None, "index": None}
+_counters = {"full": 0, "sliced": 0, "fallbacks": 0, "tokens_saved": 0}
+
+
+def _normalize_title(title: str) -> str:
+    """Heading text without its leading pictogram and surrounding blanks."""
+    return re.sub(r"^[^\w(\"]+", "", title).strip()
+
+
+def _validate_sections_config(parsed) -> dict:
+    if not isinstance(parsed, dict):
+        raise ValueError("text_to_sql_sections.json must be an object")
+    tags = parsed.get("tags", {})
+    sections = parsed.get("sections", {})
+    if not isinstance(tags, dict) or not isinstance(sections, dict):
+        raise ValueError("'tags' and 'sections' must be objects")
+    config_tags = {}
+    for tag, rule in tags.items():
+        if not isinstance(rule, dict):
+            raise ValueError(f"tag '{tag}' must be an object")
+        keywords = [str(k).lower() for k in rule.get("keywords", [])]
+        config_tags[tag] = {
+            "placeholders": [str(p) for p in rule.get("placeholders", [])],
+            "keywords_re": re.compile(r"(?<!\w)(?:" + "|".join(re.escape(k) for k in keywords) + ")", re.IGNORECASE) if keywords else None,
+            "implies": [str(t) for t in rule.get("implies", [])],
+        }
+    config_sections = {}
+    for title, section_tags in sections.items():
+        if not isinstance(section_tags, list) or not section_tags:
+            raise ValueError(f"section '{title}' must list at least one tag")
+        unknown = [t for t in section_tags if t not in config_tags]
+        if unknown:
+            raise ValueError(f"section '{title}' uses unknown tag(s): {', '.join(unknown)}")
+        config_sections[_normalize_title(title)] = frozenset(section_tags)
+    return {"tags": config_tags, "sections": config_sections}
+
+
+def _on_sections_config_change(content: str) -> None:
+    global SECTIONS_CONFIG
+    try:
+        SECTIONS_CONFIG = _validate_sections_config(json.loads(content))
+        with _lock:
+            _index_cache["template"] = None
+    except Exception as e:
+        # Keep the previous valid config rather than crashing the running app.
+        print(f"[prompt-slice] Failed to reload {strsectionsconfigfile}, keeping previous config: {e}", flush=True)
+
+
+data_watcher.register(strsectionsconfigfile, _on_sections_config_change)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _index(template: str, boundary: str) -> Optional[dict]:
+    """Split the template into its preamble, headed sections and dynamic tail."""
+    static, marker, dynamic = template.partition(boundary)
+    if not marker:
+        return None
+    preamble: list[str] = []
+    sections: list[dict] = []
+    # Open headings by level, for the "(continued)" breadcrumbs and tag inheritance.
+    open_headings: dict[int, dict] = {}
+    for line in static.splitlines(keepends=True):
+        match = _HEADING_RE.match(line.rstrip("\n"))
+        if match:
+            level = len(match.group(1))
+            title = _normalize_title(match.group(2))
+            for deeper in [lvl for lvl in open_headings if lvl >= level]:
+                del open_headings[deeper]
+            parent_tags = next(
+                (open_headings[lvl]["tags"] for lvl in sorted(open_headings, reverse=True) if open_headings[lvl]["tags"]),
+                frozenset(),
+            )
+            top = open_headings.get(2)
+            section = {
+                "title": title,
+                "level": level,
+                "top_heading": top["heading"] if top is not None and level > 2 else None,
+                "heading": line.rstrip("\n"),
+                "tags": SECTIONS_CONFIG["sections"].get(title, parent_tags),
+                "lines": [line],
+            }
+            open_headings[level] = section
+            sections.append(section)
+        elif sections:
+            sections[-1]["lines"].append(line)
+        else:
+            preamble.append(line)
+    for section in sections:
+        section["text"] = "".join(section.pop("lines"))
+    return {"preamble": "".join(preamble), "sections": sections, "dynamic": dynamic}
+
+
+def _cached_index(template: str, boundary: str) -> Optional[dict]:
+    with _lock:
+        if _index_cache["template"] is template:
+            return _index_cache["index"]
+    index = _index(template, boundary)
+    with _lock:
+        _index_cache["template"], _index_cache["index"] = template, index
+    return index
+
+
+def active_tags(question: str) -> set:
+    """Tags whose placeholder types or keywords occur in the anonymized question."""
+    tags_config = SECTIONS_CONFIG["tags"]
+    placeholder_types = set(_PLACEHOLDER_RE.findall(question or ""))
+    active = set()
+    for tag, rule in tags_config.items():
+        if placeholder_types.intersection(rule["placeholders"]):
+            active.add(tag)
+        elif rule["keywords_re"] is not None and rule["keywords_re"].search(question or ""):
+            active.add(tag)
+    pending = list(active)
+    while pending:
+        for implied in tags_config.get(pending.pop(), {}).get("implies", []):
+            if implied not in active:
+                active.add(implied)
+                pending.append(implied)
+    return active
+
+
+def slice_prompt(template: str, question: str, boundary: str) -> Optional[dict]:
+    """The sliced prompt for one anonymized question, or None when the full one applies.
+
+    None when slicing is off, the template has no ``boundary``, or every optional
+    section is needed anyway. Otherwise a dict with the ``prompt`` (placeholders
+    such as ``{user_question}`` still unfilled), the active ``tags``, the ``kept``
+    and ``omitted`` optional section titles, ``omitted_tables`` (tables only an
+    omitted section mentions) and the ``full_tokens`` / ``sliced_tokens`` estimates.
+    """
+    if not TEXT2SQL_PROMPT_SLICING or not template:
+        return None
+    index = _cached_index(template, boundary)
+    if index is None:
+        return None
+    tags = active_tags(question)
+
+    core_parts = [index["preamble"]]
+    extra_parts = []
+    kept, omitted = [], []
+    kept_text, omitted_text = [], []
+    last_top = None
+    for section in index["sections"]:
+        if not section["tags"]:
+            core_parts.append(section["text"])
+            kept_text.append(section["text"])
+        elif section["tags"] & tags:
+            if section["top_heading"] is not None and section["top_heading"] != last_top:
+                extra_parts.append(f"{section['top_heading']} (continued)\n\n")
+                last_top = section["top_heading"]
+            extra_parts.append(section["text"])
+            kept.append(section["title"])
+            kept_text.append(section["text"])
+        else:
+            omitted.append(section["title"])
+            omitted_text.append(section["text"])
+    if not omitted:
+        return None
+
+    core = "".join(core_parts)
+    if not core.endswith("\n"):
+        core += "\n"
+    extra = "".join(extra_parts)
+    prompt = core + boundary + ("\n\n" + extra.rstrip("\n") + "\n" if extra else "") + index["dynamic"]
+    omitted_tables = set(_TABLE_RE.findall("".join(omitted_text))) - set(_TABLE_RE.findall("".join(kept_text)))
+    return {
+        "prompt": prompt,
+        "tags": sorted(tags),
+        "kept": kept,
+        "omitted": omitted,
+        "omitted_tables": omitted_tables,
+        "full_tokens": _estimate_tokens(template),
+        "sliced_tokens": _estimate_tokens(prompt),
+    }
+
+
+def fallback_reason(parsed, sliced: dict) -> Optional[str]:
+    """Why a sliced prompt's answer must be regenerated with the full prompt, or None if it stands."""
+    if not isinstance(parsed, dict):
+        return "unexpected answer type"
+    if "error" in parsed and "raw_content" in parsed:
+        return f"invalid answer ({parsed['error']})"
+    sql_query = parsed.get("sql_query")
+    if not sql_query:
+        return "no SQL returned"
+    used = sorted(set(_TABLE_RE.findall(sql_query)) & sliced["omitted_tables"])
+    if used:
+        return f"uses {', '.join(used)} from an omitted section"
+    return None
+
+
+def record(sliced: Optional[dict], fell_back: bool) -> None:
+    """Count one text-to-SQL prompt: full, sliced, or sliced then regenerated in full."""
+    with _lock:
+        if sliced is None:
+            _counters["full"] += 1
+        elif fell_back:
+            _counters["fallbacks"] += 1
+        else:
+            _counters["sliced"] += 1
+            _counters["tokens_saved"] += sliced["full_tokens"] - sliced["sliced_tokens"]
+
+
+def describe(sliced: dict, reason: Optional[str]) -> str:
+    """One-line summary for the response messages."""
+    saved = sliced["full_tokens"] - sliced["sliced_tokens"]
+    sections_total = len(sliced["kept"]) + len(sliced["omitted"])
+    text = (
+        f"Text-to-SQL prompt sliced for [{', '.join(sliced['tags']) or 'core only'}]: "
+        f"kept {len(sliced['kept'])} of {sections_total} optional sections, "
+        f"~{saved:,} of ~{sliced['full_tokens']:,} prompt tokens saved"
+    )
+    if reason is not None:
+        return text + f"; regenerated with the full prompt ({reason})."
+    return text + "."
+
+
+def stats() -> dict:
+    """Settings and counters since process start."""
+    with _lock:
+        counters = dict(_counters)
+    return {"enabled": TEXT2SQL_PROMPT_SLICING, **counters}
@@ -33,10 +33,11 @@ try:
 except ImportError:
     pass
 
-import pymysql
 from rapidfuzz import process, fuzz
 from rapidfuzz.distance import Levenshtein
 
+import db
+
 def levenshtein_distance(a: str, b: str) -> int:
     return int(Levenshtein.distance(a or "", b or ""))
 
@@ -323,35 +324,25 @@ def build_bktree_for_config(cur, search_cfg: Dict[str, Any]) -> BKTreeIndex:
 # DB Helpers
 # ----------------------------
 def get_db_connection():
-    """Create a PyMySQL connection using environment variables.
+    """Check out a PyMySQL connection from the shared pool (see ``db.py``).
 
     Uses `DictCursor` so `fetchone()` / `fetchall()` return dictionaries.
-    Expects MySQL/MariaDB parameter style `%s`.
+    Expects MySQL/MariaDB parameter style `%s`. `close()` returns the
+    connection to the pool.
 
     Environment variables:
         DB_HOST, DB_PORT, DB_USER, DB_PASS/DB_PASSWORD, DB_NAME
 
     Returns:
-        A live `pymysql.Connection`.
+        A live pooled connection (`db.PooledConnection`).
     """
-    strdbhost = os.getenv("DB_HOST", DB_HOST)
-    lngdbport = int(os.getenv("DB_PORT", str(DB_PORT)))
-    strdbuser = os.getenv("DB_USER", DB_USER)
-    strdbpassword = os.getenv("DB_PASSWORD") or os.getenv("DB_PASS", DB_PASS)
     strdbname = os.getenv("DB_NAME", DB_NAME)
 
     if not strdbname:
         print("ERROR: Set DB_NAME env var (and DB_HOST/DB_USER/DB_PASS as needed).", file=sys.stderr)
         sys.exit(1)
 
-    return pymysql.connect(
-        host=strdbhost,
-        port=lngdbport,
-        user=strdbuser,
-        password=strdbpassword,
-        database=strdbname,
-        cursorclass=pymysql.cursors.DictCursor,
-    )
+    return db.get_connection()
 
 def db_has_norm_columns(
     cur,
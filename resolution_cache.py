@@ -0,0 +1,118 @@
+"""In-process cache of planned entity resolutions.
+
+Resolving one extracted name is the expensive half of ``entity`` planning: a
+BK-tree query, the prefix / FULLTEXT / LIKE fallbacks, the RapidFuzz ranking, a
+``resolve_to_canonical`` lookup, ChromaDB queries and the row lookup behind the
+match. The outcome for ("Person_name", "alain delon") does not change for hours,
+yet every question that missed the SQL cache used to redo all of it. This cache
+sits in front of that work (``entity._plan_entity``):
+
+- **Key.** (placeholder prefix of the matching ``entity_resolution.json`` entry,
+  raw value with case and whitespace folded, guessed language family, year
+  context when a strategy filters on it, fingerprint of the entry's strategies).
+  ``Person_name1`` and ``Person_name2`` share entries; the cached plan is rebound
+  to the requesting placeholder.
+- **Value.** The resolved :class:`entity._PlannedEntity`. Unresolved values (raw
+  fallback) are not stored, so a name added to the database is picked up on the
+  next question.
+- **Eviction.** LRU within ``ENTITY_RESOLUTION_CACHE_SIZE`` entries, plus an
+  ``ENTITY_RESOLUTION_CACHE_TTL`` age limit, since the tables and collections do
+  change underneath.
+- **Invalidation.** :func:`clear` runs when ``entity_resolution.json`` is
+  reloaded and whenever a BK-tree is built: a resolution planned without the tree
+  (or with the previous config) may differ from one planned with it.
+
+The cache is per process: with ``API_WORKERS`` > 1 each worker fills its own.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+ENTITY_RESOLUTION_CACHE_ENABLED = os.getenv("ENTITY_RESOLUTION_CACHE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+ENTITY_RESOLUTION_CACHE_SIZE = max(1, int(os.getenv("ENTITY_RESOLUTION_CACHE_SIZE", "10000")))
+ENTITY_RESOLUTION_CACHE_TTL = float(os.getenv("ENTITY_RESOLUTION_CACHE_TTL", "3600"))
+
+_lock = threading.Lock()
+# key -> (plan, created_at)
+_entries: "OrderedDict[tuple, tuple[object, float]]" = OrderedDict()
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "flushes": 0}
+
+
+def normalize_value(value: str) -> str:
+    """Raw value with surrounding and repeated whitespace removed and case folded."""
+    return " ".join(str(value).split()).casefold()
+
+
+def fingerprint(cfg: dict) -> str:
+    """Digest of one ``entity_resolution.json`` entry (its strategies and their settings)."""
+    return hashlib.sha256(json.dumps(cfg, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(*, prefix: str, value: str, language_family: Optional[str], year: Optional[int], cfg: dict) -> Optional[tuple]:
+    """Cache key of one resolution, or None when the cache is off."""
+    if not ENTITY_RESOLUTION_CACHE_ENABLED:
+        return None
+    return (prefix, normalize_value(value), language_family, year, fingerprint(cfg))
+
+
+def lookup(key: Optional[tuple]) -> Optional[tuple[object, float]]:
+    """``(plan, age in seconds)`` for a live entry, else None."""
+    if key is None:
+        return None
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and ENTITY_RESOLUTION_CACHE_TTL > 0 and time.monotonic() - entry[1] > ENTITY_RESOLUTION_CACHE_TTL:
+            del _entries[key]
+            _counters["expirations"] += 1
+            entry = None
+        if entry is None:
+            _counters["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _counters["hits"] += 1
+        return entry[0], time.monotonic() - entry[1]
+
+
+def store(key: Optional[tuple], plan) -> None:
+    """Cache a resolved plan; it must not be mutated afterwards."""
+    if key is None:
+        return
+    with _lock:
+        _entries[key] = (plan, time.monotonic())
+        _entries.move_to_end(key)
+        _counters["stores"] += 1
+        while len(_entries) > ENTITY_RESOLUTION_CACHE_SIZE:
+            _entries.popitem(last=False)
+            _counters["evictions"] += 1
+
+
+def clear(reason: str) -> None:
+    """Drop every entry (counters are kept)."""
+    with _lock:
+        dropped = len(_entries)
+        _entries.clear()
+        _counters["flushes"] += 1
+    if dropped:
+        print(f"[resolution-cache] Flushed {dropped} planned resolution(s): {reason}.", flush=True)
+
+
+def stats() -> dict:
+    """Settings, occupancy and hit/miss counters since process start."""
+    with _lock:
+        lookups = _counters["hits"] + _counters["misses"]
+        return {
+            "enabled": ENTITY_RESOLUTION_CACHE_ENABLED,
+            "max_entries": ENTITY_RESOLUTION_CACHE_SIZE,
+            "ttl": ENTITY_RESOLUTION_CACHE_TTL,
+            "entries": len(_entries),
+            **_counters,
+            "hit_rate": round(_counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
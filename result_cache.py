@@ -0,0 +1,167 @@
+"""In-process cache of generated-SQL result sets, for paging and repeated SQL.
+
+``search_text2sql`` appends ``LIMIT/OFFSET`` to the resolved SQL and re-runs the
+whole query for every page, so page 5 of an expensive aggregate costs as much as
+page 1 (more, with a deep OFFSET). Different questions that resolve to the same
+SQL re-run it too. This cache sits in front of that execution:
+
+- **Key.** The resolved SQL with pagination stripped, whitespace collapsed
+  outside string literals and any trailing ``;`` removed.
+- **Value.** A bounded prefix of the result: the first ``RESULT_CACHE_PREFIX_ROWS``
+  rows, fetched with one ``LIMIT`` query the first time a page inside that window
+  is requested. When the query returns fewer rows than that, the entry is
+  *complete* and any page, even past the end, is answered from it.
+- **Eviction.** LRU within ``RESULT_CACHE_MAX_BYTES`` (estimated from the rows'
+  JSON size), plus a ``RESULT_CACHE_TTL`` age limit, since MariaDB data does
+  change underneath.
+
+Rows are stored as the cursor returned them. Callers build new dicts from them
+before unescaping or localizing, so a cached entry is never mutated. The cache is
+per process: with ``API_WORKERS`` > 1 each worker fills its own.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+RESULT_CACHE_PREFIX_ROWS = max(1, int(os.getenv("RESULT_CACHE_PREFIX_ROWS", "500")))
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
+# Quoted literals and identifiers are kept verbatim; whitespace between them is collapsed.
+_QUOTED_RE = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`)", re.S)
+
+_lock = threading.Lock()
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+_bytes = 0
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "oversized": 0}
+
+
+class _Entry:
+    __slots__ = ("rows", "complete", "size", "created_at")
+
+    def __init__(self, rows: tuple, complete: bool, size: int) -> None:
+        self.rows = rows
+        self.complete = complete
+        self.size = size
+        self.created_at = time.monotonic()
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside quoted literals and drop a trailing semicolon."""
+    parts = _QUOTED_RE.split(sql.strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _key(sql: str) -> str:
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()
+
+
+def fits(offset: int, limit: int) -> bool:
+    """True when the page ``[offset, offset + limit)`` lies inside the cached prefix window."""
+    return RESULT_CACHE_ENABLED and offset + limit <= RESULT_CACHE_PREFIX_ROWS
+
+
+def prefix_sql(sql: str) -> str:
+    """The statement that fetches the cacheable prefix of the unpaginated ``sql``."""
+    return f"{sql} LIMIT {RESULT_CACHE_PREFIX_ROWS}"
+
+
+def lookup(sql: str, offset: int, limit: int) -> Optional[dict]:
+    """Return the requested page from the cache, or None on a miss.
+
+    Args:
+        sql: The resolved SQL without its pagination clause.
+        offset: Absolute offset of the page.
+        limit: Page size.
+
+    Returns:
+        ``{"rows", "cached_rows", "complete", "age"}`` when the page can be answered
+        from a live entry, else None.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+    key = _key(sql)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and RESULT_CACHE_TTL > 0 and time.monotonic() - entry.created_at > RESULT_CACHE_TTL:
+            _drop(key)
+            _counters["expirations"] += 1
+            entry = None
+        if entry is None or (not entry.complete and offset + limit > len(entry.rows)):
+            _counters["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _counters["hits"] += 1
+        return {
+            "rows": entry.rows[offset:offset + limit],
+            "cached_rows": len(entry.rows),
+            "complete": entry.complete,
+            "age": time.monotonic() - entry.created_at,
+        }
+
+
+def store(sql: str, rows) -> bool:
+    """Cache the prefix ``rows`` fetched by ``prefix_sql(sql)``; return False when it does not fit."""
+    global _bytes
+    if not RESULT_CACHE_ENABLED:
+        return False
+    rows = tuple(rows)
+    size = len(json.dumps(rows, default=str))
+    if size > RESULT_CACHE_MAX_BYTES:
+        with _lock:
+            _counters["oversized"] += 1
+        return False
+    key = _key(sql)
+    entry = _Entry(rows, complete=len(rows) < RESULT_CACHE_PREFIX_ROWS, size=size)
+    with _lock:
+        if key in _entries:
+            _drop(key)
+        _entries[key] = entry
+        _bytes += size
+        _counters["stores"] += 1
+        while _bytes > RESULT_CACHE_MAX_BYTES and _entries:
+            _drop(next(iter(_entries)))
+            _counters["evictions"] += 1
+    return True
+
+
+def _drop(key: str) -> None:
+    """Remove one entry; the caller holds ``_lock``."""
+    global _bytes
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        _bytes -= entry.size
+
+
+def clear() -> None:
+    """Drop every entry (counters are kept)."""
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _bytes = 0
+
+
+def stats() -> dict:
+    """Settings, occupancy and hit/miss counters since process start."""
+    with _lock:
+        return {
+            "enabled": RESULT_CACHE_ENABLED,
+            "prefix_rows": RESULT_CACHE_PREFIX_ROWS,
+            "ttl": RESULT_CACHE_TTL,
+            "max_bytes": RESULT_CACHE_MAX_BYTES,
+            "entries": len(_entries),
+            "bytes": _bytes,
+            **_counters,
+        }
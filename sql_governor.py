@@ -0,0 +1,183 @@
+"""Execution governor for LLM-generated SQL.
+
+The text-to-SQL step can produce any SELECT, and ``search_text2sql`` used to
+run it as-is. One unbounded join over the person and movie tables (~890k and
+~620k rows) can pin a MariaDB thread for minutes, long after the client has
+given up. The governor puts three guards around that execution:
+
+1. **Statement timeout.** Every generated query runs as
+   ``SET STATEMENT max_statement_time=N FOR <sql>`` (MariaDB 10.1+), so the
+   server aborts it after ``SQL_MAX_STATEMENT_TIME`` seconds. The timeout
+   surfaces as an ordinary execution error, so it takes the existing
+   SQL-execution-error retry path.
+2. **EXPLAIN cost gate (optional).** With ``SQL_EXPLAIN_GATE`` set, the query is
+   EXPLAINed first. The estimated row count is the largest product of the
+   ``rows`` estimates within one SELECT, i.e. the join fan-out the optimizer
+   expects. It is then compared with ``SQL_EXPLAIN_MAX_ROWS``. Over budget, the
+   gate either only reports it (``warn``), runs the query under a much tighter
+   ``SQL_EXPLAIN_THROTTLED_STATEMENT_TIME`` (``throttle``), or refuses to run it
+   (``reject``). A rejection is reported to the caller as an execution failure,
+   so it flows into the complex-question retry exactly like a MariaDB error.
+3. **Reporting.** ``govern()`` returns a verdict dict (verdict, estimated rows,
+   budget, plan summary, statement time) for the response's ``messages`` and its
+   ``sql_governor`` field. Process-wide counters per verdict are exposed through
+   ``stats()``.
+
+EXPLAIN ignores LIMIT in its row estimates, so ``ORDER BY ... LIMIT 50`` over a
+large table still reports the full scan. Start with ``warn`` and read the
+reported estimates before choosing a budget for ``reject``.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Optional
+
+
+SQL_MAX_STATEMENT_TIME = float(os.getenv("SQL_MAX_STATEMENT_TIME", "30"))
+SQL_EXPLAIN_GATE = os.getenv("SQL_EXPLAIN_GATE", "off").strip().lower()
+if SQL_EXPLAIN_GATE not in {"off", "warn", "throttle", "reject"}:
+    print(f"[sql-governor] Unknown SQL_EXPLAIN_GATE '{SQL_EXPLAIN_GATE}', using 'off'.", flush=True)
+    SQL_EXPLAIN_GATE = "off"
+SQL_EXPLAIN_MAX_ROWS = int(float(os.getenv("SQL_EXPLAIN_MAX_ROWS", "10000000")))
+SQL_EXPLAIN_THROTTLED_STATEMENT_TIME = float(os.getenv("SQL_EXPLAIN_THROTTLED_STATEMENT_TIME", "5"))
+
+# MariaDB ER_STATEMENT_TIMEOUT: "Query execution was interrupted (max_statement_time exceeded)".
+ER_STATEMENT_TIMEOUT = 1969
+
+_counters_lock = threading.Lock()
+_counters: dict[str, int] = {}
+
+
+class CostRejected(RuntimeError):
+    """The EXPLAIN gate refused to run a query whose estimated rows exceed the budget."""
+
+
+def _count(key: str) -> None:
+    with _counters_lock:
+        _counters[key] = _counters.get(key, 0) + 1
+
+
+def with_statement_time(sql: str, seconds: float) -> str:
+    """Prefix ``sql`` with a per-statement MariaDB timeout (no-op when ``seconds`` <= 0)."""
+    if seconds <= 0:
+        return sql
+    return f"SET STATEMENT max_statement_time={seconds:g} FOR {sql}"
+
+
+def is_statement_timeout(exc: BaseException) -> bool:
+    """True when ``exc`` is MariaDB aborting a query on max_statement_time."""
+    args = getattr(exc, "args", ())
+    if args and args[0] == ER_STATEMENT_TIMEOUT:
+        return True
+    return "max_statement_time" in str(exc).lower()
+
+
+def explain(cursor, sql: str) -> dict:
+    """EXPLAIN ``sql`` and summarize the plan.
+
+    Returns:
+        dict with ``estimated_rows`` (largest product of per-table ``rows`` within one
+        SELECT id) and ``plan`` (one short ``table:type/key~rows`` string per plan row).
+    """
+    cursor.execute(f"EXPLAIN {sql}")
+    rows = cursor.fetchall()
+    fanout_by_select: dict[Any, float] = {}
+    plan = []
+    for row in rows:
+        est = row.get("rows")
+        try:
+            est = float(est) if est is not None else 1.0
+        except (TypeError, ValueError):
+            est = 1.0
+        select_id = row.get("id")
+        fanout_by_select[select_id] = fanout_by_select.get(select_id, 1.0) * max(est, 1.0)
+        plan.append(
+            f"{row.get('table') or '-'}:{row.get('type') or '-'}"
+            f"/{row.get('key') or 'no key'}~{int(est)}"
+        )
+    estimated = max(fanout_by_select.values()) if fanout_by_select else 0.0
+    return {"estimated_rows": int(min(estimated, 1e18)), "plan": plan}
+
+
+def govern(cursor, sql: str, max_statement_time: Optional[float] = None) -> dict:
+    """Decide how (and whether) to run ``sql``; blocking, run it via ``db.run_db``.
+
+    Args:
+        cursor: Cursor on the connection the query will run on (EXPLAIN uses it too).
+        sql: The final, paginated SQL.
+        max_statement_time: Overrides SQL_MAX_STATEMENT_TIME (e.g. to fit a deadline).
+
+    Returns:
+        The verdict dict. ``sql`` holds the statement to execute. When
+        ``verdict == "rejected"`` the caller must not execute anything.
+    """
+    statement_time = SQL_MAX_STATEMENT_TIME if max_statement_time is None else float(max_statement_time)
+    verdict = {
+        "verdict": "ok",
+        "gate": SQL_EXPLAIN_GATE,
+        "estimated_rows": None,
+        "budget": SQL_EXPLAIN_MAX_ROWS if SQL_EXPLAIN_GATE != "off" else None,
+        "plan": [],
+        "statement_time": statement_time if statement_time > 0 else None,
+        "sql": sql,
+    }
+    if SQL_EXPLAIN_GATE != "off":
+        try:
+            summary = explain(cursor, sql)
+        except Exception as exc:
+            # A query EXPLAIN cannot parse will fail on execution too; let that path report it.
+            verdict["verdict"] = "explain_failed"
+            verdict["plan"] = [f"{type(exc).__name__}: {exc}"]
+            summary = None
+        if summary is not None:
+            verdict["estimated_rows"] = summary["estimated_rows"]
+            verdict["plan"] = summary["plan"]
+            if summary["estimated_rows"] > SQL_EXPLAIN_MAX_ROWS:
+                if SQL_EXPLAIN_GATE == "reject":
+                    verdict["verdict"] = "rejected"
+                    verdict["sql"] = None
+                elif SQL_EXPLAIN_GATE == "throttle":
+                    verdict["verdict"] = "throttled"
+                    throttled = SQL_EXPLAIN_THROTTLED_STATEMENT_TIME
+                    statement_time = min(statement_time, throttled) if statement_time > 0 else throttled
+                    verdict["statement_time"] = statement_time
+                else:
+                    verdict["verdict"] = "over_budget"
+    if verdict["sql"] is not None:
+        verdict["sql"] = with_statement_time(sql, statement_time)
+    _count(verdict["verdict"])
+    return verdict
+
+
+def record_timeout() -> None:
+    """Count a query the server aborted on max_statement_time."""
+    _count("timed_out")
+
+
+def describe(verdict: dict) -> str:
+    """One-line human summary of a verdict for the response messages."""
+    parts = [f"SQL governor verdict: {verdict['verdict']}"]
+    if verdict.get("estimated_rows") is not None:
+        parts.append(f"estimated rows {verdict['estimated_rows']:,} (budget {verdict['budget']:,})")
+    if verdict.get("statement_time"):
+        parts.append(f"max_statement_time {verdict['statement_time']:g}s")
+    text = "; ".join(parts) + "."
+    if verdict.get("plan"):
+        text += " Plan: " + ", ".join(verdict["plan"][:8])
+        if len(verdict["plan"]) > 8:
+            text += f", … (+{len(verdict['plan']) - 8})"
+    return text
+
+
+def stats() -> dict:
+    """Settings and per-verdict counters since process start."""
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        "max_statement_time": SQL_MAX_STATEMENT_TIME,
+        "explain_gate": SQL_EXPLAIN_GATE,
+        "explain_max_rows": SQL_EXPLAIN_MAX_ROWS,
+        "verdicts": counters,
+    }
@@ -3,13 +3,22 @@ import numpy as np
 #pip install psutil
 import psutil
 
+import asyncio
 import os
 import json
 import re
 import contextvars
 
+import context_cache
 import data_watcher
+import deadline
 import json_guardrails
+import llm_cache
+import llm_clients
+import llm_hedging
+import llm_scheduler
+import model_registry
+import prompt_slicer
 from dotenv import load_dotenv
 import openai
 try:
@@ -70,11 +79,17 @@ complex_question_prompt_template = ""
 
 def _on_text2sql_prompt_change(content: str) -> None:
     global text2sql_prompt_template
+    if text2sql_prompt_template and content != text2sql_prompt_template:
+        llm_cache.invalidate(["text2sql"])
+        context_cache.invalidate(["text2sql"])
     text2sql_prompt_template = content
 
 
 def _on_complex_question_prompt_change(content: str) -> None:
     global complex_question_prompt_template
+    if complex_question_prompt_template and content != complex_question_prompt_template:
+        llm_cache.invalidate(["complex_question"])
+        context_cache.invalidate(["complex_question"])
     complex_question_prompt_template = content
 
 
@@ -172,6 +187,7 @@ def _log_openai_cache_usage(response, *, model_norm: str, label: str = "text2sql
         if details is not None:
             cached_tokens = getattr(details, "cached_tokens", 0) or 0
         ratio = (cached_tokens / prompt_tokens) if prompt_tokens else 0.0
+        context_cache.observe(label, "openai", prompt_tokens or 0, cached_tokens)
         _record_prompt_cache_event(
             f"Prompt cache ({label}): provider=openai, model={model_norm}, "
             f"prompt_tokens={prompt_tokens}, cached_tokens={cached_tokens}, "
@@ -200,6 +216,7 @@ def _log_anthropic_cache_usage(message, *, model_norm: str, label: str = "text2s
         cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
         total = input_tokens + cache_write + cache_read
         ratio = (cache_read / total) if total else 0.0
+        context_cache.observe(label, "anthropic", total, cache_read)
         _record_prompt_cache_event(
             f"Prompt cache ({label}): provider=anthropic, model={model_norm}, "
             f"input_tokens={input_tokens}, cache_write={cache_write}, "
@@ -215,7 +232,7 @@ def _log_gemini_cache_usage(response, *, model_norm: str, label: str = "text2sql
     Implicit caching is automatic on Gemini 2.x (prefix-based, like OpenAI); the
     hit shows up as ``usage_metadata.cached_content_token_count > 0``.
     ``prompt_token_count`` is the full (effective) prompt size including any
-    cached content. Explicit ``CachedContent`` is not used here.
+    cached content, implicit or explicit (context_cache.py).
     """
     try:
         usage = getattr(response, "usage_metadata", None)
@@ -224,6 +241,7 @@ def _log_gemini_cache_usage(response, *, model_norm: str, label: str = "text2sql
         prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
         cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
         ratio = (cached_tokens / prompt_tokens) if prompt_tokens else 0.0
+        context_cache.observe(label, "google", prompt_tokens, cached_tokens)
         _record_prompt_cache_event(
             f"Prompt cache ({label}): provider=google, model={model_norm}, "
             f"prompt_tokens={prompt_tokens}, cached_tokens={cached_tokens}, "
@@ -252,156 +270,769 @@ def _build_anthropic_user_content(user_prompt: str):
     return user_prompt
 
 
-def _call_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str = "text2sql") -> str:
+def _record_llm_http_event(message_text: str) -> None:
+    """Print an LLM connection observation and record it for the API response messages."""
+    print("[llm-http] " + message_text)
+    buffer = _prompt_cache_events.get()
+    if buffer is not None:
+        buffer.append({"text": message_text})
+
+
+def _record_llm_queue_event(cache_label: str, provider: str, model_norm: str, waited: float) -> None:
+    """Record a noticeable wait for a provider slot (llm_scheduler.py) in the response messages."""
+    if waited < 0.01:
+        return
+    message_text = f"LLM scheduler ({cache_label}): queued {waited:.2f}s for a slot on {provider}/{model_norm}."
+    print("[llm-scheduler] " + message_text)
+    buffer = _prompt_cache_events.get()
+    if buffer is not None:
+        buffer.append({"text": message_text})
+
+
+def _llm_cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float):
+    """Response-cache key of one chat call (None when it is not cacheable, see llm_cache.py)."""
+    model_norm, provider = _route_llm_model(model)
+    return llm_cache.make_key(
+        provider=provider, model=model_norm, system_prompt=system_prompt,
+        user_prompt=user_prompt, temperature=temperature,
+    )
+
+
+def _record_llm_cache_event(cache_label: str, tier: str, stored: bool = True) -> None:
+    """Record the response-cache outcome of one call, with the step's running counters."""
+    counters = llm_cache.stats()["labels"].get(cache_label, {})
+    hits = counters.get("memory_hits", 0) + counters.get("disk_hits", 0)
+    if tier != "miss":
+        outcome = f"hit ({tier})"
+    else:
+        outcome = "miss, response stored" if stored else "miss, response not stored (it did not validate)"
+    message_text = (
+        f"LLM response cache ({cache_label}): {outcome}; "
+        f"{hits} hit(s) / {counters.get('misses', 0)} miss(es) for this step in this worker."
+    )
+    print("[llm-cache] " + message_text)
+    buffer = _prompt_cache_events.get()
+    if buffer is not None:
+        buffer.append({"text": message_text})
+
+
+def _call_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str = "text2sql", validate=None) -> str:
     """Call the selected LLM and return raw text content.
 
+    Temperature-0 replies are served from the response cache when possible
+    (llm_cache.py); otherwise the call waits for a provider slot (llm_scheduler.py).
+    Provider clients are long-lived and pooled (llm_clients.py); whether this call
+    reused a keep-alive connection or opened a new one is reported next to the
+    prompt-cache observations.
+
     Args:
         cache_label: Pipeline step name used to tag prompt-cache observations
             (e.g. "entity_extraction", "text2sql", "complex_question").
+        validate: Called with the reply that is about to be returned; a reply is
+            only cached when it returns True, and a cached reply it rejects is
+            dropped and fetched again. None caches every reply.
+    """
+    key = _llm_cache_key(model, system_prompt, user_prompt, temperature)
+    cached, tier = llm_cache.get(key, cache_label)
+    if cached is not None:
+        if validate is None or validate(cached):
+            _record_llm_cache_event(cache_label, tier)
+            return cached
+        llm_cache.discard(key, cache_label)
+        tier = "miss"
+    model_norm, provider = _route_llm_model(model)
+    tokens = llm_scheduler.estimate_tokens(system_prompt, user_prompt)
+    with llm_scheduler.slot(provider, model_norm, tokens, cache_label) as waited:
+        _record_llm_queue_event(cache_label, provider, model_norm, waited)
+        with llm_clients.observe() as observation, llm_hedging.provider_call():
+            try:
+                text = _dispatch_chat_llm(
+                    model=model, system_prompt=system_prompt, user_prompt=user_prompt,
+                    temperature=temperature, cache_label=cache_label,
+                )
+            finally:
+                if observation["requests"]:
+                    _record_llm_http_event(f"LLM connection ({cache_label}): {llm_clients.describe(observation)}.")
+    stored = validate is None or validate(text)
+    if stored:
+        llm_cache.put(key, cache_label, text)
+    if key is not None:
+        _record_llm_cache_event(cache_label, tier, stored)
+    return text
+
+
+def _is_valid_payload(parsed) -> bool:
+    """False for the error dicts a step parser returns on unparsable or guardrail-rejected output.
+
+    Those carry the offending ``raw_content``; an ``{"error": ...}`` the model itself
+    chose to return is a handled answer and counts as valid.
+    """
+    return not (isinstance(parsed, dict) and "error" in parsed and "raw_content" in parsed)
+
+
+class _CheckedReply:
+    """A ``validate`` callback for the chat calls that keeps the parse of the reply it checked.
+
+    The chat calls run it on the reply they return, so ``result`` is that reply
+    parsed, without parsing it a second time.
+    """
+
+    def __init__(self, parse, accept=_is_valid_payload):
+        self.parse = parse
+        self.accept = accept
+        self.result = None
+
+    def __call__(self, text: str) -> bool:
+        self.result = self.parse(text)
+        return bool(self.accept(self.result))
+
+
+def _record_llm_hedging_event(decision: dict) -> None:
+    message_text = llm_hedging.describe(decision)
+    print("[llm-hedging] " + message_text)
+    buffer = _prompt_cache_events.get()
+    if buffer is not None:
+        buffer.append({"text": message_text})
+
+
+def _hedged_chat_llm(call: dict, parse, accept=_is_valid_payload):
+    """Run one step's chat call and parse it, failing over per its hedging policy (llm_hedging.py).
+
+    Args:
+        call: _call_chat_llm keyword arguments; ``cache_label`` selects the policy.
+        parse: Turns the raw reply into the step's result.
+        accept: True when a parsed result is valid (a failed one fires the backup).
+    """
+    def attempt(model: str):
+        checked = _CheckedReply(parse, accept)
+        _call_chat_llm(**{**call, "model": model}, validate=checked)
+        return checked.result
+
+    result, decision = llm_hedging.failover(call["cache_label"], call["model"], attempt, accept)
+    if decision is not None:
+        _record_llm_hedging_event(decision)
+    return result
+
+
+async def _ahedged_chat_llm(call: dict, parse, accept=_is_valid_payload):
+    """Async twin of _hedged_chat_llm that also hedges a slow primary with the backup model."""
+    async def attempt(model: str):
+        checked = _CheckedReply(parse, accept)
+        await _acall_chat_llm(**{**call, "model": model}, validate=checked)
+        return checked.result
+
+    result, decision = await llm_hedging.race(call["cache_label"], call["model"], attempt, accept)
+    if decision is not None:
+        _record_llm_hedging_event(decision)
+    return result
+
+
+def _dispatch_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str) -> str:
+    """Send one chat call through its provider's SDK client (the body of _call_chat_llm)."""
+    request = _ChatRequest(model=model, system_prompt=system_prompt, user_prompt=user_prompt, temperature=temperature, cache_label=cache_label)
+    client = request.client()
+
+    if request.provider in {"openai", "openrouter"}:
+        if request.uses_responses_api():
+            try:
+                return request.responses_text(client.responses.create(**request.responses_kwargs()))
+            except Exception as exc:
+                request.responses_failed(exc)
+        return request.chat_text(client.chat.completions.create(**request.chat_kwargs()))
+
+    if request.provider == "anthropic":
+        return request.anthropic_text(client.messages.create(**request.anthropic_kwargs()))
+
+    walk = _GeminiWalk(request.model_norm)
+    for candidate in walk:
+        try:
+            cached_content, contents = request.gemini_contents(client, candidate)
+            try:
+                res = client.models.generate_content(**request.gemini_kwargs(candidate, contents, cached_content))
+            except Exception as e:
+                retry_kwargs = request.gemini_uncached_kwargs(candidate, cached_content, e)
+                if retry_kwargs is None:
+                    raise
+                res = client.models.generate_content(**retry_kwargs)
+            text = _gemini_text(res, candidate, request.cache_label)
+            walk.succeeded(candidate)
+            return text
+        except Exception as e:
+            if walk.skip(candidate, e):
+                continue
+            raise
+    raise walk.exhausted()
+
+
+async def _acall_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str = "text2sql", validate=None) -> str:
+    """Async twin of _call_chat_llm, on the providers' async clients.
+
+    Same routing, prompts, timeouts, ``validate`` contract and observations; the
+    call awaits the network instead of holding a worker thread, and cancelling the
+    awaiting task cancels the HTTP request itself.
+    """
+    key = _llm_cache_key(model, system_prompt, user_prompt, temperature)
+    cached, tier = None, "miss"
+    if key is not None:
+        cached, tier = await asyncio.to_thread(llm_cache.get, key, cache_label)
+    if cached is not None:
+        if validate is None or validate(cached):
+            _record_llm_cache_event(cache_label, tier)
+            return cached
+        await asyncio.to_thread(llm_cache.discard, key, cache_label)
+        tier = "miss"
+    model_norm, provider = _route_llm_model(model)
+    tokens = llm_scheduler.estimate_tokens(system_prompt, user_prompt)
+    async with llm_scheduler.aslot(provider, model_norm, tokens, cache_label) as waited:
+        _record_llm_queue_event(cache_label, provider, model_norm, waited)
+        with llm_clients.observe() as observation, llm_hedging.provider_call():
+            try:
+                text = await _adispatch_chat_llm(
+                    model=model, system_prompt=system_prompt, user_prompt=user_prompt,
+                    temperature=temperature, cache_label=cache_label,
+                )
+            finally:
+                if observation["requests"]:
+                    _record_llm_http_event(f"LLM connection ({cache_label}): {llm_clients.describe(observation)}.")
+    stored = validate is None or validate(text)
+    if key is not None:
+        if stored:
+            await asyncio.to_thread(llm_cache.put, key, cache_label, text)
+        _record_llm_cache_event(cache_label, tier, stored)
+    return text
+
+
+async def _adispatch_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str) -> str:
+    """Send one chat call through its provider's async SDK client (the body of _acall_chat_llm)."""
+    request = _ChatRequest(model=model, system_prompt=system_prompt, user_prompt=user_prompt, temperature=temperature, cache_label=cache_label)
+    client = request.client(asynchronous=True)
+
+    if request.provider in {"openai", "openrouter"}:
+        if request.uses_responses_api():
+            try:
+                return request.responses_text(await client.responses.create(**request.responses_kwargs()))
+            except Exception as exc:
+                request.responses_failed(exc)
+        return request.chat_text(await client.chat.completions.create(**request.chat_kwargs()))
+
+    if request.provider == "anthropic":
+        return request.anthropic_text(await client.messages.create(**request.anthropic_kwargs()))
+
+    walk = _GeminiWalk(request.model_norm)
+    for candidate in walk:
+        try:
+            cached_content, contents = await asyncio.to_thread(request.gemini_contents, llm_clients.genai_client(google_api_key), candidate)
+            try:
+                res = await client.aio.models.generate_content(**request.gemini_kwargs(candidate, contents, cached_content))
+            except Exception as e:
+                retry_kwargs = request.gemini_uncached_kwargs(candidate, cached_content, e)
+                if retry_kwargs is None:
+                    raise
+                res = await client.aio.models.generate_content(**retry_kwargs)
+            text = _gemini_text(res, candidate, request.cache_label)
+            walk.succeeded(candidate)
+            return text
+        except Exception as e:
+            if walk.skip(candidate, e):
+                continue
+            raise
+    raise walk.exhausted()
+
+
+async def _astream_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str = "text2sql", validate=None):
+    """Streaming form of _acall_chat_llm: an async generator of text deltas.
+
+    Same response cache, ``validate`` contract, provider slot and connection
+    observations. A cache hit yields the whole cached reply at once; the
+    concatenated deltas of a streamed reply are validated and stored once the
+    stream completes. Models without a streaming path here (OpenAI o1/o3) yield
+    their whole reply as a single delta.
+    """
+    key = _llm_cache_key(model, system_prompt, user_prompt, temperature)
+    cached, tier = None, "miss"
+    if key is not None:
+        cached, tier = await asyncio.to_thread(llm_cache.get, key, cache_label)
+    if cached is not None:
+        if validate is None or validate(cached):
+            _record_llm_cache_event(cache_label, tier)
+            yield cached
+            return
+        await asyncio.to_thread(llm_cache.discard, key, cache_label)
+        tier = "miss"
+    model_norm, provider = _route_llm_model(model)
+    tokens = llm_scheduler.estimate_tokens(system_prompt, user_prompt)
+    parts = []
+    async with llm_scheduler.aslot(provider, model_norm, tokens, cache_label) as waited:
+        _record_llm_queue_event(cache_label, provider, model_norm, waited)
+        with llm_clients.observe() as observation:
+            try:
+                async for delta in _astream_dispatch_chat_llm(
+                    model=model, system_prompt=system_prompt, user_prompt=user_prompt,
+                    temperature=temperature, cache_label=cache_label,
+                ):
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                if observation["requests"]:
+                    _record_llm_http_event(f"LLM connection ({cache_label}): {llm_clients.describe(observation)}.")
+    text = "".join(parts)
+    if not text:
+        raise RuntimeError(f"Empty streamed response from {provider or 'LLM'} ({model_norm})")
+    stored = validate is None or validate(text)
+    if key is not None:
+        if stored:
+            await asyncio.to_thread(llm_cache.put, key, cache_label, text)
+        _record_llm_cache_event(cache_label, tier, stored)
+
+
+async def _astream_dispatch_chat_llm(*, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str):
+    """Stream one chat call through its provider's async SDK client (the body of _astream_chat_llm)."""
+    request = _ChatRequest(model=model, system_prompt=system_prompt, user_prompt=user_prompt, temperature=temperature, cache_label=cache_label)
+    if not request.streams():
+        yield await _adispatch_chat_llm(
+            model=model, system_prompt=system_prompt, user_prompt=user_prompt,
+            temperature=temperature, cache_label=cache_label,
+        )
+        return
+    client = request.client(asynchronous=True)
+
+    if request.provider in {"openai", "openrouter"}:
+        stream = await client.chat.completions.create(**request.chat_kwargs(stream=True))
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if request.provider == "openai" and getattr(chunk, "usage", None) is not None:
+                _log_openai_cache_usage(chunk, model_norm=request.model_norm, label=request.cache_label)
+        return
+
+    if request.provider == "anthropic":
+        async with client.messages.stream(**request.anthropic_kwargs()) as stream:
+            async for delta in stream.text_stream:
+                yield delta
+            message = await stream.get_final_message()
+        _log_anthropic_cache_usage(message, model_norm=request.model_norm, label=request.cache_label)
+        return
+
+    walk = _GeminiWalk(request.model_norm)
+    for candidate in walk:
+        emitted = False
+        try:
+            cached_content, contents = await asyncio.to_thread(request.gemini_contents, llm_clients.genai_client(google_api_key), candidate)
+            try:
+                stream = await client.aio.models.generate_content_stream(**request.gemini_kwargs(candidate, contents, cached_content))
+            except Exception as e:
+                retry_kwargs = request.gemini_uncached_kwargs(candidate, cached_content, e)
+                if retry_kwargs is None:
+                    raise
+                stream = await client.aio.models.generate_content_stream(**retry_kwargs)
+            last_chunk = None
+            async for chunk in stream:
+                last_chunk = chunk
+                if getattr(chunk, "text", None):
+                    emitted = True
+                    yield chunk.text
+            if last_chunk is not None:
+                _log_gemini_cache_usage(last_chunk, model_norm=candidate, label=request.cache_label)
+            walk.succeeded(candidate)
+            return
+        except Exception as e:
+            # A candidate can only be swapped before any of its text went out.
+            if walk.skip(candidate, e, emitted=emitted):
+                continue
+            raise
+    raise walk.exhausted()
+
+
+# --- Provider plumbing shared by the sync, async and streaming transports -----
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def _route_llm_model(model: str) -> tuple[str, str]:
+    """Resolve model aliases and return ``(model_name, provider)``.
+
+    provider is one of "openai", "openrouter", "anthropic", "gemini", or "" when
+    no provider serves the model.
     """
     model_norm = str(model).strip()
     if model_norm == "gemma-4":
         model_norm = "google/gemma-4-26b-a4b-it:free"
     if model_norm == "gemma-4-google":
         model_norm = "gemma-4-26b-a4b-it"
+    if model_norm in {"gpt-4o"} or model_norm.startswith("gpt-") or model_norm.startswith("o1") or model_norm.startswith("o3"):
+        return model_norm, "openai"
+    if model_norm == "google/gemma-4-26b-a4b-it:free" or model_norm.startswith("google/"):
+        return model_norm, "openrouter"
+    if model_norm.startswith("claude-"):
+        return model_norm, "anthropic"
+    if model_norm.startswith("gemini-") or model_norm.startswith("gemma-4-"):
+        return model_norm, "gemini"
+    return model_norm, ""
 
-    # Anthropic splits the user prompt on CACHE_BOUNDARY_MARKER to place an explicit
-    # cache breakpoint; every other provider gets the marker stripped (their caching
-    # is automatic/prefix-based, so the sentinel would only pollute the prompt text).
-    user_prompt_plain = user_prompt.replace(CACHE_BOUNDARY_MARKER, "")
 
-    if model_norm in {"gpt-4o"} or model_norm.startswith("gpt-") or model_norm.startswith("o1") or model_norm.startswith("o3"):
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY not found in environment variables")
-        client = openai.OpenAI(api_key=api_key)
+def _require_key(value, env_name: str) -> str:
+    if not value:
+        raise RuntimeError(f"{env_name} not found in environment variables")
+    return value
 
-        if model_norm.startswith("o1") or model_norm.startswith("o3"):
-            try:
-                response = client.responses.create(
-                    model=model_norm,
-                    input=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt_plain},
-                    ],
-                    temperature=temperature,
-                )
-                _log_openai_cache_usage(response, model_norm=model_norm, label=cache_label)
-                out_text = getattr(response, "output_text", None)
-                if out_text:
-                    return out_text
-                raise RuntimeError("No output_text in OpenAI Responses API response")
-            except Exception:
-                # Fallback to chat.completions for environments where Responses API isn't available
-                pass
-
-        response = client.chat.completions.create(
-            model=model_norm,
-            temperature=temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_plain},
-            ],
+
+def _deadline_call_options() -> tuple[dict, dict]:
+    """Per-call SDK timeout and client retry options derived from the request deadline.
+
+    The SDK call may use at most what is left of the current stage slice
+    (deadline.py). SDK-level retries are disabled under a deadline, since each retry
+    would restart the timeout.
+    """
+    request_timeout = deadline.call_timeout()
+    if request_timeout is None:
+        return {}, {}
+    return {"timeout": request_timeout}, {"max_retries": 0}
+
+
+def _openai_cache_kwargs(cache_label: str, system_prompt: str, user_prompt: str) -> dict:
+    """``prompt_cache_key`` routing hint for an OpenAI call whose prompt has a static prefix (context_cache.py)."""
+    if CACHE_BOUNDARY_MARKER not in user_prompt:
+        return {}
+    key = context_cache.openai_prompt_cache_key(cache_label, system_prompt, user_prompt.split(CACHE_BOUNDARY_MARKER, 1)[0])
+    # Sent through extra_body so that SDK releases predating the parameter pass it along too.
+    return {"extra_body": {"prompt_cache_key": key}} if key else {}
+
+
+def _gemini_cached_request(client, candidate: str, system_prompt: str, user_prompt: str, cache_label: str):
+    """``(cached_content, contents)`` for a Gemini call: the explicit cache handle of the
+    static prefix and the dynamic suffix, or ``(None, full prompt)`` (context_cache.py).
+
+    Blocking: may create or extend the handle.
+    """
+    if CACHE_BOUNDARY_MARKER in user_prompt:
+        static_prefix, dynamic_suffix = user_prompt.split(CACHE_BOUNDARY_MARKER, 1)
+        cached_content = context_cache.gemini_cached_content(
+            client, model=candidate, system_prompt=system_prompt, static_prefix=static_prefix, label=cache_label,
         )
+        if cached_content is not None:
+            return cached_content, dynamic_suffix
+    return None, user_prompt.replace(CACHE_BOUNDARY_MARKER, "")
+
+
+def _openai_messages(system_prompt: str, user_prompt_plain: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt_plain},
+    ]
+
+
+def _openai_responses_text(response, model_norm: str, cache_label: str) -> str:
+    _log_openai_cache_usage(response, model_norm=model_norm, label=cache_label)
+    out_text = getattr(response, "output_text", None)
+    if out_text:
+        return out_text
+    raise RuntimeError("No output_text in OpenAI Responses API response")
+
+
+def _openai_chat_text(response, model_norm: str, cache_label, provider_label: str) -> str:
+    """Text of a chat.completions response; cache usage is logged when ``cache_label`` is set."""
+    if cache_label is not None:
         _log_openai_cache_usage(response, model_norm=model_norm, label=cache_label)
-        if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
-            raise RuntimeError("No content in OpenAI API response")
-        return response.choices[0].message.content
+    if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
+        raise RuntimeError(f"No content in {provider_label} API response")
+    return response.choices[0].message.content
+
+
+def _gemini_candidates(model_norm: str) -> list:
+    """The requested Gemini model, then the fallbacks tried on NOT_FOUND."""
+    models_to_try = [model_norm]
+    if model_norm.startswith("gemini-"):
+        if not model_norm.endswith("-latest"):
+            models_to_try.append(f"{model_norm}-latest")
+
+        for m in [
+            "gemini-2.5-flash",
+            "gemini-1.5-pro",
+            "gemini-1.5-pro-latest",
+            "gemini-1.5-flash",
+            "gemini-1.5-flash-latest",
+            "gemini-1.5-pro-002",
+            "gemini-1.5-flash-002",
+            "gemini-1.0-pro",
+        ]:
+            if m not in models_to_try:
+                models_to_try.append(m)
+    return models_to_try
+
+
+def _gemini_config(temperature: float, system_prompt: str, cached_content: str | None = None):
+    """Generation config; with ``cached_content`` the system instruction comes from the cached handle."""
+    candidate_timeout = deadline.call_timeout()
+    return genai_types.GenerateContentConfig(
+        temperature=temperature,
+        system_instruction=None if cached_content else system_prompt,
+        cached_content=cached_content,
+        # HttpOptions.timeout is in milliseconds.
+        http_options=genai_types.HttpOptions(timeout=int(candidate_timeout * 1000)) if candidate_timeout is not None else None,
+    )
 
-    if model_norm == "google/gemma-4-26b-a4b-it:free" or model_norm.startswith("google/"):
-        if not openrouter_api_key:
-            raise RuntimeError("OPENROUTER_API_KEY not found in environment variables")
-        client = openai.OpenAI(
-            api_key=openrouter_api_key,
-            base_url="https://openrouter.ai/api/v1",
-        )
-        response = client.chat.completions.create(
-            model=model_norm,
-            temperature=temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_plain},
-            ],
-        )
-        if not response.choices or not response.choices[0].message or not response.choices[0].message.content:
-            raise RuntimeError("No content in OpenRouter API response")
-        return response.choices[0].message.content
 
-    if model_norm.startswith("claude-"):
-        if anthropic_sdk is None:
-            raise RuntimeError("anthropic package is not installed")
-        if not anthropic_api_key:
-            raise RuntimeError("ANTHROPIC_API_KEY not found in environment variables")
-        client = anthropic_sdk.Anthropic(api_key=anthropic_api_key)
-        message = client.messages.create(
-            model=model_norm,
-            max_tokens=4096,
-            system=system_prompt,
-            messages=[{"role": "user", "content": _build_anthropic_user_content(user_prompt)}],
-            temperature=temperature,
+def _gemini_text(res, candidate: str, cache_label: str) -> str:
+    _log_gemini_cache_usage(res, model_norm=candidate, label=cache_label)
+    if getattr(res, "text", None):
+        return res.text
+    raise RuntimeError("No text in Google GenAI API response")
+
+
+def _is_gemini_not_found(exc: Exception) -> bool:
+    msg = str(exc)
+    return "NOT_FOUND" in msg or "is not found" in msg or "404" in msg
+
+
+def _gemini_exhausted(model_norm: str, tried_models: list, last_exc) -> RuntimeError:
+    if not tried_models:
+        return RuntimeError(
+            f"Error calling model '{model_norm}' (NOT_FOUND). Every candidate is known to be unavailable: "
+            f"{', '.join(_gemini_candidates(model_norm))} (re-probed after MODEL_REGISTRY_TTL)."
         )
-        _log_anthropic_cache_usage(message, model_norm=model_norm, label=cache_label)
+    return RuntimeError(
+        f"Error calling model '{model_norm}' (NOT_FOUND). Tried: {', '.join(tried_models)}. Last error: {last_exc}"
+    )
+
+
+def _use_responses_api(model_norm: str) -> bool:
+    """True when an o1/o3 call should try the Responses API before chat completions."""
+    if not (model_norm.startswith("o1") or model_norm.startswith("o3")):
+        return False
+    endpoints = model_registry.candidates("openai", model_norm, [f"responses:{model_norm}", f"chat:{model_norm}"])
+    return bool(endpoints) and endpoints[0].startswith("responses:")
+
+
+def _record_openai_endpoint(model_norm: str, endpoint: str) -> None:
+    if model_norm.startswith("o1") or model_norm.startswith("o3"):
+        model_registry.succeeded("openai", model_norm, f"{endpoint}:{model_norm}")
+
+
+def _record_responses_failure(model_norm: str, exc: Exception) -> None:
+    """Mark the Responses API dead for this model when the error says it is not there.
+
+    An SDK without ``client.responses``, a 404, or a 400 that names the model or the
+    endpoint as unsupported will fail the same way on the next call. Any other 400
+    (a prompt the endpoint rejected, a bad parameter value) or a quota or server
+    error is about this call only, and the endpoint is tried again next time.
+    """
+    if isinstance(exc, (AttributeError, openai.NotFoundError)) or (
+        isinstance(exc, openai.BadRequestError) and _is_unsupported_endpoint_error(exc)
+    ):
+        model_registry.failed("openai", f"responses:{model_norm}", exc)
+
+
+def _is_unsupported_endpoint_error(exc: Exception) -> bool:
+    """True for a 400 whose ``param`` is the model or whose ``code`` rejects the model or endpoint."""
+    param = str(getattr(exc, "param", None) or "").lower()
+    code = str(getattr(exc, "code", None) or "").lower()
+    return param == "model" or "model" in code or "endpoint" in code
+
+
+class _ChatRequest:
+    """One chat call, routed to its provider and turned into SDK arguments.
+
+    Shared by the three transports (_dispatch_chat_llm, _adispatch_chat_llm and
+    _astream_dispatch_chat_llm), which only differ in how they send it and read
+    the reply.
+    """
+
+    __slots__ = (
+        "model_norm", "provider", "system_prompt", "user_prompt", "user_prompt_plain",
+        "temperature", "cache_label", "timeout_kwargs", "retry_options",
+    )
+
+    def __init__(self, *, model: str, system_prompt: str, user_prompt: str, temperature: float, cache_label: str):
+        self.model_norm, self.provider = _route_llm_model(model)
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        # Anthropic splits the user prompt on CACHE_BOUNDARY_MARKER to place an explicit
+        # cache breakpoint; every other provider gets the marker stripped (their caching
+        # is automatic/prefix-based, so the sentinel would only pollute the prompt text).
+        self.user_prompt_plain = user_prompt.replace(CACHE_BOUNDARY_MARKER, "")
+        self.temperature = temperature
+        self.cache_label = cache_label
+        self.timeout_kwargs, self.retry_options = _deadline_call_options()
+
+    def client(self, asynchronous: bool = False):
+        """The provider's pooled SDK client (llm_clients.py), with the deadline's retry options."""
+        if self.provider == "openai":
+            factory = llm_clients.async_openai_client if asynchronous else llm_clients.openai_client
+            client = factory(_require_key(api_key, "OPENAI_API_KEY"))
+        elif self.provider == "openrouter":
+            factory = llm_clients.async_openai_client if asynchronous else llm_clients.openai_client
+            client = factory(_require_key(openrouter_api_key, "OPENROUTER_API_KEY"), base_url=OPENROUTER_BASE_URL)
+        elif self.provider == "anthropic":
+            if anthropic_sdk is None:
+                raise RuntimeError("anthropic package is not installed")
+            factory = llm_clients.async_anthropic_client if asynchronous else llm_clients.anthropic_client
+            client = factory(_require_key(anthropic_api_key, "ANTHROPIC_API_KEY"))
+        elif self.provider == "gemini":
+            if genai is None or genai_types is None:
+                raise RuntimeError("google-genai is not installed")
+            factory = llm_clients.async_genai_client if asynchronous else llm_clients.genai_client
+            return factory(_require_key(google_api_key, "GOOGLE_API_KEY"))
+        else:
+            raise RuntimeError(f"Unsupported LLM model: {self.model_norm}")
+        return client.with_options(**self.retry_options) if self.retry_options else client
+
+    def streams(self) -> bool:
+        """False for the models without a streaming path here (OpenAI o1/o3, unknown models)."""
+        if self.provider in {"openai", "openrouter"}:
+            return not (self.model_norm.startswith("o1") or self.model_norm.startswith("o3"))
+        return self.provider in {"anthropic", "gemini"}
+
+    # OpenAI / OpenRouter
+
+    def uses_responses_api(self) -> bool:
+        """o1/o3: the Responses API first, unless the registry knows it is unavailable
+        for this model or remembers that chat completions answered."""
+        return self.provider == "openai" and _use_responses_api(self.model_norm)
+
+    def responses_kwargs(self) -> dict:
+        return {
+            "model": self.model_norm,
+            "input": _openai_messages(self.system_prompt, self.user_prompt_plain),
+            "temperature": self.temperature,
+            **_openai_cache_kwargs(self.cache_label, self.system_prompt, self.user_prompt),
+            **self.timeout_kwargs,
+        }
+
+    def responses_text(self, response) -> str:
+        text = _openai_responses_text(response, self.model_norm, self.cache_label)
+        _record_openai_endpoint(self.model_norm, "responses")
+        return text
+
+    def responses_failed(self, exc: Exception) -> None:
+        """Re-raise a timeout; otherwise note the failure and let the caller fall back to chat completions."""
+        if isinstance(exc, openai.APITimeoutError):
+            raise exc
+        # Fallback to chat.completions for environments where Responses API isn't available
+        _record_responses_failure(self.model_norm, exc)
+
+    def chat_kwargs(self, stream: bool = False) -> dict:
+        kwargs = {
+            "model": self.model_norm,
+            "temperature": self.temperature,
+            "messages": _openai_messages(self.system_prompt, self.user_prompt_plain),
+            **self.timeout_kwargs,
+        }
+        if self.provider == "openai":
+            kwargs.update(_openai_cache_kwargs(self.cache_label, self.system_prompt, self.user_prompt))
+            if stream:
+                # The final chunk then carries the usage block, cached tokens included.
+                kwargs["stream_options"] = {"include_usage": True}
+        if stream:
+            kwargs["stream"] = True
+        return kwargs
+
+    def chat_text(self, response) -> str:
+        if self.provider == "openrouter":
+            return _openai_chat_text(response, self.model_norm, None, "OpenRouter")
+        text = _openai_chat_text(response, self.model_norm, self.cache_label, "OpenAI")
+        _record_openai_endpoint(self.model_norm, "chat")
+        return text
+
+    # Anthropic
+
+    def anthropic_kwargs(self) -> dict:
+        return {
+            "model": self.model_norm,
+            "max_tokens": 4096,
+            "system": self.system_prompt,
+            "messages": [{"role": "user", "content": _build_anthropic_user_content(self.user_prompt)}],
+            "temperature": self.temperature,
+            **self.timeout_kwargs,
+        }
+
+    def anthropic_text(self, message) -> str:
+        _log_anthropic_cache_usage(message, model_norm=self.model_norm, label=self.cache_label)
         return message.content[0].text
 
-    if model_norm.startswith("gemini-") or model_norm.startswith("gemma-4-"):
-        if genai is None:
-            raise RuntimeError("google-genai is not installed")
-        if genai_types is None:
-            raise RuntimeError("google-genai is not installed")
-        if not google_api_key:
-            raise RuntimeError("GOOGLE_API_KEY not found in environment variables")
-
-        client = genai.Client(api_key=google_api_key)
-
-        tried_models = []
-        models_to_try = [model_norm]
-
-        if model_norm.startswith("gemini-"):
-            if not model_norm.endswith("-latest"):
-                models_to_try.append(f"{model_norm}-latest")
-
-            for m in [
-                "gemini-2.5-flash",
-                "gemini-1.5-pro",
-                "gemini-1.5-pro-latest",
-                "gemini-1.5-flash",
-                "gemini-1.5-flash-latest",
-                "gemini-1.5-pro-002",
-                "gemini-1.5-flash-002",
-                "gemini-1.0-pro",
-            ]:
-                if m not in models_to_try:
-                    models_to_try.append(m)
-
-        last_exc = None
-        for candidate in models_to_try:
-            tried_models.append(candidate)
-            try:
-                config = genai_types.GenerateContentConfig(
-                    temperature=temperature,
-                    system_instruction=system_prompt,
-                )
-                res = client.models.generate_content(
-                    model=candidate,
-                    contents=user_prompt_plain,
-                    config=config,
-                )
-                _log_gemini_cache_usage(res, model_norm=candidate, label=cache_label)
-                if getattr(res, "text", None):
-                    return res.text
-                raise RuntimeError("No text in Google GenAI API response")
-            except Exception as e:
-                last_exc = e
-                msg = str(e)
-                # Only fall back on "model not found" errors; otherwise surface immediately.
-                if "NOT_FOUND" in msg or "is not found" in msg or "404" in msg:
-                    continue
-                raise
-
-        raise RuntimeError(
-            f"Error calling model '{model_norm}' (NOT_FOUND). Tried: {', '.join(tried_models)}. Last error: {last_exc}"
-        )
+    # Gemini
 
-    raise RuntimeError(f"Unsupported LLM model: {model_norm}")
+    def gemini_contents(self, client, candidate: str):
+        """``(cached_content, contents)`` for ``candidate`` (blocking; see _gemini_cached_request)."""
+        return _gemini_cached_request(client, candidate, self.system_prompt, self.user_prompt, self.cache_label)
+
+    def gemini_kwargs(self, candidate: str, contents, cached_content: str | None = None) -> dict:
+        return {
+            "model": candidate,
+            "contents": contents,
+            "config": _gemini_config(self.temperature, self.system_prompt, cached_content),
+        }
+
+    def gemini_uncached_kwargs(self, candidate: str, cached_content: str | None, exc: Exception):
+        """Arguments to resend a call whose cached-content handle is gone, or None for any other failure."""
+        if cached_content is None or not context_cache.is_stale_handle_error(exc):
+            return None
+        context_cache.discard(cached_content)
+        return self.gemini_kwargs(candidate, self.user_prompt_plain)
+
+
+class _GeminiWalk:
+    """The Gemini candidates of one call in model-registry order, with its NOT_FOUND bookkeeping."""
+
+    __slots__ = ("model_norm", "tried", "last_exc")
+
+    def __init__(self, model_norm: str):
+        self.model_norm = model_norm
+        self.tried = []
+        self.last_exc = None
+
+    def __iter__(self):
+        for candidate in model_registry.candidates("gemini", self.model_norm, _gemini_candidates(self.model_norm)):
+            self.tried.append(candidate)
+            yield candidate
+
+    def succeeded(self, candidate: str) -> None:
+        model_registry.succeeded("gemini", self.model_norm, candidate)
+
+    def skip(self, candidate: str, exc: Exception, emitted: bool = False) -> bool:
+        """True when the next candidate should be tried.
+
+        Only "model not found" errors fall back (and mark the candidate unavailable);
+        anything else, or a failure after text was already emitted, surfaces.
+        """
+        self.last_exc = exc
+        if emitted or not _is_gemini_not_found(exc):
+            return False
+        model_registry.failed("gemini", candidate, exc)
+        return True
+
+    def exhausted(self) -> RuntimeError:
+        return _gemini_exhausted(self.model_norm, self.tried, self.last_exc)
+
+
+def warm_model_registry(models) -> None:
+    """Probe the routes of ``models`` once, without generating anything (MODEL_REGISTRY_WARMUP).
+
+    Gemini models walk their candidate names with ``models.get`` until one exists.
+    For o1/o3 models, an SDK without the Responses API marks that endpoint dead.
+    Other providers have nothing to probe.
+    """
+    def _probe(model: str):
+        model_norm, provider = _route_llm_model(model)
+        if provider == "gemini" and genai is not None and google_api_key:
+            client = llm_clients.genai_client(google_api_key)
+            walk = _GeminiWalk(model_norm)
+            for candidate in walk:
+                try:
+                    client.models.get(model=candidate)
+                except Exception as e:
+                    if walk.skip(candidate, e):
+                        continue
+                    raise
+                walk.succeeded(candidate)
+                return
+        elif provider == "openai" and (model_norm.startswith("o1") or model_norm.startswith("o3")) and api_key:
+            client = llm_clients.openai_client(api_key)
+            if not hasattr(client, "responses"):
+                model_registry.failed("openai", f"responses:{model_norm}", "the installed openai SDK has no Responses API")
+
+    unique_models = list(dict.fromkeys(str(m).strip() for m in models if m and str(m).strip()))
+    model_registry.warm_up([lambda model=model: _probe(model) for model in unique_models])
 
 
 def _complex_question_temperature(model: str) -> float:
@@ -425,64 +1056,120 @@ def f_text2sql(user_question: str, strtext2sqlmodel: str, ui_language: str = "en
     Returns:
         str: The generated JSON
     """
+    try:
+        sliced = _text2sql_slice(user_question, correction_hint)
+        if sliced is not None:
+            result = _hedged_chat_llm(
+                _text2sql_call(user_question, strtext2sqlmodel, ui_language, correction_hint, sliced["prompt"]),
+                _parse_text2sql_response,
+            )
+            if _accept_sliced_text2sql(result, sliced):
+                return result
+        return _hedged_chat_llm(_text2sql_call(user_question, strtext2sqlmodel, ui_language, correction_hint), _parse_text2sql_response)
+    except Exception as e:
+        print(f"Error in text2sql conversion: {str(e)}")
+        return {"error": f"Error: {str(e)}"}
+
+
+async def af_text2sql(user_question: str, strtext2sqlmodel: str, ui_language: str = "en", correction_hint: str = ""):
+    """Async twin of f_text2sql (same arguments and return contract), on _acall_chat_llm."""
+    try:
+        sliced = _text2sql_slice(user_question, correction_hint)
+        if sliced is not None:
+            result = await _ahedged_chat_llm(
+                _text2sql_call(user_question, strtext2sqlmodel, ui_language, correction_hint, sliced["prompt"]),
+                _parse_text2sql_response,
+            )
+            if _accept_sliced_text2sql(result, sliced):
+                return result
+        return await _ahedged_chat_llm(_text2sql_call(user_question, strtext2sqlmodel, ui_language, correction_hint), _parse_text2sql_response)
+    except Exception as e:
+        print(f"Error in text2sql conversion: {str(e)}")
+        return {"error": f"Error: {str(e)}"}
+
+
+def _text2sql_slice(user_question: str, correction_hint: str):
+    """The schema-sliced prompt for this question (prompt_slicer.py), or None for the full one.
+
+    The answer-entity guard's regeneration (a ``correction_hint``) always gets the full prompt.
+    """
+    sliced = None if correction_hint else prompt_slicer.slice_prompt(text2sql_prompt_template, user_question, CACHE_BOUNDARY_MARKER)
+    if sliced is None:
+        prompt_slicer.record(None, False)
+    return sliced
+
+
+def _accept_sliced_text2sql(result, sliced: dict) -> bool:
+    """Record the sliced prompt's outcome; False when the full prompt must be used instead."""
+    reason = prompt_slicer.fallback_reason(result, sliced)
+    prompt_slicer.record(sliced, reason is not None)
+    message_text = prompt_slicer.describe(sliced, reason)
+    print("[prompt-slice] " + message_text)
+    buffer = _prompt_cache_events.get()
+    if buffer is not None:
+        buffer.append({"text": message_text})
+    return reason is None
+
+
+def _text2sql_call(user_question: str, strtext2sqlmodel: str, ui_language: str, correction_hint: str, prompt_template: str | None = None) -> dict:
+    """Keyword arguments of the text-to-SQL chat call (on the full prompt unless ``prompt_template`` is given)."""
     print("Text to SQL")
     print("User question:", user_question)
     model_to_use = _normalize_llm_model(strtext2sqlmodel, strtext2sqlmodeldefault)
     print("Text2SQL LLM model:", model_to_use)
 
-    try:
-        # Use the text2sql_prompt_template from the data/prompt.txt file
-        #print("Text to SQL prompt template")
-        formatted_prompt = text2sql_prompt_template.replace("{user_question}", user_question)
-        formatted_prompt = formatted_prompt.replace("{ui_language}", ui_language)
-        if correction_hint:
-            formatted_prompt = formatted_prompt + "\n\n" + correction_hint
-
-        json_content = _call_chat_llm(
-            model=model_to_use,
-            system_prompt="You are a MariaDB SQL query generator. Respond only with the JSON content, no explanations.",
-            user_prompt=formatted_prompt,
-            temperature=0,
-            cache_label="text2sql",
-        ).strip()
-        
-        # Check if json_content starts with ```json and remove it
-        if json_content.startswith("```json"):
-            json_content = json_content[7:].strip()
+    # Use the text2sql_prompt_template from the data/prompt.txt file
+    formatted_prompt = (prompt_template or text2sql_prompt_template).replace("{user_question}", user_question)
+    formatted_prompt = formatted_prompt.replace("{ui_language}", ui_language)
+    if correction_hint:
+        formatted_prompt = formatted_prompt + "\n\n" + correction_hint
+    return {
+        "model": model_to_use,
+        "system_prompt": "You are a MariaDB SQL query generator. Respond only with the JSON content, no explanations.",
+        "user_prompt": formatted_prompt,
+        "temperature": 0,
+        "cache_label": "text2sql",
+    }
+
+
+def _parse_text2sql_response(raw_content: str):
+    """Parse and validate the text-to-SQL model output; returns the payload or an error dict."""
+    json_content = raw_content.strip()
+
+    # Check if json_content starts with ```json and remove it
+    if json_content.startswith("```json"):
+        json_content = json_content[7:].strip()
+    
+    # Check if json_content ends with ``` and remove it
+    if json_content.endswith("```"):
+        json_content = json_content[:-3].strip()
+
+    if json_content.endswith(";"):
+        json_content = json_content[:-1].strip()
         
-        # Check if json_content ends with ``` and remove it
-        if json_content.endswith("```"):
-            json_content = json_content[:-3].strip()
-
-        if json_content.endswith(";"):
-            json_content = json_content[:-1].strip()
-            
-        # Replace escaped newlines (\n) with spaces
-        json_content = json_content.replace("\\n", " ")
-            
-        # Strip any remaining whitespace
-        json_content = json_content.strip()
+    # Replace escaped newlines (\n) with spaces
+    json_content = json_content.replace("\\n", " ")
         
-        print(f"Generated JSON: {json_content}")
+    # Strip any remaining whitespace
+    json_content = json_content.strip()
+    
+    print(f"Generated JSON: {json_content}")
 
-        cleaned_content = json_content.strip().strip('\n').strip('\r').strip('\n')
-        if not cleaned_content.startswith('{') or not cleaned_content.endswith('}'):
-            return {"error": "Incomplete JSON response from API", "raw_content": json_content}
+    cleaned_content = json_content.strip().strip('\n').strip('\r').strip('\n')
+    if not cleaned_content.startswith('{') or not cleaned_content.endswith('}'):
+        return {"error": "Incomplete JSON response from API", "raw_content": json_content}
 
-        try:
-            parsed = json.loads(cleaned_content)
-        except json.JSONDecodeError as json_error:
-            print(f"JSON parsing error in text2sql conversion: {str(json_error)}")
-            return {"error": f"JSON parsing failed: {str(json_error)}", "raw_content": json_content}
-        # JSON guardrail (FASTAPI-TEXT2SQL-038): validate the output shape.
-        ok, guard_error = json_guardrails.validate_llm_json(parsed, "text2sql")
-        if not ok:
-            print(f"JSON guardrail failed in text2sql conversion: {guard_error}")
-            return {"error": f"JSON guardrail: {guard_error}", "raw_content": json_content}
-        return parsed
-    except Exception as e:
-        print(f"Error in text2sql conversion: {str(e)}")
-        return {"error": f"Error: {str(e)}"}
+    try:
+        parsed = json.loads(cleaned_content)
+    except json.JSONDecodeError as json_error:
+        print(f"JSON parsing error in text2sql conversion: {str(json_error)}")
+        return {"error": f"JSON parsing failed: {str(json_error)}", "raw_content": json_content}
+    # JSON guardrail (FASTAPI-TEXT2SQL-038): validate the output shape.
+    ok, guard_error = json_guardrails.validate_llm_json(parsed, "text2sql")
+    if not ok:
+        print(f"JSON guardrail failed in text2sql conversion: {guard_error}")
+        return {"error": f"JSON guardrail: {guard_error}", "raw_content": json_content}
+    return parsed
 
 
 def f_classify_result_entity(user_question: str, allowed_entities, strmodel: str = "default") -> str:
@@ -509,9 +1196,35 @@ def f_classify_result_entity(user_question: str, allowed_entities, strmodel: str
         model is uncertain or the answer is multi-entity / unmapped. On "" the caller
         falls back to the LLM's own ``result_entity`` (legacy behavior).
     """
+    allowed, call = _result_entity_call(user_question, allowed_entities, strmodel)
+    if call is None:
+        return ""
+    try:
+        # "unknown" parses to "" and is a valid answer: only quota errors fail over.
+        return _hedged_chat_llm(call, lambda raw: _parse_result_entity(raw, allowed), accept=lambda _: True)
+    except Exception as e:
+        # Classification is best-effort; never let it break a request.
+        print(f"Error in result_entity classification: {str(e)}")
+        return ""
+
+
+async def af_classify_result_entity(user_question: str, allowed_entities, strmodel: str = "default") -> str:
+    """Async twin of f_classify_result_entity (same arguments and return contract)."""
+    allowed, call = _result_entity_call(user_question, allowed_entities, strmodel)
+    if call is None:
+        return ""
+    try:
+        return await _ahedged_chat_llm(call, lambda raw: _parse_result_entity(raw, allowed), accept=lambda _: True)
+    except Exception as e:
+        print(f"Error in result_entity classification: {str(e)}")
+        return ""
+
+
+def _result_entity_call(user_question: str, allowed_entities, strmodel: str):
+    """Return ``(allowed, call kwargs)`` for the classification, with kwargs None when there is nothing to ask."""
     allowed = [str(e).strip().lower() for e in allowed_entities if str(e).strip()]
     if not user_question or not user_question.strip() or not allowed:
-        return ""
+        return allowed, None
     model_to_use = _normalize_llm_model(strmodel, strresultentitymodeldefault)
     system_prompt = (
         "You classify what kind of thing a user wants LISTED in the results of a "
@@ -548,18 +1261,17 @@ def f_classify_result_entity(user_question: str, allowed_entities, strmodel: str
         "unknown (the caller then trusts the SQL-generation step instead).\n"
         "Reply with only the single word: no punctuation, no quotes, no explanation."
     )
-    try:
-        raw = _call_chat_llm(
-            model=model_to_use,
-            system_prompt=system_prompt,
-            user_prompt=user_question,
-            temperature=0,
-            cache_label="result_entity",
-        ).strip().lower()
-    except Exception as e:
-        # Classification is best-effort; never let it break a request.
-        print(f"Error in result_entity classification: {str(e)}")
-        return ""
+    return allowed, {
+        "model": model_to_use,
+        "system_prompt": system_prompt,
+        "user_prompt": user_question,
+        "temperature": 0,
+        "cache_label": "result_entity",
+    }
+
+
+def _parse_result_entity(raw: str, allowed: list) -> str:
+    raw = (raw or "").strip().lower()
     # Defend against stray punctuation / extra words: keep the first [a-z_] token only.
     token = re.split(r"[^a-z_]+", raw, maxsplit=1)[0] if raw else ""
     return token if token in allowed else ""
@@ -582,14 +1294,16 @@ def f_resolve_complex_question(user_question: str, strcomplexquestionmodel: str
             print(f"User question: '{user_question}'")
             return {"error": f"Prompt formatting failed: {str(format_error)}"}
 
+        checked = _CheckedReply(_parse_complex_question_response)
         try:
-            json_content = _call_chat_llm(
+            _call_chat_llm(
                 model=model_to_use,
                 system_prompt="You are a powerful question resolver. Respond only with the JSON content, no explanations.",
                 user_prompt=formatted_prompt,
                 temperature=temperature_to_use,
                 cache_label="complex_question",
-            ).strip()
+                validate=checked,
+            )
         except Exception as api_error:
             msg = str(api_error)
             # If the chosen stronger model isn't available (common with o1/o3 gated access),
@@ -604,13 +1318,14 @@ def f_resolve_complex_question(user_question: str, strcomplexquestionmodel: str
                 )
             ):
                 try:
-                    json_content = _call_chat_llm(
+                    _call_chat_llm(
                         model="gpt-4o",
                         system_prompt="You are a powerful question resolver. Respond only with the JSON content, no explanations.",
                         user_prompt=formatted_prompt,
                         temperature=_complex_question_temperature("gpt-4o"),
                         cache_label="complex_question",
-                    ).strip()
+                        validate=checked,
+                    )
                 except Exception as fallback_error:
                     print(f"LLM API call failed: {str(fallback_error)}")
                     print(f"API error type: {type(fallback_error)}")
@@ -620,32 +1335,38 @@ def f_resolve_complex_question(user_question: str, strcomplexquestionmodel: str
                 print(f"API error type: {type(api_error)}")
                 return {"error": f"LLM API call failed: {str(api_error)}"}
 
-        if json_content.startswith("```json"):
-            json_content = json_content[7:].strip()
-        if json_content.endswith("```"):
-            json_content = json_content[:-3].strip()
-
-        cleaned_content = json_content.strip().strip('\n').strip('\r').strip('\n')
-        if not cleaned_content.startswith('{') or not cleaned_content.endswith('}'):
-            return {"error": "Incomplete JSON response from API", "raw_content": json_content}
-
-        try:
-            parsed = json.loads(cleaned_content)
-        except json.JSONDecodeError as json_error:
-            print(f"JSON parsing error in complex question resolution: {str(json_error)}")
-            return {"error": f"JSON parsing failed: {str(json_error)}", "raw_content": json_content}
-        # JSON guardrail (FASTAPI-TEXT2SQL-038): validate the output shape.
-        ok, guard_error = json_guardrails.validate_llm_json(parsed, "complex_question")
-        if not ok:
-            print(f"JSON guardrail failed in complex question resolution: {guard_error}")
-            return {"error": f"JSON guardrail: {guard_error}", "raw_content": json_content}
-        return parsed
+        return checked.result
 
     except Exception as e:
         print(f"Error in complex question resolution: {str(e)}")
         return {"error": str(e)}
 
 
+def _parse_complex_question_response(raw: str):
+    """Parse and validate one complex-question reply; returns the payload or an error dict."""
+    json_content = raw.strip()
+    if json_content.startswith("```json"):
+        json_content = json_content[7:].strip()
+    if json_content.endswith("```"):
+        json_content = json_content[:-3].strip()
+
+    cleaned_content = json_content.strip().strip('\n').strip('\r').strip('\n')
+    if not cleaned_content.startswith('{') or not cleaned_content.endswith('}'):
+        return {"error": "Incomplete JSON response from API", "raw_content": json_content}
+
+    try:
+        parsed = json.loads(cleaned_content)
+    except json.JSONDecodeError as json_error:
+        print(f"JSON parsing error in complex question resolution: {str(json_error)}")
+        return {"error": f"JSON parsing failed: {str(json_error)}", "raw_content": json_content}
+    # JSON guardrail (FASTAPI-TEXT2SQL-038): validate the output shape.
+    ok, guard_error = json_guardrails.validate_llm_json(parsed, "complex_question")
+    if not ok:
+        print(f"JSON guardrail failed in complex question resolution: {guard_error}")
+        return {"error": f"JSON guardrail: {guard_error}", "raw_content": json_content}
+    return parsed
+
+
 def f_build_retry_question_from_reasoning(resolved: dict) -> str:
     """Convert structured complex-question reasoning output into a retry question string."""
     try: